@@ -0,0 +1,68 @@
+"""
+Benchmark Category.set_label_list recoding.
+
+Recoding is a single lookup-table remap, so the time should grow linearly
+with the number of points and be almost independent of the number of labels.
+
+Usage:
+    python benchmarks/bench_label_list.py [--max-points 10000000] [--max-labels 10000]
+"""
+
+import argparse
+import os
+import time
+
+import numpy
+import pandas
+
+# No frontend is involved, do not require the built JS bundle.
+os.environ.setdefault("ANY_SCATTER3D_DEV", "1")
+
+from scatter3d import Category
+
+
+def make_category(num_points: int, num_labels: int, seed: int = 0) -> Category:
+    rng = numpy.random.default_rng(seed)
+    values = rng.integers(0, num_labels, size=num_points)
+    # make sure every label is present
+    values[:num_labels] = numpy.arange(num_labels)
+    return Category(pandas.Series(values, name="cluster"))
+
+
+def time_set_label_list(category: Category, repeats: int = 3) -> float:
+    labels = category.label_list
+    best = float("inf")
+    for _ in range(repeats):
+        # reverse the label order so that every code changes
+        labels = labels[::-1]
+        start = time.perf_counter()
+        category.set_label_list(labels)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--max-points", type=int, default=10_000_000)
+    parser.add_argument("--max-labels", type=int, default=10_000)
+    args = parser.parse_args()
+
+    num_points_list = [
+        n for n in (10_000, 100_000, 1_000_000, 10_000_000) if n <= args.max_points
+    ]
+    num_labels_list = [k for k in (10, 1_000, 10_000) if k <= args.max_labels]
+
+    print(f"{'N':>12} {'K':>8} {'seconds':>10} {'ns/point':>10}")
+    for num_points in num_points_list:
+        for num_labels in num_labels_list:
+            if num_labels > num_points:
+                continue
+            category = make_category(num_points, num_labels)
+            seconds = time_set_label_list(category)
+            print(
+                f"{num_points:>12} {num_labels:>8} {seconds:>10.4f} {seconds / num_points * 1e9:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""
+Benchmark suite for the Python hot paths of Category and Scatter3dWidget.
+
+Every case is timed (best and median of several runs) and memory profiled
+(peak traced allocation of one extra run, numpy allocations included) at
+several numbers of points (N) and labels (K). Results are written as JSON
+so that runs from different commits can be compared.
+
+Usage:
+    python benchmarks/bench_suite.py --output bench.json
+    python benchmarks/bench_suite.py --sizes 10000 100000 --only lasso
+    python benchmarks/bench_suite.py --output new.json --compare old.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import numpy
+import pandas
+import polars
+
+# No frontend is involved, do not require the built JS bundle.
+os.environ.setdefault("ANY_SCATTER3D_DEV", "1")
+
+import scatter3d
+from scatter3d import Category, Scatter3dWidget
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+DEFAULT_NUM_LABELS = [10, 1_000]
+DEFAULT_REPEAT = 5
+DEFAULT_REGRESSION_THRESHOLD = 1.25
+RESULTS_FORMAT_VERSION = 1
+
+# Lasso selecting roughly a quarter of a cloud of standard normal points
+# seen from the front with an identity view-projection matrix.
+LASSO_POLYGON_NDC = [[-0.5, -0.5], [0.5, -0.5], [0.5, 0.5], [-0.5, 0.5]]
+IDENTITY_VIEW_PROJECTION = numpy.eye(4).ravel().tolist()
+
+
+@dataclass
+class Case:
+    """
+    A benchmark case: setup() builds the state (not timed) that run(state)
+    receives; setup runs again before every timed run.
+    """
+
+    name: str
+    params: dict[str, Any]
+    setup: Callable[[], Any]
+    run: Callable[[Any], Any]
+
+    @property
+    def key(self) -> str:
+        params = ",".join(f"{k}={v}" for k, v in sorted(self.params.items()))
+        return f"{self.name}[{params}]"
+
+
+def _rng(seed: int = 0) -> numpy.random.Generator:
+    return numpy.random.default_rng(seed)
+
+
+def _int_values(num_points: int, num_labels: int) -> numpy.ndarray:
+    values = _rng().integers(0, num_labels, size=num_points)
+    # make sure every label is present
+    values[:num_labels] = numpy.arange(num_labels)
+    return values
+
+
+def _str_values(num_points: int, num_labels: int) -> numpy.ndarray:
+    labels = numpy.array([f"label{i:06d}" for i in range(num_labels)], dtype=object)
+    return labels[_int_values(num_points, num_labels)]
+
+
+def make_values(backend: str, kind: str, num_points: int, num_labels: int):
+    values = (
+        _str_values(num_points, num_labels)
+        if kind == "str"
+        else _int_values(num_points, num_labels)
+    )
+    if backend == "pandas":
+        return pandas.Series(values, name="values")
+    if backend == "pandas_categorical":
+        return pandas.Series(pandas.Categorical(values), name="values")
+    if backend == "polars":
+        return polars.Series("values", values.tolist() if kind == "str" else values)
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def make_widget(num_points: int, num_labels: int) -> Scatter3dWidget:
+    xyz = _rng().standard_normal((num_points, 3)).astype(numpy.float32)
+    category = Category(make_values("pandas", "int", num_points, num_labels))
+    return Scatter3dWidget(xyz=xyz, category=category)
+
+
+def make_mask(num_points: int, fraction: float = 0.25) -> numpy.ndarray:
+    return _rng(1).random(num_points) < fraction
+
+
+def build_cases(sizes: list[int], num_labels_list: list[int]) -> list[Case]:
+    cases = []
+    for num_points in sizes:
+        for num_labels in num_labels_list:
+            if num_labels > num_points:
+                continue
+            params = {"n": num_points, "k": num_labels}
+
+            for backend, kind in [
+                ("pandas", "str"),
+                ("pandas", "int"),
+                ("pandas_categorical", "str"),
+                ("polars", "str"),
+                ("polars", "int"),
+            ]:
+                cases.append(
+                    Case(
+                        name="category_init",
+                        params={**params, "backend": backend, "kind": kind},
+                        setup=lambda b=backend, t=kind, n=num_points, k=num_labels: (
+                            make_values(b, t, n, k)
+                        ),
+                        run=lambda values: Category(values),
+                    )
+                )
+
+            def setup_category(n=num_points, k=num_labels):
+                return Category(make_values("pandas", "int", n, k))
+
+            cases.append(
+                Case(
+                    name="set_label_list",
+                    params=params,
+                    setup=setup_category,
+                    run=lambda cat: cat.set_label_list(cat.label_list[::-1]),
+                )
+            )
+
+            def setup_counted(n=num_points, k=num_labels):
+                cat = Category(make_values("pandas", "int", n, k))
+                # counted once here, the case times the incremental update
+                _ = cat.label_counts
+                return cat, numpy.flatnonzero(make_mask(n, fraction=0.01))
+
+            def edit_and_count(state):
+                cat, indices = state
+                cat.set_coded_values_at(indices, 1)
+                return cat.label_counts
+
+            cases.append(
+                Case(
+                    name="label_counts_after_edit",
+                    params=params,
+                    setup=setup_counted,
+                    run=edit_and_count,
+                )
+            )
+
+            for backend in ("pandas", "polars"):
+
+                def setup_values(b=backend, n=num_points, k=num_labels):
+                    # a new Category, so the decoded values are not cached
+                    return Category(make_values(b, "str", n, k))
+
+                cases.append(
+                    Case(
+                        name="values",
+                        params={**params, "backend": backend},
+                        setup=setup_values,
+                        run=lambda cat: cat.values,
+                    )
+                )
+
+            cases.append(
+                Case(
+                    name="apply_lasso_mask_edit",
+                    params=params,
+                    setup=lambda n=num_points, k=num_labels: (
+                        make_widget(n, k),
+                        make_mask(n),
+                    ),
+                    run=lambda state: state[0]._apply_lasso_mask_edit(
+                        op="add", code=1, mask=state[1]
+                    ),
+                )
+            )
+
+            cases.append(
+                Case(
+                    name="apply_lasso_edit",
+                    params=params,
+                    setup=lambda n=num_points, k=num_labels: (
+                        make_widget(n, k),
+                        numpy.flatnonzero(make_mask(n)),
+                    ),
+                    run=lambda state: state[0]._apply_lasso_edit(
+                        op="add", code=1, indices=state[1]
+                    ),
+                )
+            )
+
+            for selection in ("mask", "polygon"):
+
+                def setup_request(n=num_points, k=num_labels, sel=selection):
+                    widget = make_widget(n, k)
+                    request = {"kind": "lasso_commit", "op": "add", "label": "1"}
+                    if sel == "mask":
+                        packed = numpy.packbits(make_mask(n), bitorder="big")
+                        widget.lasso_mask_bytes_t = packed.tobytes()
+                        request["mask_channel"] = "bytes"
+                    else:
+                        request["polygon_ndc"] = LASSO_POLYGON_NDC
+                        request["view_projection"] = IDENTITY_VIEW_PROJECTION
+                    return widget, request
+
+                def run_request(state):
+                    widget, request = state
+                    widget.lasso_request_t = {
+                        **request,
+                        "request_id": time.perf_counter_ns(),
+                    }
+                    if widget.lasso_result_t.get("status") != "ok":
+                        raise RuntimeError(f"Lasso failed: {widget.lasso_result_t}")
+
+                cases.append(
+                    Case(
+                        name="on_lasso_request",
+                        params={**params, "selection": selection},
+                        setup=setup_request,
+                        run=run_request,
+                    )
+                )
+
+        # cases that do not depend on the number of labels
+        params = {"n": num_points}
+        cases.append(
+            Case(
+                name="pack_xyz_float32_c",
+                params=params,
+                setup=lambda n=num_points: _rng().standard_normal((n, 3)),
+                run=Scatter3dWidget._pack_xyz_float32_c,
+            )
+        )
+
+        def setup_unpack(n=num_points):
+            widget = make_widget(n, 2)
+            packed = numpy.packbits(make_mask(n), bitorder="big").tobytes()
+            return widget, packed
+
+        cases.append(
+            Case(
+                name="unpack_mask",
+                params=params,
+                setup=setup_unpack,
+                run=lambda state: state[0]._unpack_mask_indices(state[1]),
+            )
+        )
+    return cases
+
+
+def measure(case: Case, repeat: int) -> dict[str, Any]:
+    timings = []
+    for _ in range(repeat):
+        state = case.setup()
+        start = time.perf_counter()
+        case.run(state)
+        timings.append(time.perf_counter() - start)
+        del state
+
+    state = case.setup()
+    tracemalloc.start()
+    try:
+        case.run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del state
+
+    return {
+        "seconds_best": min(timings),
+        "seconds_median": statistics.median(timings),
+        "peak_bytes": peak,
+        "repeat": repeat,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def metadata() -> dict[str, Any]:
+    return {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "date": datetime.now(UTC).isoformat(),
+        "git_commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "numpy": numpy.__version__,
+        "pandas": pandas.__version__,
+        "polars": polars.__version__,
+        "scatter3d": getattr(scatter3d, "__version__", None),
+    }
+
+
+def compare(results: dict[str, dict], old_results: dict[str, dict], threshold: float):
+    """Print the time ratios against old results, return the regressed keys."""
+    regressions = []
+    print(f"\n{'case':<70} {'old s':>10} {'new s':>10} {'ratio':>7}")
+    for key, new in results.items():
+        old = old_results.get(key)
+        if old is None:
+            continue
+        ratio = new["seconds_best"] / old["seconds_best"]
+        flag = " !" if ratio > threshold else ""
+        print(
+            f"{key:<70} {old['seconds_best']:>10.4f} {new['seconds_best']:>10.4f} {ratio:>7.2f}{flag}"
+        )
+        if ratio > threshold:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--labels", type=int, nargs="+", default=DEFAULT_NUM_LABELS)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument(
+        "--only", default=None, help="Only run the cases whose name contains this"
+    )
+    parser.add_argument("--output", type=Path, default=None, help="JSON results file")
+    parser.add_argument(
+        "--compare", type=Path, default=None, help="JSON results of a previous run"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_REGRESSION_THRESHOLD,
+        help="Time ratio above which a case is reported as a regression",
+    )
+    args = parser.parse_args()
+
+    cases = build_cases(args.sizes, args.labels)
+    if args.only:
+        cases = [case for case in cases if args.only in case.name]
+
+    results = {}
+    print(f"{'case':<70} {'best s':>10} {'median s':>10} {'peak MB':>9}")
+    for case in cases:
+        res = measure(case, args.repeat)
+        results[case.key] = {"name": case.name, "params": case.params, **res}
+        print(
+            f"{case.key:<70} {res['seconds_best']:>10.4f} {res['seconds_median']:>10.4f} {res['peak_bytes'] / 1e6:>9.1f}"
+        )
+
+    if args.output:
+        args.output.write_text(
+            json.dumps({"metadata": metadata(), "results": results}, indent=2)
+        )
+
+    if args.compare:
+        old_results = json.loads(args.compare.read_text())["results"]
+        regressions = compare(results, old_results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than {args.threshold}x")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark chunked transfers of the xyz buffer against a single message.
+
+For each chunk size, the frontend is simulated by an ack loop: every chunk
+sent is copied into a receive buffer and acknowledged, which lets Python send
+the next ones. With a single message, nothing can be drawn until the whole
+buffer has arrived; with chunks, the first points are drawn after the first
+chunk. The time to first render adds the transfer time of the first message
+at --bandwidth to the Python side time.
+
+Usage:
+    python benchmarks/bench_transfer.py [--max-points 10000000] [--bandwidth 100]
+"""
+
+import argparse
+import os
+import time
+
+import numpy
+
+# No frontend is involved, do not require the built JS bundle.
+os.environ.setdefault("ANY_SCATTER3D_DEV", "1")
+
+from scatter3d.transfer import ChunkedTransfer
+
+
+def make_xyz_bytes(num_points: int, seed: int = 0) -> memoryview:
+    rng = numpy.random.default_rng(seed)
+    xyz = rng.standard_normal((num_points, 3)).astype(numpy.float32)
+    return memoryview(xyz).cast("B")
+
+
+def simulate(data: memoryview, chunk_bytes: int | None) -> dict:
+    received = bytearray(data.nbytes)
+    start = time.perf_counter()
+    if chunk_bytes is None:
+        received[:] = data
+        first = total = time.perf_counter() - start
+        return {
+            "messages": 1,
+            "max_message": data.nbytes,
+            "first": first,
+            "total": total,
+        }
+
+    transfer = ChunkedTransfer(1, "xyz", data, chunk_bytes)
+    first = None
+    messages = 0
+    max_message = 0
+    while not transfer.is_complete:
+        for chunk in transfer.next_chunks():
+            payload = chunk["data"]
+            received[chunk["offset"] : chunk["offset"] + payload.nbytes] = payload
+            messages += 1
+            max_message = max(max_message, payload.nbytes)
+            if first is None:
+                first = time.perf_counter() - start
+        transfer.ack(transfer.num_sent)
+    total = time.perf_counter() - start
+    return {
+        "messages": messages,
+        "max_message": max_message,
+        "first": first,
+        "total": total,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--max-points", type=int, default=10_000_000)
+    parser.add_argument(
+        "--bandwidth", type=float, default=100.0, help="comm bandwidth in MB/s"
+    )
+    args = parser.parse_args()
+
+    num_points_list = [
+        n for n in (100_000, 1_000_000, 10_000_000) if n <= args.max_points
+    ]
+    chunk_sizes = [None, 1 << 20, 4 << 20, 16 << 20]
+    bytes_per_second = args.bandwidth * 1e6
+
+    print(
+        f"{'N':>12} {'chunk MiB':>10} {'messages':>9} {'max MiB':>8}"
+        f" {'first s':>9} {'total s':>9} {'1st render s':>13}"
+    )
+    for num_points in num_points_list:
+        data = make_xyz_bytes(num_points)
+        for chunk_bytes in chunk_sizes:
+            if chunk_bytes is not None and chunk_bytes >= data.nbytes:
+                continue
+            result = simulate(data, chunk_bytes)
+            first_render = result["first"] + result["max_message"] / bytes_per_second
+            label = "whole" if chunk_bytes is None else f"{chunk_bytes / 2**20:g}"
+            print(
+                f"{num_points:>12} {label:>10} {result['messages']:>9}"
+                f" {result['max_message'] / 2**20:>8.1f} {result['first']:>9.4f}"
+                f" {result['total']:>9.4f} {first_render:>13.4f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -48,8 +48,9 @@ function alignedViewOrCopy<T>(
 	const byteOffset = u8.byteOffset;
 	const byteLength = u8.byteLength;
 
+	// empty traitlets (buffers sent in chunks or by octree node)
 	if (byteLength === 0) {
-		throw new Error("Expected non-empty bytes");
+		return makeView(new ArrayBuffer(0), 0, 0);
 	}
 
 	// If aligned, zero-copy view.
@@ -93,6 +94,66 @@ export function bytesToFloat32ArrayLE(x: unknown): Float32Array {
 	);
 }
 
+export type PositionsArray = Float32Array | Uint16Array;
+
+// Bytes per point of the xyz_encoding_t encodings
+export const XYZ_BYTES_PER_POINT: Record<string, number> = {
+	float32: 12,
+	uint16: 6,
+};
+
+// Point coordinates, packed as float32 or as uint16 quantized over
+// xyz_bounds_t (little-endian)
+export function bytesToPositionsLE(x: unknown, encoding: string): PositionsArray {
+	switch (encoding) {
+		case "float32":
+			return bytesToFloat32ArrayLE(x);
+		case "uint16":
+			return bytesToUint16ArrayLE(x);
+		default:
+			throw new Error(`Unsupported xyz encoding: ${encoding}`);
+	}
+}
+
+export type CodesArray = Uint8Array | Uint16Array | Uint32Array;
+
+// Category codes, packed as uint8, uint16 or uint32 (little-endian)
+export function bytesToCodesArrayLE(x: unknown, dtype: string): CodesArray {
+	switch (dtype) {
+		case "uint8":
+			return bytesToUint8Array(x);
+		case "uint16":
+			return bytesToUint16ArrayLE(x);
+		case "uint32":
+			return bytesToUint32ArrayLE(x);
+		default:
+			throw new Error(`Unsupported codes dtype: ${dtype}`);
+	}
+}
+
+// Writes values[i] at element indices[i] of a packed LE codes buffer, in
+// place, so the widget model keeps a single up to date copy.
+export function patchCodesLE(
+	target: unknown,
+	indices: Uint32Array,
+	values: CodesArray,
+): void {
+	if (indices.length !== values.length) {
+		throw new Error(
+			`patch indices (${indices.length}) and values (${values.length}) differ in length`,
+		);
+	}
+	const u8 = bytesToUint8Array(target);
+	const view = new DataView(u8.buffer, u8.byteOffset, u8.byteLength);
+	const width = values.BYTES_PER_ELEMENT;
+	for (let i = 0; i < indices.length; i++) {
+		const offset = indices[i] * width;
+		if (width === 1) view.setUint8(offset, values[i]);
+		else if (width === 2) view.setUint16(offset, values[i], true);
+		else view.setUint32(offset, values[i], true);
+	}
+}
+
 // ------------------------------
 // Packed bitmask helpers (big-endian bits)
 // ------------------------------
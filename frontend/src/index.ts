@@ -1,4 +1,15 @@
-import type { WidgetModel, LassoRequest, LassoResult } from "./model";
+import type {
+	CodedValuesPatch,
+	HistoryRequest,
+	HistoryState,
+	WidgetModel,
+	LassoRequest,
+	LassoResult,
+	LassoSelection,
+	LassoTimings,
+	LodNodeData,
+	LodRequest,
+} from "./model";
 import { TRAITS } from "./model";
 import {
 	createWidgetRoot,
@@ -20,9 +31,26 @@ import {
 } from "./interaction";
 import { createControlBar, renderControlBar, DEFAULT_UI_CONFIG } from "./ui";
 import { createThreeScene } from "./three_scene";
-import { uint8ArrayToBase64 } from "./binary";
+import { type LodNode, readLodNodes } from "./lod";
+import {
+	getTransfer,
+	onTransferChunk,
+	onTransferHeaders,
+	readTransferChunkRange,
+	requestMissedTransfers,
+} from "./transfer";
+import {
+	bytesToUint8Array,
+	bytesToCodesArrayLE,
+	bytesToPositionsLE,
+	bytesToUint32ArrayLE,
+	patchCodesLE,
+	type CodesArray,
+	XYZ_BYTES_PER_POINT,
+} from "./binary";
 
 const RESIZE_THRESHOLD_PX = 2;
+const CODE_BYTES: Record<string, number> = { uint8: 1, uint16: 2, uint32: 4 };
 
 function populateLabelSelect(
 	select: HTMLSelectElement,
@@ -56,6 +84,57 @@ function getLabelsFromModel(model: WidgetModel): string[] {
 	return x.map((v) => String(v));
 }
 
+function readHistoryState(model: WidgetModel): HistoryState {
+	const x = model.get(TRAITS.history) as Partial<HistoryState> | null;
+	return { num_undo: x?.num_undo ?? 0, num_redo: x?.num_redo ?? 0 };
+}
+
+function readCodedValuesPatch(
+	model: WidgetModel,
+): { indices: Uint32Array; codes: CodesArray } | null {
+	const patch = model.get(TRAITS.codedValuesPatch) as CodedValuesPatch | null;
+	if (!patch || typeof patch !== "object" || !("indices" in patch)) return null;
+	if (bytesToUint8Array(patch.indices).byteLength === 0) {
+		return { indices: new Uint32Array(0), codes: new Uint8Array(0) };
+	}
+	return {
+		indices: bytesToUint32ArrayLE(patch.indices),
+		codes: bytesToCodesArrayLE(
+			patch.codes,
+			String(model.get(TRAITS.codedValuesDtype) ?? "uint16"),
+		),
+	};
+}
+
+// Runs once per model, before any view: keeps the model's coded_values_t
+// buffer current when Python sends a patch instead of the full buffer, and
+// receives (and acknowledges) the chunks of large buffers.
+export function initialize({ model }: { model: WidgetModel }) {
+	const onCodedValuesPatch = () => {
+		const patch = readCodedValuesPatch(model);
+		if (!patch || patch.indices.length === 0) return;
+		const codes =
+			getTransfer(model, "codes")?.bytes ?? model.get(TRAITS.codedValues);
+		patchCodesLE(codes, patch.indices, patch.codes);
+	};
+	const onTransfers = () => onTransferHeaders(model);
+	const onChunk = () => onTransferChunk(model);
+
+	model.on(`change:${TRAITS.codedValuesPatch}`, onCodedValuesPatch);
+	model.on(`change:${TRAITS.transfers}`, onTransfers);
+	model.on(`change:${TRAITS.transferChunk}`, onChunk);
+
+	// chunks sent before this model existed are lost: ask for them again
+	requestMissedTransfers(model);
+	onTransferHeaders(model);
+
+	return () => {
+		model.off(`change:${TRAITS.codedValuesPatch}`, onCodedValuesPatch);
+		model.off(`change:${TRAITS.transfers}`, onTransfers);
+		model.off(`change:${TRAITS.transferChunk}`, onChunk);
+	};
+}
+
 export function render({ model, el }: { model: WidgetModel; el: HTMLElement }) {
 	const cleanupPrev = (el as any).__any_scatter3d_cleanup as
 		| undefined
@@ -74,7 +153,8 @@ export function render({ model, el }: { model: WidgetModel; el: HTMLElement }) {
 
 	// Initial data push
 	three.setPointsFromModel();
-	three.setColorsFromModel();
+	three.setCodesFromModel();
+	three.setPaletteFromModel();
 	three.setAxesFromModel();
 
 	// --- 2D overlay canvas (lasso) ---
@@ -102,9 +182,12 @@ export function render({ model, el }: { model: WidgetModel; el: HTMLElement }) {
 	const bar = createControlBar(toolbar, uiCfg);
 
 	function syncUiFromState() {
+		const history = readHistoryState(model);
 		const uiState = {
 			mode: state.mode.kind,
 			operation: state.mode.kind === "lasso" ? state.mode.operation : "add",
+			canUndo: history.num_undo > 0,
+			canRedo: history.num_redo > 0,
 		} as const;
 
 		renderControlBar(bar, uiCfg, uiState);
@@ -163,6 +246,25 @@ export function render({ model, el }: { model: WidgetModel; el: HTMLElement }) {
 		{ signal: abortController.signal },
 	);
 
+	// Python applies the edit, the new codes come back as a patch
+	let historyRequestCounter = 1;
+	function sendHistoryRequest(action: HistoryRequest["action"]) {
+		const req: HistoryRequest = {
+			request_id: historyRequestCounter++,
+			action,
+		};
+		model.set(TRAITS.historyRequest, req);
+		model.save_changes();
+	}
+
+	bar.undoBtn.addEventListener("click", () => sendHistoryRequest("undo"), {
+		signal: abortController.signal,
+	});
+
+	bar.redoBtn.addEventListener("click", () => sendHistoryRequest("redo"), {
+		signal: abortController.signal,
+	});
+
 	function refreshLabelsUI() {
 		const labels = getLabelsFromModel(model);
 		const prev = bar.labelSelect.value;
@@ -176,8 +278,11 @@ export function render({ model, el }: { model: WidgetModel; el: HTMLElement }) {
 	// Lasso commit -> Python
 	// -----------------------
 	let requestCounter = 1;
+	// duration of the last codes or palette upload, reported with the next
+	// lasso request
+	let lastSetColorsMs: number | undefined;
 
-	function sendCommittedLasso(args: {
+	async function sendCommittedLasso(args: {
 		model: WidgetModel;
 		three: ReturnType<typeof createThreeScene>;
 		bar: typeof bar;
@@ -193,16 +298,34 @@ export function render({ model, el }: { model: WidgetModel; el: HTMLElement }) {
 
 		const op = state.mode.operation;
 		const requestId = requestCounter++;
-		const mask = three.selectMaskInLasso(polygonNdc);
-		if (mask.length === 0) return;
-
-		model.set(TRAITS.lassoMask, uint8ArrayToBase64(mask));
 		const req: LassoRequest = {
 			kind: "lasso_commit",
 			op,
 			label,
 			request_id: requestId,
 		};
+
+		const timings: LassoTimings = { set_colors_ms: lastSetColorsMs };
+
+		const selection = model.get(TRAITS.lassoSelection) as LassoSelection;
+		if (selection === "frontend") {
+			// off the UI thread: the view keeps rendering meanwhile
+			const t0 = performance.now();
+			const mask = await three.selectMaskInLasso(polygonNdc);
+			timings.select_mask_ms = performance.now() - t0;
+			if (mask.length === 0) return;
+			// Binary buffer, sent as is (no base64 encoding)
+			model.set(
+				TRAITS.lassoMaskBytes,
+				new DataView(mask.buffer, mask.byteOffset, mask.byteLength),
+			);
+			req.mask_channel = "bytes";
+		} else {
+			// Python projects and hit-tests the points, only send the geometry.
+			req.polygon_ndc = polygonNdc.map((p) => [p.x, p.y]);
+			req.view_projection = three.getViewProjectionMatrix();
+		}
+		if (model.get(TRAITS.collectStats)) req.timings = timings;
 		model.set(TRAITS.lassoRequest, req);
 		model.save_changes();
 	}
@@ -211,27 +334,168 @@ export function render({ model, el }: { model: WidgetModel; el: HTMLElement }) {
 	// Model -> view updates
 	// -----------------------
 
+	// Several traits (labels, codes, colors) usually change in the same
+	// message; upload once, on the next frame. The palette is rebuilt
+	// alone when only labels or colors change, without touching the points.
+	let codesDirty = false;
+	let paletteDirty = false;
+
 	const onXYZChange = () => {
 		three.setPointsFromModel();
-		// points changed implies we should recolor too
-		three.setColorsFromModel();
+		// points changed implies new codes too
+		codesDirty = true;
+	};
+
+	const onCodedValuesPatch = () => {
+		// a full upload is already pending
+		if (codesDirty) return;
+		// the model buffer was already patched in initialize
+		const patch = readCodedValuesPatch(model);
+		if (!patch) return;
+		const t0 = performance.now();
+		three.setCodesForIndicesFromModel(patch.indices);
+		lastSetColorsMs = performance.now() - t0;
+	};
+
+	const onCodedValuesChange = () => {
+		codesDirty = true;
+	};
+
+	const onPaletteChange = () => {
+		// colors_t or missing_color_t changed
+		paletteDirty = true;
+	};
+
+	// a chunked transfer started or was replaced by the xyz_bytes_t or
+	// coded_values_t traitlet, whose change may have been handled before
+	let xyzTransfer = getTransfer(model, "xyz");
+	const onTransfersChange = () => {
+		const transfer = getTransfer(model, "xyz");
+		if (transfer !== xyzTransfer) onXYZChange();
+		else codesDirty = true;
+		xyzTransfer = transfer;
 	};
 
-	const onColorsRelatedChange = () => {
-		// coded_values_t or palette changed
-		three.setColorsFromModel();
+	// the chunk was stored by initialize, which listens first
+	const onTransferChunkChange = () => {
+		const range = readTransferChunkRange(model);
+		if (!range) return;
+		if (range.kind === "xyz") {
+			const bytesPerPoint =
+				XYZ_BYTES_PER_POINT[String(model.get(TRAITS.xyzEncoding) ?? "float32")];
+			three.setPointsRangeFromModel(
+				range.start / bytesPerPoint,
+				range.end / bytesPerPoint,
+			);
+			return;
+		}
+		if (codesDirty) return;
+		const bytesPerCode =
+			CODE_BYTES[String(model.get(TRAITS.codedValuesDtype) ?? "uint16")] ?? 2;
+		three.setCodesForRangeFromModel(
+			range.start / bytesPerCode,
+			range.end / bytesPerCode,
+		);
 	};
 
 	const onLabelsChange = () => {
 		refreshLabelsUI();
-		// labels affect mapping code->color index; recolor defensively
-		three.setColorsFromModel();
+		// colors_t is aligned with labels_t; rebuild the palette defensively
+		paletteDirty = true;
+	};
+
+	// -----------------------
+	// Level of detail
+	// -----------------------
+	let lodNodes: LodNode[] = [];
+	// requested, not received yet
+	const lodInflight = new Set<number>();
+	let lodSeq = 1;
+	// the camera moved or nodes arrived: pick the nodes again on next frame
+	let lodDirty = false;
+
+	function resetLodNodes(rootPushed: boolean) {
+		for (const id of three.lodNodeIds()) three.removeLodNode(id);
+		lodInflight.clear();
+		lodNodes = readLodNodes(model.get(TRAITS.lodNodes));
+		if (lodNodes.length === 0) return;
+		three.frameCameraToBox(lodNodes[0].box);
+		// Python sends the root right after a new octree
+		if (rootPushed) lodInflight.add(0);
+		lodDirty = true;
+	}
+
+	const onLodNodesChange = () => resetLodNodes(true);
+
+	const onLodNodeData = () => {
+		const data = model.get(TRAITS.lodNodeData) as LodNodeData | null;
+		if (!data || typeof data !== "object" || !("node" in data)) return;
+		if (lodNodes.length === 0) return;
+		const codes = bytesToCodesArrayLE(
+			data.codes,
+			String(model.get(TRAITS.codedValuesDtype) ?? "uint16"),
+		);
+		const positions =
+			data.xyz === undefined
+				? null
+				: bytesToPositionsLE(
+						data.xyz,
+						String(model.get(TRAITS.xyzEncoding) ?? "float32"),
+					);
+		const visible =
+			data.visible === undefined ? null : bytesToUint8Array(data.visible);
+		three.setLodNode(data.node, positions, codes, visible);
+		if (positions !== null) {
+			lodInflight.delete(data.node);
+			lodDirty = true;
+		}
 	};
 
+	function updateLodNodes() {
+		const budget = Number(model.get(TRAITS.lodPointBudget) ?? 0);
+		const wanted = three.selectLodNodes(lodNodes, budget);
+		const wantedSet = new Set(wanted);
+
+		const loaded = new Set<number>();
+		for (const id of three.lodNodeIds()) {
+			if (wantedSet.has(id)) {
+				loaded.add(id);
+			} else {
+				three.removeLodNode(id);
+			}
+		}
+
+		const missing = wanted.filter(
+			(id) => !loaded.has(id) && !lodInflight.has(id),
+		);
+		if (missing.length === 0) return;
+		for (const id of missing) lodInflight.add(id);
+		const req: LodRequest = {
+			seq: lodSeq++,
+			nodes: missing,
+			loaded: Array.from(loaded),
+		};
+		model.set(TRAITS.lodRequest, req);
+		model.save_changes();
+	}
+
+	const stopObservingView = three.onViewChange(() => {
+		if (lodNodes.length > 0) lodDirty = true;
+	});
+
+	// lasso requests applied asynchronously and not done yet
+	const pendingLassoRequests = new Set<number | undefined>();
+
 	const onLassoResultChange = () => {
 		const res = model.get(TRAITS.lassoResult) as LassoResult | unknown;
 		if (!res || typeof res !== "object") return;
 		const status = (res as any).status;
+		if (status === "pending") {
+			pendingLassoRequests.add((res as LassoResult).request_id);
+		} else {
+			pendingLassoRequests.delete((res as LassoResult).request_id);
+		}
+		canvasHost.style.cursor = pendingLassoRequests.size > 0 ? "progress" : "";
 		if (status === "error") {
 			// Hard visible signal: console + could add a toast later
 			// Important: don't swallow this silently.
@@ -239,6 +503,10 @@ export function render({ model, el }: { model: WidgetModel; el: HTMLElement }) {
 		}
 	};
 
+	const onVisibleChange = () => {
+		three.setVisibilityFromModel();
+	};
+
 	const onShowAxesChange = () => {
 		three.setAxesFromModel();
 	};
@@ -249,13 +517,23 @@ export function render({ model, el }: { model: WidgetModel; el: HTMLElement }) {
 	};
 
 	model.on(`change:${TRAITS.xyzBytes}`, onXYZChange);
-	model.on(`change:${TRAITS.codedValues}`, onColorsRelatedChange);
-	model.on(`change:${TRAITS.colors}`, onColorsRelatedChange);
+	model.on(`change:${TRAITS.codedValues}`, onCodedValuesChange);
+	model.on(`change:${TRAITS.codedValuesPatch}`, onCodedValuesPatch);
+	model.on(`change:${TRAITS.colors}`, onPaletteChange);
 	model.on(`change:${TRAITS.showAxes}`, onShowAxesChange);
-	model.on(`change:${TRAITS.missingColor}`, onColorsRelatedChange);
+	model.on(`change:${TRAITS.missingColor}`, onPaletteChange);
+	model.on(`change:${TRAITS.visible}`, onVisibleChange);
 	model.on(`change:${TRAITS.labels}`, onLabelsChange);
 	model.on(`change:${TRAITS.lassoResult}`, onLassoResultChange);
+	model.on(`change:${TRAITS.history}`, syncUiFromState);
 	model.on(`change:${TRAITS.axisLabelSize}`, onAxisLabelSizeChange);
+	model.on(`change:${TRAITS.lodNodes}`, onLodNodesChange);
+	model.on(`change:${TRAITS.lodNodeData}`, onLodNodeData);
+	model.on(`change:${TRAITS.transfers}`, onTransfersChange);
+	model.on(`change:${TRAITS.transferChunk}`, onTransferChunkChange);
+
+	// LOD enabled before this view was created
+	resetLodNodes(false);
 
 	// Make root focusable so Enter/Escape works
 	root.tabIndex = 0;
@@ -322,7 +600,7 @@ export function render({ model, el }: { model: WidgetModel; el: HTMLElement }) {
 						bar,
 						state,
 						polygonNdc,
-					});
+					}).catch((err) => console.error("Lasso selection failed:", err));
 				}
 				syncUiFromState();
 				e.preventDefault();
@@ -359,6 +637,20 @@ export function render({ model, el }: { model: WidgetModel; el: HTMLElement }) {
 	// RAF loop: render 3D + overlay
 	let rafId = 0;
 	const frame = () => {
+		if (codesDirty || paletteDirty) {
+			const codes = codesDirty;
+			const palette = paletteDirty;
+			codesDirty = false;
+			paletteDirty = false;
+			const t0 = performance.now();
+			if (codes) three.setCodesFromModel();
+			if (palette) three.setPaletteFromModel();
+			lastSetColorsMs = performance.now() - t0;
+		}
+		if (lodDirty) {
+			lodDirty = false;
+			updateLodNodes();
+		}
 		three.render();
 		drawOverlay(state, ctx);
 		rafId = requestAnimationFrame(frame);
@@ -369,14 +661,22 @@ export function render({ model, el }: { model: WidgetModel; el: HTMLElement }) {
 		abortController.abort();
 
 		model.off(`change:${TRAITS.xyzBytes}`, onXYZChange);
-		model.off(`change:${TRAITS.codedValues}`, onColorsRelatedChange);
-		model.off(`change:${TRAITS.colors}`, onColorsRelatedChange);
-		model.off(`change:${TRAITS.missingColor}`, onColorsRelatedChange);
+		model.off(`change:${TRAITS.codedValues}`, onCodedValuesChange);
+		model.off(`change:${TRAITS.codedValuesPatch}`, onCodedValuesPatch);
+		model.off(`change:${TRAITS.colors}`, onPaletteChange);
+		model.off(`change:${TRAITS.missingColor}`, onPaletteChange);
+		model.off(`change:${TRAITS.visible}`, onVisibleChange);
 		model.off(`change:${TRAITS.labels}`, onLabelsChange);
 		model.off(`change:${TRAITS.lassoResult}`, onLassoResultChange);
+		model.off(`change:${TRAITS.history}`, syncUiFromState);
 		model.off(`change:${TRAITS.showAxes}`, onShowAxesChange);
-		model.on(`change:${TRAITS.axisLabelSize}`, onAxisLabelSizeChange);
+		model.off(`change:${TRAITS.axisLabelSize}`, onAxisLabelSizeChange);
+		model.off(`change:${TRAITS.lodNodes}`, onLodNodesChange);
+		model.off(`change:${TRAITS.lodNodeData}`, onLodNodeData);
+		model.off(`change:${TRAITS.transfers}`, onTransfersChange);
+		model.off(`change:${TRAITS.transferChunk}`, onTransferChunkChange);
 
+		stopObservingView();
 		stopObserving();
 		cancelAnimationFrame(rafId);
 		three.dispose();
@@ -386,4 +686,4 @@ export function render({ model, el }: { model: WidgetModel; el: HTMLElement }) {
 	(el as any).__any_scatter3d_cleanup = cleanup;
 }
 
-export default { render };
+export default { initialize, render };
@@ -0,0 +1,157 @@
+// frontend/src/lasso_select.ts
+// Lasso hit-testing: projects the points to NDC and tests them against the
+// lasso polygon. No DOM nor three.js, so that it runs in the lasso worker
+// and in Node (bench/lasso_select.bench.ts).
+import type { PositionsArray } from "./binary";
+
+export type Point2D = { x: number; y: number };
+
+// The polygon edges bucketed by horizontal band of its bounding box: a point
+// is only tested against the edges spanning its band, a few for a lasso,
+// whatever its number of vertices.
+export type BucketedPolygon = {
+	minX: number;
+	maxX: number;
+	minY: number;
+	maxY: number;
+	// band of y: floor((y - minY) * bandScale)
+	bandScale: number;
+	numBands: number;
+	// edges of band b: bandStart[b] .. bandStart[b + 1] in edges
+	bandStart: Uint32Array;
+	// xi, yi, xj, yj per edge, grouped by band
+	edges: Float64Array;
+};
+
+// One band per edge: a band is then crossed by about one edge per side of
+// the lasso. More bands would only cost memory.
+const MAX_BANDS = 4096;
+
+export function bucketPolygon(
+	poly: readonly Point2D[],
+): BucketedPolygon | null {
+	if (poly.length < 3) return null;
+	let minX = Infinity;
+	let maxX = -Infinity;
+	let minY = Infinity;
+	let maxY = -Infinity;
+	for (const p of poly) {
+		if (p.x < minX) minX = p.x;
+		if (p.x > maxX) maxX = p.x;
+		if (p.y < minY) minY = p.y;
+		if (p.y > maxY) maxY = p.y;
+	}
+	// flat polygon: contains nothing
+	if (!(maxY > minY) || !(maxX > minX)) return null;
+
+	const numBands = Math.min(MAX_BANDS, poly.length);
+	const bandScale = numBands / (maxY - minY);
+	const bandOf = (y: number) =>
+		Math.min(numBands - 1, Math.floor((y - minY) * bandScale));
+
+	// counting pass, then fill: edges stored in band order
+	const bandStart = new Uint32Array(numBands + 1);
+	for (let i = 0, j = poly.length - 1; i < poly.length; j = i++) {
+		const yi = poly[i].y;
+		const yj = poly[j].y;
+		// horizontal edges are never crossed by the ray
+		if (yi === yj) continue;
+		const b1 = bandOf(Math.max(yi, yj));
+		for (let b = bandOf(Math.min(yi, yj)); b <= b1; b++) {
+			bandStart[b + 1]++;
+		}
+	}
+	for (let b = 0; b < numBands; b++) bandStart[b + 1] += bandStart[b];
+
+	const edges = new Float64Array(bandStart[numBands] * 4);
+	const fill = bandStart.slice(0, numBands);
+	for (let i = 0, j = poly.length - 1; i < poly.length; j = i++) {
+		const yi = poly[i].y;
+		const yj = poly[j].y;
+		if (yi === yj) continue;
+		const b1 = bandOf(Math.max(yi, yj));
+		for (let b = bandOf(Math.min(yi, yj)); b <= b1; b++) {
+			const k = fill[b]++ * 4;
+			edges[k] = poly[i].x;
+			edges[k + 1] = yi;
+			edges[k + 2] = poly[j].x;
+			edges[k + 3] = yj;
+		}
+	}
+
+	return { minX, maxX, minY, maxY, bandScale, numBands, bandStart, edges };
+}
+
+// Ray casting against the edges of the band of (x, y), which must be inside
+// the bounding box
+export function pointInBucketedPolygon(
+	polygon: BucketedPolygon,
+	x: number,
+	y: number,
+): boolean {
+	const { edges, bandStart } = polygon;
+	const band = Math.min(
+		polygon.numBands - 1,
+		Math.floor((y - polygon.minY) * polygon.bandScale),
+	);
+	const end = bandStart[band + 1] * 4;
+	let inside = false;
+	for (let k = bandStart[band] * 4; k < end; k += 4) {
+		const xi = edges[k];
+		const yi = edges[k + 1];
+		const xj = edges[k + 2];
+		const yj = edges[k + 3];
+		if (yi > y !== yj > y && x < ((xj - xi) * (y - yi)) / (yj - yi) + xi) {
+			inside = !inside;
+		}
+	}
+	return inside;
+}
+
+// Returns packed bits (bitorder="big") for the positions.length / 3 points:
+// byte = i >> 3, bit = 7 - (i & 7). dataToNdc maps the positions to clip
+// space (column-major); clipped points are never selected, nor the points
+// not in visible (a packed mask like the result) when given, nor the points
+// from count on (not received yet during a chunked transfer).
+export function selectMaskInPolygon(
+	positions: PositionsArray,
+	dataToNdc: ArrayLike<number>,
+	polyNdc: readonly Point2D[],
+	visible: Uint8Array | null = null,
+	count: number = positions.length / 3,
+): Uint8Array {
+	const numPoints = Math.floor(positions.length / 3);
+	const mask = new Uint8Array((numPoints + 7) >> 3);
+	// the points past count are not received yet
+	count = Math.min(count, numPoints);
+	const polygon = bucketPolygon(polyNdc);
+	if (polygon === null) return mask;
+	const { minX, maxX, minY, maxY } = polygon;
+
+	const m = Float64Array.from(dataToNdc);
+
+	for (let i = 0; i < count; i++) {
+		// hidden points are never selected
+		if (visible !== null && !(visible[i >> 3] & (0x80 >> (i & 7)))) {
+			continue;
+		}
+		const px = positions[i * 3];
+		const py = positions[i * 3 + 1];
+		const pz = positions[i * 3 + 2];
+		const invW = 1 / (m[3] * px + m[7] * py + m[11] * pz + m[15]);
+
+		// bounding box first: most points of a view are outside the lasso
+		const x = (m[0] * px + m[4] * py + m[8] * pz + m[12]) * invW;
+		if (!(x >= minX && x <= maxX)) continue;
+		const y = (m[1] * px + m[5] * py + m[9] * pz + m[13]) * invW;
+		if (!(y >= minY && y <= maxY)) continue;
+		// skip clipped points
+		const z = (m[2] * px + m[6] * py + m[10] * pz + m[14]) * invW;
+		if (z < -1 || z > 1) continue;
+
+		if (pointInBucketedPolygon(polygon, x, y)) {
+			mask[i >> 3] |= 0x80 >> (i & 7);
+		}
+	}
+	return mask;
+}
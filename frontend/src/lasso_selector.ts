@@ -0,0 +1,113 @@
+// frontend/src/lasso_selector.ts
+// Runs the lasso hit-testing (lasso_select.ts) in a Web Worker, or on the
+// UI thread where workers cannot be created.
+import type { PositionsArray } from "./binary";
+import { type Point2D, selectMaskInPolygon } from "./lasso_select";
+import type { LassoWorkerRequest, LassoWorkerResponse } from "./lasso_worker";
+// bundled into scatter3d.js: the widget is loaded from a single module, so
+// the worker cannot be a file of its own
+import LassoWorker from "./lasso_worker?worker&inline";
+
+export type LassoSelector = {
+	// Packed mask (bitorder="big") of the visible points inside polyNdc
+	// among the first count ones, see selectMaskInPolygon. positionsVersion
+	// changes whenever the positions, count or visible do: the worker is
+	// then sent a copy of them.
+	select: (
+		positions: PositionsArray,
+		count: number,
+		visible: Uint8Array | null,
+		positionsVersion: number,
+		dataToNdc: ArrayLike<number>,
+		polyNdc: readonly Point2D[],
+	) => Promise<Uint8Array>;
+	dispose: () => void;
+};
+
+type Pending = {
+	resolve: (mask: Uint8Array) => void;
+	reject: (err: Error) => void;
+};
+
+export function createLassoSelector(): LassoSelector {
+	let worker: Worker | null = null;
+	try {
+		worker = new LassoWorker();
+	} catch (err) {
+		// e.g. a Content-Security-Policy without blob: workers
+		console.warn("Lasso worker unavailable, selecting on the UI thread:", err);
+	}
+
+	// requests are answered in order
+	const pending = new Map<number, Pending>();
+	let nextId = 1;
+	// version of the positions the worker has
+	let workerPositionsVersion: number | null = null;
+
+	function send(msg: LassoWorkerRequest, transfer: Transferable[] = []) {
+		worker?.postMessage(msg, transfer);
+	}
+
+	if (worker) {
+		worker.onmessage = (e: MessageEvent<LassoWorkerResponse>) => {
+			const res = e.data;
+			const p = pending.get(res.id);
+			if (!p) return;
+			pending.delete(res.id);
+			if ("error" in res) p.reject(new Error(res.error));
+			else p.resolve(res.mask);
+		};
+		worker.onerror = (e: ErrorEvent) => {
+			// the worker cannot run (e.g. failed to load): go on without it
+			console.warn("Lasso worker failed, selecting on the UI thread:", e);
+			worker?.terminate();
+			worker = null;
+			for (const p of pending.values()) p.reject(new Error(e.message));
+			pending.clear();
+		};
+	}
+
+	function select(
+		positions: PositionsArray,
+		count: number,
+		visible: Uint8Array | null,
+		positionsVersion: number,
+		dataToNdc: ArrayLike<number>,
+		polyNdc: readonly Point2D[],
+	): Promise<Uint8Array> {
+		if (!worker) {
+			return Promise.resolve(
+				selectMaskInPolygon(positions, dataToNdc, polyNdc, visible, count),
+			);
+		}
+		if (positionsVersion !== workerPositionsVersion) {
+			// copies, moved to the worker: the originals stay usable here
+			const copy = positions.slice();
+			const visibleCopy = visible?.slice() ?? null;
+			send(
+				{ kind: "points", positions: copy, count, visible: visibleCopy },
+				visibleCopy ? [copy.buffer, visibleCopy.buffer] : [copy.buffer],
+			);
+			workerPositionsVersion = positionsVersion;
+		}
+		const id = nextId++;
+		send({
+			kind: "select",
+			id,
+			dataToNdc: Array.from(dataToNdc),
+			polygon: polyNdc.map((p) => ({ x: p.x, y: p.y })),
+		});
+		return new Promise((resolve, reject) => {
+			pending.set(id, { resolve, reject });
+		});
+	}
+
+	function dispose() {
+		worker?.terminate();
+		worker = null;
+		// never settled: nothing is left to use the masks
+		pending.clear();
+	}
+
+	return { select, dispose };
+}
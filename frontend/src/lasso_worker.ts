@@ -0,0 +1,53 @@
+// frontend/src/lasso_worker.ts
+// Web Worker running the lasso hit-testing off the UI thread. It keeps its
+// own copy of the positions and visibility mask, sent once per change by
+// lasso_selector.ts.
+import type { PositionsArray } from "./binary";
+import { type Point2D, selectMaskInPolygon } from "./lasso_select";
+
+export type LassoWorkerRequest =
+	| {
+			kind: "points";
+			positions: PositionsArray;
+			// points received so far, the others are not tested
+			count: number;
+			visible: Uint8Array | null;
+	  }
+	| {
+			kind: "select";
+			id: number;
+			dataToNdc: number[];
+			polygon: Point2D[];
+	  };
+
+export type LassoWorkerResponse =
+	| { id: number; mask: Uint8Array }
+	| { id: number; error: string };
+
+let positions: PositionsArray = new Float32Array(0);
+let count = 0;
+let visible: Uint8Array | null = null;
+
+self.onmessage = (e: MessageEvent<LassoWorkerRequest>) => {
+	const msg = e.data;
+	if (msg.kind === "points") {
+		positions = msg.positions;
+		count = msg.count;
+		visible = msg.visible;
+		return;
+	}
+	try {
+		const mask = selectMaskInPolygon(
+			positions,
+			msg.dataToNdc,
+			msg.polygon,
+			visible,
+			count,
+		);
+		const res: LassoWorkerResponse = { id: msg.id, mask };
+		self.postMessage(res, { transfer: [mask.buffer] });
+	} catch (err) {
+		const res: LassoWorkerResponse = { id: msg.id, error: String(err) };
+		self.postMessage(res);
+	}
+};
@@ -0,0 +1,92 @@
+// frontend/src/lod.ts
+import * as THREE from "three";
+import type { LodNodeInfo } from "./model";
+
+// Nodes whose bounding sphere is smaller than this on screen (radius, in
+// CSS pixels) are not refined: their children would add little detail.
+const MIN_REFINE_RADIUS_PX = 100;
+
+export type LodNode = {
+	info: LodNodeInfo;
+	children: number[];
+	// data coordinates
+	box: THREE.Box3;
+	center: THREE.Vector3;
+	radius: number;
+};
+
+export function readLodNodes(x: unknown): LodNode[] {
+	if (!Array.isArray(x)) return [];
+	const nodes: LodNode[] = x.map((info: LodNodeInfo) => {
+		const box = new THREE.Box3(
+			new THREE.Vector3(...info.min),
+			new THREE.Vector3(...info.max),
+		);
+		const center = box.getCenter(new THREE.Vector3());
+		const radius = box.getSize(new THREE.Vector3()).length() / 2;
+		return { info, children: [], box, center, radius };
+	});
+	for (const node of nodes) {
+		const parent = node.info.parent;
+		if (parent !== null) nodes[parent].children.push(node.info.id);
+	}
+	return nodes;
+}
+
+// The nodes to show from this camera. Starting at the root, the node
+// largest on screen is refined first, until the point budget is used or the
+// remaining nodes are small on screen or out of view. A node is only picked
+// after its parent: the points of a node are not repeated in its children.
+export function selectLodNodes(
+	nodes: readonly LodNode[],
+	camera: THREE.PerspectiveCamera,
+	dataToWorld: THREE.Matrix4,
+	dataToClip: THREE.Matrix4,
+	viewportHeightPx: number,
+	pointBudget: number,
+): number[] {
+	if (nodes.length === 0) return [];
+
+	const frustum = new THREE.Frustum().setFromProjectionMatrix(dataToClip);
+	// radius (world units) at distance 1 -> pixels
+	const pxPerUnit =
+		viewportHeightPx / 2 / Math.tan((camera.fov * Math.PI) / 360);
+	const worldCenter = new THREE.Vector3();
+
+	function screenRadiusPx(node: LodNode): number {
+		worldCenter.copy(node.center).applyMatrix4(dataToWorld);
+		const dist = worldCenter.distanceTo(camera.position);
+		if (dist <= node.radius) return Infinity;
+		return (node.radius / dist) * pxPerUnit;
+	}
+
+	const selected: number[] = [];
+	let budget = pointBudget;
+	const candidates: { id: number; size: number }[] = [
+		{ id: 0, size: Infinity },
+	];
+
+	while (candidates.length > 0) {
+		let best = 0;
+		for (let k = 1; k < candidates.length; k++) {
+			if (candidates[k].size > candidates[best].size) best = k;
+		}
+		const { id, size } = candidates[best];
+		candidates.splice(best, 1);
+
+		const node = nodes[id];
+		// the root is always shown, even if it does not fit the budget
+		if (id !== 0) {
+			if (size < MIN_REFINE_RADIUS_PX) continue;
+			if (node.info.count > budget) continue;
+			if (!frustum.intersectsBox(node.box)) continue;
+		}
+		selected.push(id);
+		budget -= node.info.count;
+
+		for (const childId of node.children) {
+			candidates.push({ id: childId, size: screenRadiusPx(nodes[childId]) });
+		}
+	}
+	return selected;
+}
@@ -8,13 +8,30 @@ export type WidgetModel = {
 
 export const TRAITS = {
 	xyzBytes: "xyz_bytes_t",
+	xyzEncoding: "xyz_encoding_t",
+	xyzBounds: "xyz_bounds_t",
 	codedValues: "coded_values_t",
+	codedValuesPatch: "coded_values_patch_t",
+	codedValuesDtype: "coded_values_dtype_t",
 	labels: "labels_t",
 	colors: "colors_t",
 	missingColor: "missing_color_t",
+	visible: "visible_t",
+	lassoSelection: "lasso_selection_t",
 	lassoRequest: "lasso_request_t",
+	lassoMaskBytes: "lasso_mask_bytes_t",
 	lassoMask: "lasso_mask_t",
 	lassoResult: "lasso_result_t",
+	historyRequest: "history_request_t",
+	history: "history_t",
+	collectStats: "collect_stats_t",
+	lodNodes: "lod_nodes_t",
+	lodPointBudget: "lod_point_budget_t",
+	lodRequest: "lod_request_t",
+	lodNodeData: "lod_node_data_t",
+	transfers: "transfer_t",
+	transferChunk: "transfer_chunk_t",
+	transferAck: "transfer_ack_t",
 	showAxes: "show_axes_t",
 	pointsSize: "points_size_t",
 	axisLabelSize: "axis_label_size_t",
@@ -26,19 +43,120 @@ export type RGB = [number, number, number];
 
 export type LassoOp = "add" | "remove";
 
+// Sparse update of coded_values_t: codes[i] goes to point indices[i]
+export type CodedValuesPatch = {
+	seq: number;
+	indices: unknown; // packed uint32 LE
+	codes: unknown; // packed LE, width given by coded_values_dtype_t
+};
+
+export type CodesDtype = "uint8" | "uint16" | "uint32";
+
+// Where lasso hit-testing happens (see Scatter3dWidget.lasso_selection_t)
+export type LassoSelection = "python" | "frontend";
+
 export type LassoRequest = {
 	kind: "lasso_commit";
 	op: LassoOp;
 	label?: string;
 	request_id?: number;
+	// Only for "python" selection: lasso vertices in NDC and the matrix
+	// projecting the xyz_bytes_t coordinates to clip space (camera
+	// view-projection times the points' model matrix, Matrix4.elements,
+	// column-major).
+	polygon_ndc?: [number, number][];
+	view_projection?: number[];
+	// "bytes": the mask was sent in lasso_mask_bytes_t; if absent Python
+	// falls back to the base64 lasso_mask_t.
+	mask_channel?: "bytes";
+	// Only when collect_stats_t: frontend timings in ms
+	timings?: LassoTimings;
+};
+
+// Level of detail octree node (see Scatter3dWidget.enable_lod), bounds in
+// data coordinates
+export type LodNodeInfo = {
+	id: number;
+	parent: number | null;
+	level: number;
+	min: [number, number, number];
+	max: [number, number, number];
+	count: number;
+};
+
+export type LodRequest = {
+	seq: number;
+	// nodes to send
+	nodes: number[];
+	// nodes already shown, Python keeps their codes current
+	loaded: number[];
+};
+
+export type LodNodeData = {
+	seq: number;
+	node: number;
+	xyz?: unknown; // packed LE (M, 3) in xyz_encoding_t, absent for a codes-only update
+	codes: unknown; // packed LE, width given by coded_values_dtype_t
+	visible?: unknown; // packed mask (bitorder "big") of the points shown, absent for all
+};
+
+// Buffers sent in chunks when large (see Scatter3dWidget.transfer_t):
+// "xyz" stands for xyz_bytes_t, "codes" for coded_values_t
+export type TransferKind = "xyz" | "codes";
+
+export type TransferHeader = {
+	transfer: number;
+	kind: TransferKind;
+	total_bytes: number;
+	chunk_bytes: number;
+	num_chunks: number;
+};
+
+export type TransferChunk = {
+	transfer: number;
+	kind: TransferKind;
+	seq: number;
+	offset: number; // in bytes
+	data: unknown;
+};
+
+export type TransferAck =
+	| { transfer: number; kind: TransferKind; received: number }
+	| { kind: TransferKind; restart: true };
+
+// Undo or redo the last edit (see Scatter3dWidget.undo)
+export type HistoryRequest = {
+	request_id: number;
+	action: "undo" | "redo";
+};
+
+// Number of edits that can be undone and redone
+export type HistoryState = {
+	num_undo: number;
+	num_redo: number;
+};
+
+export type LassoTimings = {
+	// hit-testing of this lasso ("frontend" selection only)
+	select_mask_ms?: number;
+	// last recolor done, full or patch, before this request
+	set_colors_ms?: number;
 };
 
 export type LassoResult =
+	| {
+			// received, applied later (Scatter3dWidget.lasso_async)
+			request_id?: number;
+			status: "pending";
+	  }
 	| {
 			request_id?: number;
 			status: "ok";
 			num_selected?: number;
 			num_changed?: number;
+			// labels of the selected points before the edit
+			selected_label_counts?: Record<string, number>;
+			selected_unassigned?: number;
 	  }
 	| {
 			request_id?: number;
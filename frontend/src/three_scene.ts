@@ -3,23 +3,64 @@ import * as THREE from "three";
 import { OrbitControls } from "three/examples/jsm/controls/OrbitControls.js";
 import type { WidgetModel, RGB } from "./model";
 import { TRAITS } from "./model";
+import { type LodNode, selectLodNodes } from "./lod";
+import { getTransfer, type Transfer } from "./transfer";
 import {
-	bytesToFloat32ArrayLE,
-	bytesToUint16ArrayLE,
-	createPackedMaskBig,
-	setPackedMaskBitBig,
+	bytesToPositionsLE,
+	bytesToCodesArrayLE,
+	bytesToUint8Array,
+	packedMaskLength,
+	type CodesArray,
+	type PositionsArray,
+	XYZ_BYTES_PER_POINT,
 } from "./binary";
+import { createLassoSelector } from "./lasso_selector";
 
 export type ThreeScene = {
 	domElement: HTMLCanvasElement;
 	setSize: (cssW: number, cssH: number, dpr: number) => void;
 
 	setPointsFromModel: () => void;
-	setColorsFromModel: () => void;
-
-	// Returns packed bits (bitorder="big") for N points:
-	// byte = i >> 3, bit = 7 - (i & 7)
-	selectMaskInLasso: (polyNdc: { x: number; y: number }[]) => Uint8Array;
+	// points [start, end) of a chunked xyz transfer arrived
+	setPointsRangeFromModel: (start: number, end: number) => void;
+	// Points are colored on the GPU: their codes are a vertex attribute,
+	// looked up in a palette texture built from colors_t and missing_color_t.
+	setCodesFromModel: () => void;
+	// upload only the codes of the given points (after a coded_values_t patch)
+	setCodesForIndicesFromModel: (indices: Uint32Array) => void;
+	// upload the codes of points [start, end) (chunked transfer)
+	setCodesForRangeFromModel: (start: number, end: number) => void;
+	// rewrite the palette only: O(number of labels), whatever the points
+	setPaletteFromModel: () => void;
+	// hide the points not in visible_t, nor selected by the lasso
+	setVisibilityFromModel: () => void;
+
+	// Resolves to packed bits (bitorder="big") for N points:
+	// byte = i >> 3, bit = 7 - (i & 7). Hit-tested in a Web Worker.
+	selectMaskInLasso: (
+		polyNdc: { x: number; y: number }[],
+	) => Promise<Uint8Array>;
+
+	// projectionMatrix * matrixWorldInverse * DATA_TO_WORLD, column-major
+	// (Matrix4.elements): projects the xyz_bytes_t coordinates to clip space
+	getViewProjectionMatrix: () => number[];
+
+	// Level of detail: the octree nodes shown, each its own points object.
+	// positions null only replaces the codes (and visibility) of a shown
+	// node; visible null shows all its points.
+	setLodNode: (
+		id: number,
+		positions: PositionsArray | null,
+		codes: CodesArray,
+		visible: Uint8Array | null,
+	) => void;
+	removeLodNode: (id: number) => void;
+	lodNodeIds: () => number[];
+	// nodes to show from the current camera, see selectLodNodes
+	selectLodNodes: (nodes: readonly LodNode[], pointBudget: number) => number[];
+	frameCameraToBox: (box: THREE.Box3) => void;
+	// called when the camera moves
+	onViewChange: (cb: () => void) => () => void;
 
 	setAxesFromModel: () => void;
 	rebuildAxisLabels: () => void;
@@ -30,35 +71,82 @@ export type ThreeScene = {
 
 type Point2D = { x: number; y: number };
 
+// xyz_bytes_t holds the user (x, y, z); user z is shown "up" (three.js Y),
+// so the points object maps (x, y, z) -> (x, z, y).
+const DATA_TO_WORLD = new THREE.Matrix4().set(
+	1, 0, 0, 0,
+	0, 0, 1, 0,
+	0, 1, 0, 0,
+	0, 0, 0, 1,
+);
+
 const BLACK = "#000";
 const X_AXIS_COLOR = BLACK;
 const Y_AXIS_COLOR = BLACK;
 const Z_AXIS_COLOR = BLACK;
 
-function positionsFromXYZBytes(xyzBytes: unknown): Float32Array {
-	const f32 = bytesToFloat32ArrayLE(xyzBytes);
-	if (f32.length % 3 !== 0) {
-		throw new Error(`xyz_bytes_t length ${f32.length} not divisible by 3`);
-	}
-	return f32;
+function xyzEncoding(model: WidgetModel): string {
+	return String(model.get(TRAITS.xyzEncoding) ?? "float32");
 }
 
-function pointInPolygon(p: Point2D, poly: readonly Point2D[]): boolean {
-	// Ray casting algorithm
-	let inside = false;
-	for (let i = 0, j = poly.length - 1; i < poly.length; j = i++) {
-		const xi = poly[i].x;
-		const yi = poly[i].y;
-		const xj = poly[j].x;
-		const yj = poly[j].y;
+export function positionsFromXYZBytes(
+	xyzBytes: unknown,
+	encoding: string,
+): PositionsArray {
+	const arr = bytesToPositionsLE(xyzBytes, encoding);
+	if (arr.length % 3 !== 0) {
+		throw new Error(`xyz_bytes_t length ${arr.length} not divisible by 3`);
+	}
+	return arr;
+}
 
-		const intersect =
-			yi > p.y !== yj > p.y &&
-			p.x < ((xj - xi) * (p.y - yi)) / (yj - yi + 0.0) + xi;
+// Maps the position attribute to data coordinates. uint16 positions are
+// given to the shader as is (0..65535, not normalized), so dequantizing is
+// part of the model matrix and done on the GPU.
+function localToDataFromModel(model: WidgetModel, target: THREE.Matrix4) {
+	target.identity();
+	if (xyzEncoding(model) !== "uint16") return target;
+	const bounds = model.get(TRAITS.xyzBounds);
+	if (!Array.isArray(bounds) || bounds.length !== 2) {
+		throw new Error("xyz_bounds_t must be [[x, y, z], [x, y, z]] with uint16 xyz");
+	}
+	const lo = new THREE.Vector3(...(bounds[0] as [number, number, number]));
+	const hi = new THREE.Vector3(...(bounds[1] as [number, number, number]));
+	const scale = hi.sub(lo).divideScalar(65535);
+	return target.makeScale(scale.x, scale.y, scale.z).setPosition(lo);
+}
 
-		if (intersect) inside = !inside;
+// Typed views over the buffer of a chunked transfer, made once so that the
+// position attribute can use the transfer buffer itself.
+const transferViews = new WeakMap<Transfer, PositionsArray>();
+
+// The positions, and the number of points received so far
+function pointsFromModel(model: WidgetModel): {
+	positions: PositionsArray;
+	count: number;
+} {
+	const encoding = xyzEncoding(model);
+	const transfer = getTransfer(model, "xyz");
+	if (!transfer) {
+		const positions = positionsFromXYZBytes(model.get(TRAITS.xyzBytes), encoding);
+		return { positions, count: positions.length / 3 };
+	}
+	let positions = transferViews.get(transfer);
+	if (!positions) {
+		positions = positionsFromXYZBytes(transfer.bytes, encoding);
+		transferViews.set(transfer, positions);
 	}
-	return inside;
+	const bytesPerPoint = XYZ_BYTES_PER_POINT[encoding];
+	return { positions, count: Math.floor(transfer.receivedBytes / bytesPerPoint) };
+}
+
+// Codes not received yet (chunked transfer) are 0, shown as missing
+function codesFromModel(model: WidgetModel): CodesArray {
+	const transfer = getTransfer(model, "codes");
+	return bytesToCodesArrayLE(
+		transfer ? transfer.bytes : model.get(TRAITS.codedValues),
+		String(model.get(TRAITS.codedValuesDtype) ?? "uint16"),
+	);
 }
 
 function readRGBList(x: unknown, name: string): RGB[] {
@@ -95,6 +183,112 @@ function readRGB(x: unknown, name: string): RGB {
 	return [r, g, b];
 }
 
+// Palette texels per row, more rows are used past it
+const PALETTE_TEXTURE_WIDTH = 1024;
+
+function createPaletteTexture(size: number): THREE.DataTexture {
+	const width = Math.min(Math.max(size, 1), PALETTE_TEXTURE_WIDTH);
+	const height = Math.max(1, Math.ceil(size / width));
+	// float RGBA: colors_t is used as given; nearest filtering, no mipmaps
+	return new THREE.DataTexture(
+		new Float32Array(width * height * 4),
+		width,
+		height,
+		THREE.RGBAFormat,
+		THREE.FloatType,
+	);
+}
+
+// Codes are given to the shader as unsigned integers (1, 2 or 4 bytes per
+// point, the coded_values_t buffer itself), not converted to floats.
+function codesAttribute(codes: CodesArray): THREE.BufferAttribute {
+	const attr = new THREE.BufferAttribute(codes, 1);
+	attr.gpuType = THREE.IntType;
+	return attr;
+}
+
+// True if a and b view the same memory, so that uploading a sends b
+function sameCodes(a: THREE.TypedArray, b: CodesArray): boolean {
+	return (
+		a.constructor === b.constructor &&
+		a.buffer === b.buffer &&
+		a.byteOffset === b.byteOffset &&
+		a.length === b.length
+	);
+}
+
+// 1 for the points hidden by a packed visibility mask (bitorder "big")
+function hiddenAttribute(
+	visible: Uint8Array,
+	count: number,
+): THREE.BufferAttribute {
+	const hidden = new Uint8Array(count);
+	for (let i = 0; i < count; i++) {
+		hidden[i] = (visible[i >> 3] >> (7 - (i & 7))) & 1 ? 0 : 1;
+	}
+	return new THREE.BufferAttribute(hidden, 1);
+}
+
+// Colors the points of mat by looking their code up in paletteMap: texel 0
+// is missing_color_t, texel i the color of code i (colors_t[i - 1]). Codes
+// past paletteSize (node codes sent before the labels_t update) are shown
+// as missing.
+// Points whose "hidden" attribute is 1 are moved out of the clip volume.
+// Geometries without it read the default attribute value, 0: all shown.
+function customizePointsShader(
+	mat: THREE.PointsMaterial,
+	uniforms: {
+		paletteMap: { value: THREE.DataTexture };
+		paletteSize: { value: number };
+	},
+) {
+	mat.onBeforeCompile = (shader) => {
+		shader.uniforms.paletteMap = uniforms.paletteMap;
+		shader.uniforms.paletteSize = uniforms.paletteSize;
+		shader.vertexShader = shader.vertexShader
+			.replace(
+				"#include <common>",
+				`#include <common>
+attribute uint code;
+attribute float hidden;
+uniform sampler2D paletteMap;
+uniform int paletteSize;
+varying vec3 vPaletteColor;`,
+			)
+			.replace(
+				"#include <color_vertex>",
+				`#include <color_vertex>
+int paletteIndex = code < uint(paletteSize) ? int(code) : 0;
+int paletteWidth = textureSize(paletteMap, 0).x;
+vPaletteColor = texelFetch(
+	paletteMap,
+	ivec2(paletteIndex % paletteWidth, paletteIndex / paletteWidth),
+	0
+).rgb;`,
+			)
+			.replace(
+				"#include <fog_vertex>",
+				`#include <fog_vertex>
+if (hidden > 0.5) {
+	gl_PointSize = 0.0;
+	gl_Position = vec4(2.0, 2.0, 2.0, 1.0);
+}`,
+			);
+		shader.fragmentShader = shader.fragmentShader
+			.replace(
+				"#include <common>",
+				`#include <common>
+varying vec3 vPaletteColor;`,
+			)
+			.replace(
+				"#include <color_fragment>",
+				`#include <color_fragment>
+diffuseColor.rgb *= vPaletteColor;`,
+			);
+	};
+	mat.customProgramCacheKey = () => "scatter3d-points";
+}
+
 export function createThreeScene(
 	canvasHost: HTMLElement,
 	model: WidgetModel,
@@ -121,24 +315,43 @@ export function createThreeScene(
 	// --- points geometry ---
 	const geom = new THREE.BufferGeometry();
 
-	const initialPos = positionsFromXYZBytes(model.get(TRAITS.xyzBytes));
-	let positionAttr = new THREE.BufferAttribute(initialPos, 3);
+	const initialPoints = pointsFromModel(model);
+	let positionAttr = new THREE.BufferAttribute(initialPoints.positions, 3);
+	// packed mask of the points shown, null when all are
+	let visibleMask: Uint8Array | null = null;
+	// bumped whenever the positions or visibleMask change, see
+	// selectMaskInLasso
+	let positionsVersion = 0;
 	geom.setAttribute("position", positionAttr);
+	geom.setDrawRange(0, initialPoints.count);
 
 	let nPoints = positionAttr.count;
-	let colorArray = new Float32Array(nPoints * 3);
-	let colorAttr = new THREE.BufferAttribute(colorArray, 3);
-	geom.setAttribute("color", colorAttr);
+	// all missing until setCodesFromModel
+	let codeAttr = codesAttribute(new Uint8Array(nPoints));
+	geom.setAttribute("code", codeAttr);
+
+	// position attribute -> data coordinates, see localToDataFromModel
+	const localToData = localToDataFromModel(model, new THREE.Matrix4());
 
 	function frameCameraToGeometry() {
 		const bs = geom.boundingSphere;
-		if (!bs || !Number.isFinite(bs.radius) || bs.radius <= 0) return;
+		if (bs) frameCameraToSphere(bs.clone().applyMatrix4(localToData));
+	}
+
+	function frameCameraToBox(box: THREE.Box3) {
+		frameCameraToSphere(box.getBoundingSphere(new THREE.Sphere()));
+	}
+
+	function frameCameraToSphere(bs: THREE.Sphere) {
+		if (!Number.isFinite(bs.radius) || bs.radius <= 0) return;
 
 		const fovRad = (camera.fov * Math.PI) / 180;
 		const dist = bs.radius / Math.sin(fovRad / 2);
 
-		controls.target.copy(bs.center);
-		camera.position.copy(bs.center).add(new THREE.Vector3(0, 0, dist));
+		// the bounding sphere is in data coordinates
+		const center = bs.center.clone().applyMatrix4(DATA_TO_WORLD);
+		controls.target.copy(center);
+		camera.position.copy(center).add(new THREE.Vector3(0, 0, dist));
 		camera.near = Math.max(0.01, dist / 1000);
 		camera.far = dist * 10;
 		camera.updateProjectionMatrix();
@@ -154,12 +367,35 @@ export function createThreeScene(
 	const mat = new THREE.PointsMaterial({
 		size: initialPointSize,
 		sizeAttenuation: true,
-		vertexColors: true,
 	});
+	// shared with the LOD nodes, see setPaletteFromModel
+	const paletteUniforms = {
+		paletteMap: { value: createPaletteTexture(1) },
+		paletteSize: { value: 1 },
+	};
+	customizePointsShader(mat, paletteUniforms);
 
 	const pointsObj = new THREE.Points(geom, mat);
+	pointsObj.matrixAutoUpdate = false;
+	pointsObj.matrix.multiplyMatrices(DATA_TO_WORLD, localToData);
+	// matrixWorld is only recomputed when flagged if matrixAutoUpdate is off
+	pointsObj.matrixWorldNeedsUpdate = true;
 	scene.add(pointsObj);
 
+	function setLocalToDataFromModel() {
+		localToDataFromModel(model, localToData);
+		pointsObj.matrix.multiplyMatrices(DATA_TO_WORLD, localToData);
+		pointsObj.matrixWorldNeedsUpdate = true;
+	}
+
+	// level of detail nodes, in data coordinates like pointsObj
+	const lodGroup = new THREE.Group();
+	lodGroup.matrixAutoUpdate = false;
+	lodGroup.matrix.copy(DATA_TO_WORLD);
+	lodGroup.matrixWorldNeedsUpdate = true;
+	scene.add(lodGroup);
+	const lodNodes = new Map<number, THREE.Points>();
+
 	const axesGroup = new THREE.Group();
 	scene.add(axesGroup);
 
@@ -181,11 +417,19 @@ export function createThreeScene(
 	const zAxis = makeAxisLine(Z_AXIS_COLOR);
 	axesGroup.add(xAxis, yAxis, zAxis);
 
-	function computeMaxXYZ(posArr: Float32Array): { max: number } {
-		let max = -Infinity;
-
+	function computeMaxXYZ(posArr: PositionsArray): { max: number } {
+		// per axis maximum of the attribute values, in data coordinates
+		const axisMax = [-Infinity, -Infinity, -Infinity];
 		for (let i = 0; i < posArr.length; i++) {
 			const v = posArr[i];
+			if (v > axisMax[i % 3]) axisMax[i % 3] = v;
+		}
+		const e = localToData.elements;
+		let max = -Infinity;
+		for (let a = 0; a < 3; a++) {
+			if (axisMax[a] === -Infinity) continue;
+			// localToData is a per axis scale and a translation
+			const v = axisMax[a] * e[a * 5] + e[12 + a];
 			if (v > max) max = v;
 		}
 
@@ -224,7 +468,7 @@ export function createThreeScene(
 		if (!show) return;
 
 		const pos = geom.getAttribute("position") as THREE.BufferAttribute;
-		const arr = pos.array as Float32Array;
+		const arr = pos.array as PositionsArray;
 		const { max } = computeMaxXYZ(arr);
 
 		// from origin to maxima on each axis
@@ -307,71 +551,173 @@ export function createThreeScene(
 	axesGroup.add(xLabel, yLabel, zLabel);
 
 	function setPointsFromModel() {
-		const arr = positionsFromXYZBytes(model.get(TRAITS.xyzBytes));
-
-		if (positionAttr.array.length !== arr.length) {
-			// size changed: recreate attribute
+		const { positions: arr, count } = pointsFromModel(model);
+		positionsVersion++;
+		setLocalToDataFromModel();
+		geom.setDrawRange(0, count);
+		if (positionAttr.array === arr) {
+			// the buffer of a chunked transfer, filled in place
+			positionAttr.needsUpdate = true;
+		} else if (
+			positionAttr.array.length !== arr.length ||
+			positionAttr.array.constructor !== arr.constructor ||
+			getTransfer(model, "xyz")
+		) {
+			// size or encoding changed or new chunked transfer: recreate
+			// attribute
 			positionAttr = new THREE.BufferAttribute(arr, 3);
 			geom.setAttribute("position", positionAttr);
 
-			// recreate color buffer too
+			// recreate codes too, shown as missing until setCodesFromModel
 			nPoints = positionAttr.count;
-			colorArray = new Float32Array(nPoints * 3);
-			colorAttr = new THREE.BufferAttribute(colorArray, 3);
-			geom.setAttribute("color", colorAttr);
+			codeAttr = codesAttribute(new Uint8Array(nPoints));
+			geom.setAttribute("code", codeAttr);
 		} else {
-			(positionAttr.array as Float32Array).set(arr);
+			(positionAttr.array as PositionsArray).set(arr);
 			positionAttr.needsUpdate = true;
 		}
 
+		// the mask of these points may have arrived first
+		setVisibilityFromModel();
+
+		if (count === 0) return; // framed when the first chunk arrives
 		geom.computeBoundingSphere();
 		frameCameraToGeometry();
 		setAxesFromModel();
 	}
 
-	function setColorsFromModel() {
-		// codes: uint16 length N
-		const codes = bytesToUint16ArrayLE(model.get(TRAITS.codedValues));
+	const receivedBox = new THREE.Box3();
+
+	function setPointsRangeFromModel(start: number, end: number) {
+		if (end <= start) return;
+		const { positions, count } = pointsFromModel(model);
+		if (positionAttr.array !== positions) {
+			// a new transfer started
+			setPointsFromModel();
+			return;
+		}
+		geom.setDrawRange(0, count);
+		positionsVersion++;
+		positionAttr.addUpdateRange(start * 3, (end - start) * 3);
+		positionAttr.needsUpdate = true;
+
+		// bounds of the points received so far, for culling and framing
+		const chunk = new THREE.BufferAttribute(
+			positions.subarray(start * 3, end * 3),
+			3,
+		);
+		const chunkBox = new THREE.Box3().setFromBufferAttribute(chunk);
+		if (start === 0) receivedBox.copy(chunkBox);
+		else receivedBox.union(chunkBox);
+		geom.boundingSphere = receivedBox.getBoundingSphere(new THREE.Sphere());
+		if (start === 0) {
+			frameCameraToBox(receivedBox.clone().applyMatrix4(localToData));
+		}
+
+		if (end === positionAttr.count) {
+			positionAttr.clearUpdateRanges();
+			geom.computeBoundingSphere();
+			setAxesFromModel();
+		}
+	}
+
+	function setCodesFromModel() {
+		// codes: uint8/16/32 length N
+		const codes = codesFromModel(model);
 
-		nPoints = (geom.getAttribute("position") as THREE.BufferAttribute).count;
+		nPoints = positionAttr.count;
 		if (codes.length !== nPoints) {
 			throw new Error(
 				`coded_values_t length ${codes.length} != nPoints ${nPoints}`,
 			);
 		}
 
-		// palette aligned with labels (code i+1)
-		const colors = readRGBList(model.get(TRAITS.colors), "colors_t");
-		const missing = readRGB(model.get(TRAITS.missingColor), "missing_color_t");
+		if (sameCodes(codeAttr.array, codes)) {
+			codeAttr.clearUpdateRanges();
+			codeAttr.needsUpdate = true;
+		} else {
+			codeAttr = codesAttribute(codes);
+			geom.setAttribute("code", codeAttr);
+		}
+	}
 
-		const cAttr = geom.getAttribute("color") as THREE.BufferAttribute;
-		const cArr = cAttr.array as Float32Array;
+	function setCodesForRangeFromModel(start: number, end: number) {
+		end = Math.min(end, nPoints);
+		if (end <= start) return;
+		if (!sameCodes(codeAttr.array, codesFromModel(model))) {
+			// not drawing this transfer yet
+			setCodesFromModel();
+			return;
+		}
+		codeAttr.addUpdateRange(start, end - start);
+		codeAttr.needsUpdate = true;
+	}
 
-		for (let i = 0; i < nPoints; i++) {
-			const code = codes[i] ?? 0;
-			const j = i * 3;
+	function setCodesForIndicesFromModel(indices: Uint32Array) {
+		if (indices.length === 0) return;
+		if (!sameCodes(codeAttr.array, codesFromModel(model))) {
+			// the attribute holds a copy (unaligned buffer): upload it all
+			setCodesFromModel();
+			return;
+		}
 
-			if (code === 0) {
-				cArr[j] = missing[0];
-				cArr[j + 1] = missing[1];
-				cArr[j + 2] = missing[2];
-				continue;
+		// the codes were patched in place, by initialize
+		let minIdx = Infinity;
+		let maxIdx = -Infinity;
+		for (let k = 0; k < indices.length; k++) {
+			const i = indices[k];
+			if (i >= nPoints) {
+				throw new Error(`patch index ${i} out of range (nPoints ${nPoints})`);
 			}
+			if (i < minIdx) minIdx = i;
+			if (i > maxIdx) maxIdx = i;
+		}
 
-			const idx = code - 1;
-			const rgb = colors[idx];
-			if (!rgb) {
-				// Hard fail: codes and colors out of sync is a bug we want to see.
-				throw new Error(
-					`No color for code=${code} (colors_t length=${colors.length}); expected colors_t[${idx}]`,
-				);
-			}
-			cArr[j] = rgb[0];
-			cArr[j + 1] = rgb[1];
-			cArr[j + 2] = rgb[2];
+		// only upload the touched span to the GPU
+		codeAttr.clearUpdateRanges();
+		codeAttr.addUpdateRange(minIdx, maxIdx - minIdx + 1);
+		codeAttr.needsUpdate = true;
+	}
+
+	function setVisibilityFromModel() {
+		const bytes = bytesToUint8Array(
+			model.get(TRAITS.visible) ?? new Uint8Array(0),
+		);
+		// a mask for other points (sent before them) is ignored until they
+		// arrive, all the points are shown meanwhile
+		visibleMask =
+			bytes.byteLength > 0 && bytes.byteLength === packedMaskLength(nPoints)
+				? bytes
+				: null;
+		if (visibleMask) {
+			geom.setAttribute("hidden", hiddenAttribute(visibleMask, nPoints));
+		} else {
+			geom.deleteAttribute("hidden");
 		}
+		// the lasso worker gets the new mask with the positions
+		positionsVersion++;
+	}
+
+	function setPaletteFromModel() {
+		// palette aligned with labels (code i+1)
+		const colors = readRGBList(model.get(TRAITS.colors), "colors_t");
+		const missing = readRGB(model.get(TRAITS.missingColor), "missing_color_t");
 
-		cAttr.needsUpdate = true;
+		const size = colors.length + 1;
+		let tex = paletteUniforms.paletteMap.value;
+		if (tex.image.width * tex.image.height < size) {
+			tex.dispose();
+			tex = createPaletteTexture(size);
+			paletteUniforms.paletteMap.value = tex;
+		}
+		const data = tex.image.data as Float32Array;
+		for (let i = 0; i < size; i++) {
+			const rgb = i === 0 ? missing : colors[i - 1];
+			data.set(rgb, i * 4);
+			data[i * 4 + 3] = 1;
+		}
+		tex.needsUpdate = true;
+		paletteUniforms.paletteSize.value = size;
 	}
 
 	function setSize(cssW: number, cssH: number, dpr: number) {
@@ -381,36 +727,114 @@ export function createThreeScene(
 		camera.updateProjectionMatrix();
 	}
 
-	const tmpV = new THREE.Vector3();
+	const tmpM = new THREE.Matrix4();
+	const viewProjection = new THREE.Matrix4();
+
+	const lassoSelector = createLassoSelector();
 
-	function selectMaskInLasso(polyNdc: Point2D[]): Uint8Array {
+	async function selectMaskInLasso(polyNdc: Point2D[]): Promise<Uint8Array> {
 		if (polyNdc.length < 3) {
 			return new Uint8Array(0);
 		}
 
-		camera.updateMatrixWorld(true);
+		const dataToNdc = tmpM
+			.fromArray(getViewProjectionMatrix())
+			.multiply(localToData);
+
+		return lassoSelector.select(
+			positionAttr.array as PositionsArray,
+			// during a chunked transfer, only the points received so far:
+			// the others are still at the origin
+			Math.min(geom.drawRange.count, nPoints),
+			visibleMask,
+			positionsVersion,
+			dataToNdc.elements,
+			polyNdc,
+		);
+	}
 
-		const pos = geom.getAttribute("position") as THREE.BufferAttribute;
-		const arr = pos.array as Float32Array;
-		const count = pos.count;
+	function getViewProjectionMatrix(): number[] {
+		camera.updateMatrixWorld(true);
+		viewProjection
+			.multiplyMatrices(camera.projectionMatrix, camera.matrixWorldInverse)
+			.multiply(DATA_TO_WORLD);
+		return Array.from(viewProjection.elements);
+	}
 
-		const mask = createPackedMaskBig(count);
+	function setLodNode(
+		id: number,
+		positions: PositionsArray | null,
+		codes: CodesArray,
+		visible: Uint8Array | null,
+	) {
+		let points = lodNodes.get(id);
+		if (positions !== null) {
+			if (points) removeLodNode(id);
+			const g = new THREE.BufferGeometry();
+			g.setAttribute("position", new THREE.BufferAttribute(positions, 3));
+			g.computeBoundingSphere();
+			points = new THREE.Points(g, mat);
+			// nodes are sent in the current xyz_encoding_t
+			points.matrixAutoUpdate = false;
+			localToDataFromModel(model, points.matrix);
+			points.matrixWorldNeedsUpdate = true;
+			lodGroup.add(points);
+			lodNodes.set(id, points);
+		} else if (!points) {
+			// codes of a node no longer shown
+			return;
+		}
+		if (codes.length !== points.geometry.getAttribute("position").count) {
+			throw new Error(`LOD node ${id}: codes length ${codes.length} != points`);
+		}
+		// node codes and labels_t come in separate messages, a code past
+		// the palette is shown as missing until its update arrives
+		points.geometry.setAttribute("code", codesAttribute(codes));
+		if (visible === null) {
+			points.geometry.deleteAttribute("hidden");
+		} else if (visible.byteLength !== packedMaskLength(codes.length)) {
+			throw new Error(
+				`LOD node ${id}: visible mask of ${visible.byteLength} bytes for ${codes.length} points`,
+			);
+		} else {
+			points.geometry.setAttribute(
+				"hidden",
+				hiddenAttribute(visible, codes.length),
+			);
+		}
+	}
 
-		// arr layout: [x0,y0,z0,x1,y1,z1,...]
-		for (let i = 0; i < arr.length; i += 3) {
-			tmpV.set(arr[i], arr[i + 1], arr[i + 2]);
-			tmpV.project(camera);
+	function removeLodNode(id: number) {
+		const points = lodNodes.get(id);
+		if (!points) return;
+		lodGroup.remove(points);
+		points.geometry.dispose();
+		lodNodes.delete(id);
+	}
 
-			// skip clipped points
-			if (tmpV.z < -1 || tmpV.z > 1) continue;
+	function lodNodeIds(): number[] {
+		return Array.from(lodNodes.keys());
+	}
 
-			const idx = i / 3;
-			if (pointInPolygon({ x: tmpV.x, y: tmpV.y }, polyNdc)) {
-				setPackedMaskBitBig(mask, idx);
-			}
-		}
+	function selectLodNodesForView(
+		nodes: readonly LodNode[],
+		pointBudget: number,
+	): number[] {
+		tmpM.fromArray(getViewProjectionMatrix());
+		const heightPx = renderer.domElement.clientHeight || 1;
+		return selectLodNodes(
+			nodes,
+			camera,
+			DATA_TO_WORLD,
+			tmpM,
+			heightPx,
+			pointBudget,
+		);
+	}
 
-		return mask;
+	function onViewChange(cb: () => void): () => void {
+		controls.addEventListener("change", cb);
+		return () => controls.removeEventListener("change", cb);
 	}
 
 	function render() {
@@ -419,9 +843,12 @@ export function createThreeScene(
 	}
 
 	function dispose() {
+		for (const id of lodNodeIds()) removeLodNode(id);
+		lassoSelector.dispose();
 		controls.dispose();
 		geom.dispose();
 		mat.dispose();
+		paletteUniforms.paletteMap.value.dispose();
 		renderer.dispose();
 		renderer.forceContextLoss();
 		renderer.domElement.remove();
@@ -432,10 +859,22 @@ export function createThreeScene(
 		domElement: renderer.domElement,
 		setSize,
 		setPointsFromModel,
-		setColorsFromModel,
+		setPointsRangeFromModel,
+		setCodesFromModel,
+		setCodesForIndicesFromModel,
+		setCodesForRangeFromModel,
+		setPaletteFromModel,
+		setVisibilityFromModel,
 		setAxesFromModel,
 		rebuildAxisLabels,
 		selectMaskInLasso,
+		getViewProjectionMatrix,
+		setLodNode,
+		removeLodNode,
+		lodNodeIds,
+		selectLodNodes: selectLodNodesForView,
+		frameCameraToBox,
+		onViewChange,
 		render,
 		dispose,
 	};
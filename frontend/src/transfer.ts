@@ -0,0 +1,140 @@
+// frontend/src/transfer.ts
+import type {
+	TransferAck,
+	TransferChunk,
+	TransferHeader,
+	TransferKind,
+	WidgetModel,
+} from "./model";
+import { TRAITS } from "./model";
+import { bytesToUint8Array } from "./binary";
+
+const TRANSFER_KINDS: readonly TransferKind[] = ["xyz", "codes"];
+
+// A buffer being received in chunks, filled in order up to receivedBytes
+export type Transfer = {
+	header: TransferHeader;
+	bytes: Uint8Array;
+	receivedChunks: number;
+	receivedBytes: number;
+};
+
+// One store per model, shared by its views
+const stores = new WeakMap<WidgetModel, Map<TransferKind, Transfer>>();
+
+function storeFor(model: WidgetModel): Map<TransferKind, Transfer> {
+	let store = stores.get(model);
+	if (!store) {
+		store = new Map();
+		stores.set(model, store);
+	}
+	return store;
+}
+
+function readHeaders(
+	model: WidgetModel,
+): Partial<Record<TransferKind, TransferHeader>> {
+	const x = model.get(TRAITS.transfers);
+	if (!x || typeof x !== "object") return {};
+	return x as Partial<Record<TransferKind, TransferHeader>>;
+}
+
+// The buffer of kind when it is sent in chunks, null when it is in its
+// traitlet (xyz_bytes_t, coded_values_t).
+export function getTransfer(
+	model: WidgetModel,
+	kind: TransferKind,
+): Transfer | null {
+	const header = readHeaders(model)[kind];
+	const transfer = storeFor(model).get(kind);
+	if (!header || !transfer || transfer.header.transfer !== header.transfer) {
+		return null;
+	}
+	return transfer;
+}
+
+function sendAck(model: WidgetModel, ack: TransferAck) {
+	model.set(TRAITS.transferAck, ack);
+	model.save_changes();
+}
+
+// Starts a buffer for every new transfer announced in transfer_t, drops the
+// finished ones.
+export function onTransferHeaders(model: WidgetModel) {
+	const store = storeFor(model);
+	const headers = readHeaders(model);
+	for (const kind of TRANSFER_KINDS) {
+		const header = headers[kind];
+		if (!header) {
+			store.delete(kind);
+			continue;
+		}
+		if (store.get(kind)?.header.transfer === header.transfer) continue;
+		store.set(kind, {
+			header,
+			bytes: new Uint8Array(header.total_bytes),
+			receivedChunks: 0,
+			receivedBytes: 0,
+		});
+	}
+}
+
+function readChunk(model: WidgetModel): TransferChunk | null {
+	const chunk = model.get(TRAITS.transferChunk) as TransferChunk | null;
+	if (!chunk || typeof chunk !== "object" || !("transfer" in chunk)) {
+		return null;
+	}
+	return chunk;
+}
+
+// Copies a chunk into its buffer and acknowledges it, so that Python sends
+// the next ones. Runs once per model, in initialize.
+export function onTransferChunk(model: WidgetModel) {
+	const chunk = readChunk(model);
+	if (!chunk) return;
+	const transfer = storeFor(model).get(chunk.kind);
+	if (
+		!transfer ||
+		transfer.header.transfer !== chunk.transfer ||
+		chunk.seq !== transfer.receivedChunks
+	) {
+		return;
+	}
+	const data = bytesToUint8Array(chunk.data);
+	transfer.bytes.set(data, chunk.offset);
+	transfer.receivedChunks += 1;
+	transfer.receivedBytes = chunk.offset + data.byteLength;
+
+	sendAck(model, {
+		transfer: chunk.transfer,
+		kind: chunk.kind,
+		received: transfer.receivedChunks,
+	});
+}
+
+// The byte range [start, end) of the last chunk received, for views to
+// update what it covers. Null if it is not part of a current transfer.
+export function readTransferChunkRange(
+	model: WidgetModel,
+): { kind: TransferKind; start: number; end: number } | null {
+	const chunk = readChunk(model);
+	if (!chunk) return null;
+	const transfer = getTransfer(model, chunk.kind);
+	if (!transfer || transfer.header.transfer !== chunk.transfer) return null;
+	return {
+		kind: chunk.kind,
+		start: chunk.offset,
+		end: chunk.offset + bytesToUint8Array(chunk.data).byteLength,
+	};
+}
+
+// A model created after the chunks were sent (page reload, new frontend)
+// asks for the transfers again.
+export function requestMissedTransfers(model: WidgetModel) {
+	const headers = readHeaders(model);
+	for (const kind of TRANSFER_KINDS) {
+		if (headers[kind] && !getTransfer(model, kind)) {
+			sendAck(model, { kind, restart: true });
+		}
+	}
+}
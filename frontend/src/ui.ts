@@ -41,6 +41,8 @@ export type ControlBar = {
 	addBtn: HTMLButtonElement;
 	removeBtn: HTMLButtonElement;
 	labelSelect: HTMLSelectElement;
+	undoBtn: HTMLButtonElement;
+	redoBtn: HTMLButtonElement;
 };
 
 export function createControlBar(
@@ -63,7 +65,13 @@ export function createControlBar(
 
 	const labelSelect = document.createElement("select");
 
-	for (const b of [rotateBtn, lassoBtn, addBtn, removeBtn]) {
+	const undoBtn = document.createElement("button");
+	undoBtn.textContent = "Undo";
+
+	const redoBtn = document.createElement("button");
+	redoBtn.textContent = "Redo";
+
+	for (const b of [rotateBtn, lassoBtn, addBtn, removeBtn, undoBtn, redoBtn]) {
 		b.style.padding = cfg.buttons.padding;
 		b.style.borderRadius = `${cfg.buttons.borderRadiusPx}px`;
 		b.style.border = cfg.buttons.border;
@@ -76,6 +84,8 @@ export function createControlBar(
 	toolbar.appendChild(addBtn);
 	toolbar.appendChild(removeBtn);
 	toolbar.appendChild(labelSelect);
+	toolbar.appendChild(undoBtn);
+	toolbar.appendChild(redoBtn);
 
 	return {
 		el: toolbar,
@@ -84,12 +94,16 @@ export function createControlBar(
 		addBtn,
 		removeBtn,
 		labelSelect,
+		undoBtn,
+		redoBtn,
 	};
 }
 
 export type UiState = {
 	mode: "rotate" | "lasso";
 	operation: "add" | "remove";
+	canUndo: boolean;
+	canRedo: boolean;
 };
 
 function styleBtn(
@@ -125,4 +139,11 @@ export function renderControlBar(bar: ControlBar, cfg: UiConfig, s: UiState) {
 	styleBtn(bar.lassoBtn, cfg, s.mode === "lasso");
 	styleBtn(bar.addBtn, cfg, inLasso && s.operation === "add");
 	styleBtn(bar.removeBtn, cfg, inLasso && s.operation === "remove", "remove");
+	styleBtn(bar.undoBtn, cfg, false);
+	styleBtn(bar.redoBtn, cfg, false);
+
+	bar.undoBtn.disabled = !s.canUndo;
+	bar.redoBtn.disabled = !s.canRedo;
+	bar.undoBtn.style.opacity = s.canUndo ? "" : "0.5";
+	bar.redoBtn.style.opacity = s.canRedo ? "" : "0.5";
 }
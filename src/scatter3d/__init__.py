@@ -1,3 +1,4 @@
 from .scatter3d import Scatter3dWidget, Category, LabelListErrorResponse
+from .selection import Selection
 
-__all__ = ["Scatter3dWidget", "Category", "LabelListErrorResponse"]
+__all__ = ["Scatter3dWidget", "Category", "LabelListErrorResponse", "Selection"]
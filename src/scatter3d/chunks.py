@@ -0,0 +1,100 @@
+from collections.abc import Iterator
+
+import numpy
+
+# Out-of-core arrays are read and processed this many items at a time, which
+# bounds the temporary memory used by the NumPy passes over them.
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+# Maximum number of points sent to the frontend for out-of-core coordinates
+# when no explicit limit is given.
+MAX_PREVIEW_POINTS = 1_000_000
+
+
+def is_out_of_core(array) -> bool:
+    """
+    True for arrays that are not fully held in memory: numpy.memmap and
+    chunked array-likes read by slicing (h5py datasets, zarr and dask
+    arrays...).
+    """
+    if isinstance(array, numpy.memmap):
+        return True
+    if isinstance(array, numpy.ndarray):
+        return False
+    return (
+        hasattr(array, "chunks")
+        and hasattr(array, "shape")
+        and isinstance(getattr(array, "dtype", None), numpy.dtype)
+    )
+
+
+def chunk_slices(
+    num_items: int, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[slice]:
+    if chunk_size <= 0:
+        raise ValueError("chunk_size should be a positive integer")
+    for start in range(0, num_items, chunk_size):
+        yield slice(start, min(start + chunk_size, num_items))
+
+
+def read_chunk(array, chunk: slice) -> numpy.ndarray:
+    """The items of array in chunk as an in-memory NumPy array."""
+    return numpy.asarray(array[chunk])
+
+
+def unique_in_chunks(array, chunk_size: int = DEFAULT_CHUNK_SIZE) -> numpy.ndarray:
+    """Sorted unique values of a 1D array, NaNs (missing values) excluded."""
+    uniques = numpy.empty(0, dtype=array.dtype)
+    for chunk in chunk_slices(array.shape[0], chunk_size):
+        values = read_chunk(array, chunk)
+        if values.dtype.kind == "f":
+            values = values[~numpy.isnan(values)]
+        uniques = numpy.union1d(uniques, values)
+    return uniques
+
+
+def bincount_in_chunks(
+    codes: numpy.ndarray, minlength: int, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> numpy.ndarray:
+    """
+    numpy.bincount of a code array without converting it to intp in one go.
+    """
+    counts = numpy.zeros(minlength, dtype=numpy.int64)
+    for chunk in chunk_slices(codes.shape[0], chunk_size):
+        chunk_counts = numpy.bincount(read_chunk(codes, chunk), minlength=minlength)
+        if chunk_counts.size > counts.size:
+            chunk_counts[: counts.size] += counts
+            counts = chunk_counts
+        else:
+            counts += chunk_counts
+    return counts
+
+
+def bounds_in_chunks(
+    array, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Per column minimum and maximum (float64) of a 2D array, zeros if it is
+    empty. NaNs propagate.
+    """
+    num_columns = array.shape[1]
+    lo = numpy.full(num_columns, numpy.inf)
+    hi = numpy.full(num_columns, -numpy.inf)
+    if not array.shape[0]:
+        return numpy.zeros(num_columns), numpy.zeros(num_columns)
+    for chunk in chunk_slices(array.shape[0], chunk_size):
+        values = read_chunk(array, chunk)
+        lo = numpy.minimum(lo, values.min(axis=0))
+        hi = numpy.maximum(hi, values.max(axis=0))
+    return lo, hi
+
+
+def decimation_step(num_points: int, max_points: int | None) -> int:
+    """
+    Stride keeping at most max_points of num_points points, 1 keeps them all.
+    """
+    if max_points is None or num_points <= max_points:
+        return 1
+    if max_points <= 0:
+        raise ValueError("max_points should be a positive integer")
+    return -(-num_points // max_points)
@@ -0,0 +1,138 @@
+from collections import deque
+
+import numpy
+
+# Memory kept by default for undoing and redoing edits, both stacks included
+DEFAULT_HISTORY_MAX_BYTES = 64 * 1024 * 1024
+# Changed points are kept as uint32 indices, or as a packed bit mask over all
+# the points when that is smaller (more than 1/32 of the points changed).
+INDEX_BYTES = 4
+
+
+class Edit:
+    """
+    The points changed by an edit, with their codes on the other side of
+    it: the previous codes while it can be undone, the new ones once undone.
+    """
+
+    def __init__(self, indices: numpy.ndarray, codes: numpy.ndarray, num_points: int):
+        """indices are sorted and unique, codes[i] is the code of indices[i]."""
+        self.num_points = num_points
+        self.num_changed = int(indices.size)
+        self._indices: numpy.ndarray | None = None
+        self._packed_mask: numpy.ndarray | None = None
+        if self.num_changed * INDEX_BYTES > -(-num_points // 8):
+            mask = numpy.zeros(num_points, dtype=numpy.bool_)
+            mask[indices] = True
+            self._packed_mask = numpy.packbits(mask)
+        else:
+            self._indices = indices.astype(numpy.uint32)
+        self.codes = numpy.asarray(codes)
+
+    @property
+    def nbytes(self) -> int:
+        changed = self._indices if self._indices is not None else self._packed_mask
+        return changed.nbytes + self.codes.nbytes
+
+    def indices(self) -> numpy.ndarray:
+        if self._indices is not None:
+            return self._indices.astype(numpy.intp)
+        mask = numpy.unpackbits(self._packed_mask, count=self.num_points)
+        return numpy.flatnonzero(mask)
+
+    def swap(self, codes: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        The indices and codes to set in codes to cross the edit, which then
+        keeps the current codes to cross it back.
+        """
+        indices = self.indices()
+        target = self.codes
+        self.codes = codes[indices]
+        return indices, target
+
+
+class EditHistory:
+    """
+    Undo and redo stacks of edits of a codes array, stored as sparse diffs.
+    The oldest edits are dropped when they take more than max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_HISTORY_MAX_BYTES):
+        self._undo: deque[Edit] = deque()
+        self._redo: list[Edit] = []
+        self.nbytes = 0
+        self.max_bytes = max_bytes
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value: int) -> None:
+        if value < 0:
+            raise ValueError("max_bytes should be a non negative integer")
+        self._max_bytes = int(value)
+        self._evict()
+
+    @property
+    def num_undo(self) -> int:
+        return len(self._undo)
+
+    @property
+    def num_redo(self) -> int:
+        return len(self._redo)
+
+    def clear(self) -> None:
+        self._undo.clear()
+        self._redo.clear()
+        self.nbytes = 0
+
+    def record(
+        self, indices: numpy.ndarray, previous_codes: numpy.ndarray, num_points: int
+    ) -> None:
+        """
+        Record an edit that changed the codes at indices (sorted, unique)
+        from previous_codes. Edits that were undone cannot be redone anymore.
+        """
+        for edit in self._redo:
+            self.nbytes -= edit.nbytes
+        self._redo.clear()
+        if not indices.size:
+            return
+        edit = Edit(indices, previous_codes, num_points)
+        if edit.nbytes > self._max_bytes:
+            # undoing the older edits would skip this one
+            self.clear()
+            return
+        self._undo.append(edit)
+        self.nbytes += edit.nbytes
+        self._evict()
+
+    def undo(self, codes: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray] | None:
+        """
+        The indices and codes to set in codes to undo the last edit, None if
+        there is nothing to undo.
+        """
+        if not self._undo:
+            return None
+        edit = self._undo.pop()
+        self._redo.append(edit)
+        return edit.swap(codes)
+
+    def redo(self, codes: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray] | None:
+        """
+        The indices and codes to set in codes to redo the last edit undone,
+        None if there is nothing to redo.
+        """
+        if not self._redo:
+            return None
+        edit = self._redo.pop()
+        self._undo.append(edit)
+        return edit.swap(codes)
+
+    def _evict(self) -> None:
+        # oldest undo first, then the redo furthest from the current state
+        while self.nbytes > self._max_bytes and self._undo:
+            self.nbytes -= self._undo.popleft().nbytes
+        while self.nbytes > self._max_bytes and self._redo:
+            self.nbytes -= self._redo.pop(0).nbytes
@@ -0,0 +1,184 @@
+import numpy
+
+# Points are projected in chunks to bound the temporary memory used for
+# clip-space coordinates on very large point clouds.
+PROJECTION_CHUNK_SIZE = 1 << 20
+# Packed masks with more nonzero bytes than this fraction are unpacked in
+# full, sparser ones only at their nonzero bytes.
+SPARSE_MASK_MAX_FRACTION = 1 / 16
+
+
+def _as_view_projection_matrix(view_projection) -> numpy.ndarray:
+    """
+    Return the 4x4 row-major view-projection matrix.
+
+    The frontend sends three.js Matrix4.elements, that is 16 floats in
+    column-major order, so the flat list is transposed after reshaping.
+    """
+    matrix = numpy.asarray(view_projection, dtype=numpy.float64)
+    if matrix.shape == (16,):
+        matrix = matrix.reshape(4, 4).T
+    if matrix.shape != (4, 4):
+        raise ValueError(
+            f"view_projection should have 16 values or shape (4, 4), got {matrix.shape}"
+        )
+    if not numpy.all(numpy.isfinite(matrix)):
+        raise ValueError("view_projection should only contain finite numbers")
+    return matrix
+
+
+def _as_polygon(polygon_ndc) -> numpy.ndarray:
+    polygon = numpy.asarray(polygon_ndc, dtype=numpy.float64)
+    if polygon.ndim != 2 or polygon.shape[1] != 2:
+        raise ValueError("polygon_ndc should be a list of [x, y] NDC pairs")
+    if polygon.shape[0] < 3:
+        raise ValueError("polygon_ndc should have at least 3 vertices")
+    if not numpy.all(numpy.isfinite(polygon)):
+        raise ValueError("polygon_ndc should only contain finite numbers")
+    return polygon
+
+
+def project_to_ndc(
+    xyz: numpy.ndarray, view_projection: numpy.ndarray
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Project world coordinates (N, 3) to normalized device coordinates.
+
+    Returns (ndc_xy, visible), ndc_xy with shape (N, 2) and visible a boolean
+    mask for the points inside the camera's depth range (in front of the
+    camera and between the near and far planes), mimicking the clipping done
+    by the frontend with Vector3.project.
+    """
+    linear = view_projection[:, :3].T.astype(xyz.dtype, copy=False)
+    translation = view_projection[:, 3].astype(xyz.dtype, copy=False)
+
+    clip = xyz @ linear
+    clip += translation
+
+    w = clip[:, 3]
+    visible = w > 0
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        inv_w = numpy.where(visible, 1.0 / w, 0.0).astype(xyz.dtype, copy=False)
+    ndc = clip[:, :3] * inv_w[:, None]
+    visible &= (ndc[:, 2] >= -1) & (ndc[:, 2] <= 1)
+    return ndc[:, :2], visible
+
+
+def points_in_polygon(points: numpy.ndarray, polygon: numpy.ndarray) -> numpy.ndarray:
+    """
+    Vectorized even-odd (ray casting) point in polygon test.
+
+    points has shape (M, 2), polygon (K, 2). The loop runs over the K polygon
+    edges, every edge is tested against all points at once.
+    """
+    x = points[:, 0]
+    y = points[:, 1]
+    inside = numpy.zeros(points.shape[0], dtype=bool)
+
+    xj, yj = polygon[-1]
+    for xi, yi in polygon:
+        if yi != yj:
+            crosses = (yi > y) != (yj > y)
+            x_cross = (xj - xi) * (y - yi) / (yj - yi) + xi
+            inside ^= crosses & (x < x_cross)
+        xj, yj = xi, yi
+    return inside
+
+
+def indices_from_packed_mask(packed, num_bits: int) -> numpy.ndarray:
+    """
+    Sorted indices of the bits set among the first num_bits of a packed mask
+    (bitorder "big"). Only the nonzero bytes of sparse masks are unpacked,
+    which then cost little more than a scan of the packed bytes.
+    """
+    packed = numpy.frombuffer(packed, dtype=numpy.uint8, count=-(-num_bits // 8))
+    nonzero = numpy.flatnonzero(packed)
+    if nonzero.size > SPARSE_MASK_MAX_FRACTION * packed.size:
+        # by chunks, which stay in cache
+        chunk_bytes = PROJECTION_CHUNK_SIZE // 8
+        indices = numpy.concatenate(
+            [
+                numpy.flatnonzero(
+                    numpy.unpackbits(packed[start : start + chunk_bytes]).view(bool)
+                )
+                + start * 8
+                for start in range(0, packed.size, chunk_bytes)
+            ]
+        )
+    else:
+        bits = numpy.unpackbits(packed[nonzero], bitorder="big").view(bool)
+        bits = numpy.flatnonzero(bits)
+        indices = nonzero[bits >> 3] * 8 + (bits & 7)
+    # padding bits of the last byte
+    return indices[indices < num_bits] if num_bits % 8 else indices
+
+
+def select_point_indices_in_lasso(
+    xyz: numpy.ndarray,
+    polygon_ndc,
+    view_projection,
+    chunk_size: int = PROJECTION_CHUNK_SIZE,
+) -> numpy.ndarray:
+    """
+    Sorted indices of the points whose projection falls inside the lasso.
+
+    xyz are the point coordinates as sent to the frontend, polygon_ndc the
+    lasso vertices in normalized device coordinates and view_projection the
+    matrix taking xyz to clip space (the camera's projection and view
+    matrices times the points' model matrix).
+    Points outside the polygon's bounding box are culled before running the
+    point in polygon test.
+    """
+    if len(xyz.shape) != 2 or xyz.shape[1] != 3:
+        raise ValueError("xyz should have shape (N, 3)")
+    if chunk_size <= 0:
+        raise ValueError("chunk_size should be a positive integer")
+
+    polygon = _as_polygon(polygon_ndc)
+    matrix = _as_view_projection_matrix(view_projection)
+    min_x, min_y = polygon.min(axis=0)
+    max_x, max_y = polygon.max(axis=0)
+
+    n_points = xyz.shape[0]
+    selected = []
+    for start in range(0, n_points, chunk_size):
+        stop = min(start + chunk_size, n_points)
+        # xyz might be out-of-core (numpy.memmap...), only a chunk is read
+        chunk = numpy.asarray(xyz[start:stop])
+        if chunk.dtype.kind != "f":
+            chunk = chunk.astype(numpy.float64)
+        ndc, visible = project_to_ndc(chunk, matrix)
+
+        candidates = (
+            visible
+            & (ndc[:, 0] >= min_x)
+            & (ndc[:, 0] <= max_x)
+            & (ndc[:, 1] >= min_y)
+            & (ndc[:, 1] <= max_y)
+        )
+        idxs = numpy.flatnonzero(candidates)
+        if idxs.size == 0:
+            continue
+        inside = points_in_polygon(ndc[idxs], polygon)
+        selected.append(start + idxs[inside])
+    if not selected:
+        return numpy.empty(0, dtype=numpy.intp)
+    return numpy.concatenate(selected)
+
+
+def select_points_in_lasso(
+    xyz: numpy.ndarray,
+    polygon_ndc,
+    view_projection,
+    chunk_size: int = PROJECTION_CHUNK_SIZE,
+) -> numpy.ndarray:
+    """
+    Boolean mask (N,) of the points whose projection falls inside the lasso,
+    see select_point_indices_in_lasso.
+    """
+    indices = select_point_indices_in_lasso(
+        xyz, polygon_ndc, view_projection, chunk_size
+    )
+    mask = numpy.zeros(xyz.shape[0], dtype=bool)
+    mask[indices] = True
+    return mask
@@ -0,0 +1,149 @@
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy
+
+# Points owned by each octree node: the root alone is a coarse but complete
+# view of the cloud, every level down adds detail to a smaller region.
+DEFAULT_POINTS_PER_NODE = 50_000
+DEFAULT_MAX_DEPTH = 16
+# The node samples are drawn from a fixed permutation, so the same cloud
+# always gives the same tree.
+SAMPLING_SEED = 0
+
+# octant of a point: bit 0 for x, 1 for y and 2 for z above the node center
+_OCTANT_BITS = numpy.array([1, 2, 4], dtype=numpy.uint8)
+
+
+@dataclass
+class OctreeNode:
+    node_id: int
+    parent: int | None
+    level: int
+    bbox_min: numpy.ndarray
+    bbox_max: numpy.ndarray
+    # sorted indices of the points owned by this node, not repeated in the
+    # ancestors or the descendants
+    indices: numpy.ndarray
+    children: list[int] = field(default_factory=list)
+
+    def info(self) -> dict[str, Any]:
+        return {
+            "id": self.node_id,
+            "parent": self.parent,
+            "level": self.level,
+            "min": [float(v) for v in self.bbox_min],
+            "max": [float(v) for v in self.bbox_max],
+            "count": int(self.indices.size),
+        }
+
+
+class Octree:
+    """
+    Level-of-detail octree over a (N, 3) point cloud.
+
+    Every point belongs to exactly one node. A node keeps a uniform random
+    sample of up to points_per_node of the points in its cell, the rest is
+    split among the children. Showing a node and its ancestors gives an even
+    subsampling of the node's cell that gets denser as nodes are added.
+    """
+
+    def __init__(
+        self,
+        xyz,
+        points_per_node: int = DEFAULT_POINTS_PER_NODE,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+    ):
+        if points_per_node <= 0:
+            raise ValueError("points_per_node should be a positive integer")
+        if len(xyz.shape) != 2 or xyz.shape[1] != 3:
+            raise ValueError("xyz should have shape (N, 3)")
+
+        self.points_per_node = points_per_node
+        self.max_depth = max_depth
+        self.nodes: list[OctreeNode] = []
+        self._build(numpy.asarray(xyz))
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def root(self) -> OctreeNode:
+        return self.nodes[0]
+
+    def _build(self, xyz: numpy.ndarray) -> None:
+        num_points = xyz.shape[0]
+        index_dtype = numpy.uint32 if num_points < 2**32 else numpy.int64
+        rng = numpy.random.default_rng(SAMPLING_SEED)
+        # the first points of any slice of a random permutation are a
+        # uniform sample of that slice
+        order = rng.permutation(num_points).astype(index_dtype)
+
+        if num_points:
+            bbox_min = xyz.min(axis=0).astype(numpy.float64)
+            bbox_max = xyz.max(axis=0).astype(numpy.float64)
+        else:
+            bbox_min = bbox_max = numpy.zeros(3)
+
+        stack = [(order, bbox_min, bbox_max, 0, None)]
+        while stack:
+            indices, lo, hi, level, parent = stack.pop()
+            if indices.size <= self.points_per_node or level >= self.max_depth:
+                own, rest = indices, indices[:0]
+            else:
+                own, rest = (
+                    indices[: self.points_per_node],
+                    indices[self.points_per_node :],
+                )
+
+            node = OctreeNode(
+                node_id=len(self.nodes),
+                parent=parent,
+                level=level,
+                bbox_min=lo,
+                bbox_max=hi,
+                indices=numpy.sort(own),
+            )
+            self.nodes.append(node)
+            if parent is not None:
+                self.nodes[parent].children.append(node.node_id)
+            if not rest.size:
+                continue
+
+            center = (lo + hi) / 2
+            octants = (xyz[rest] >= center) @ _OCTANT_BITS
+            # stable, so that every octant keeps the random order
+            by_octant = numpy.argsort(octants, kind="stable")
+            ends = numpy.cumsum(numpy.bincount(octants, minlength=8))
+            # pushed in reverse so that children get ids in octant order
+            for octant in range(7, -1, -1):
+                start = ends[octant - 1] if octant else 0
+                if start == ends[octant]:
+                    continue
+                upper = [(octant >> axis) & 1 for axis in range(3)]
+                child_lo = numpy.where(upper, center, lo)
+                child_hi = numpy.where(upper, hi, center)
+                child_indices = rest[by_octant[start : ends[octant]]]
+                stack.append(
+                    (child_indices, child_lo, child_hi, level + 1, node.node_id)
+                )
+
+    def node_info(self) -> list[dict[str, Any]]:
+        """JSON friendly description of the nodes, indexed by node id."""
+        return [node.info() for node in self.nodes]
+
+    def nodes_containing(
+        self, indices: numpy.ndarray, node_ids: list[int] | set[int]
+    ) -> list[int]:
+        """The nodes among node_ids that own any of the point indices."""
+        indices = numpy.asarray(indices)
+        found = []
+        for node_id in sorted(node_ids):
+            node_indices = self.nodes[node_id].indices
+            if not node_indices.size:
+                continue
+            positions = numpy.searchsorted(node_indices, indices)
+            positions = numpy.minimum(positions, node_indices.size - 1)
+            if numpy.any(node_indices[positions] == indices):
+                found.append(node_id)
+        return found
@@ -0,0 +1,79 @@
+import numpy
+
+from .chunks import chunk_slices
+from .spatial import GridIndex
+
+DEFAULT_NUM_NEIGHBORS = 5
+# Assigned points per cell of the kNN index, at least: with about k points
+# per cell, the k nearest are mostly in the cells next to the query.
+MIN_POINTS_PER_CELL = 4
+# Unassigned points labelled per query_knn call, bounds the (M, k) temporaries
+PROPAGATION_BATCH_SIZE = 1 << 18
+
+
+def majority_codes(neighbor_codes: numpy.ndarray) -> numpy.ndarray:
+    """
+    Most common non zero code of every row of a (M, k) array of neighbour
+    codes, nearest first. Ties go to the code of the nearest neighbour among
+    the tied ones, rows without a code give 0.
+    """
+    num_rows, k = neighbor_codes.shape
+    votes = numpy.zeros((num_rows, k), dtype=numpy.int64)
+    for j in range(k):
+        votes[:, j] = numpy.sum(neighbor_codes == neighbor_codes[:, j : j + 1], axis=1)
+    votes[neighbor_codes == 0] = 0
+    # argmax picks the first, that is the nearest, of the tied columns
+    best = numpy.argmax(votes, axis=1)
+    return neighbor_codes[numpy.arange(num_rows), best]
+
+
+def propagate_codes(
+    xyz,
+    codes: numpy.ndarray,
+    k: int = DEFAULT_NUM_NEIGHBORS,
+    max_distance: float | None = None,
+    workers: int | None = None,
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Codes for the unassigned (code 0) points by majority vote of their k
+    nearest assigned points. Neighbours further than max_distance do not
+    vote, points without any voting neighbour stay unassigned.
+
+    Returns the sorted indices of the points that get a code and their
+    codes, codes itself is not modified. The unassigned points are processed
+    in batches, each a kNN query spread over workers threads.
+    """
+    if k <= 0:
+        raise ValueError("k should be a positive integer")
+    if max_distance is not None and not max_distance >= 0:
+        raise ValueError("max_distance should be a non negative number")
+    if xyz.shape[0] != codes.shape[0]:
+        raise ValueError(
+            f"xyz has {xyz.shape[0]} points but there are {codes.shape[0]} codes"
+        )
+
+    assigned = numpy.flatnonzero(codes)
+    unassigned = numpy.flatnonzero(codes == 0)
+    empty = numpy.empty(0, dtype=numpy.intp), numpy.empty(0, dtype=codes.dtype)
+    if not assigned.size or not unassigned.size:
+        return empty
+
+    index = GridIndex(xyz, points_per_cell=max(k, MIN_POINTS_PER_CELL), subset=assigned)
+    found_indices = []
+    found_codes = []
+    for batch in chunk_slices(unassigned.size, PROPAGATION_BATCH_SIZE):
+        targets = unassigned[batch]
+        neighbors, distances = index.query_knn(
+            numpy.asarray(xyz[targets]), k, workers=workers
+        )
+        neighbor_codes = numpy.where(neighbors >= 0, codes[neighbors], 0)
+        if max_distance is not None:
+            neighbor_codes[distances > max_distance] = 0
+        new_codes = majority_codes(neighbor_codes)
+        labelled = new_codes != 0
+        found_indices.append(targets[labelled])
+        found_codes.append(new_codes[labelled])
+    return (
+        numpy.concatenate(found_indices),
+        numpy.concatenate(found_codes).astype(codes.dtype, copy=False),
+    )
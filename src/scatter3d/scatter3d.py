@@ -1,11 +1,17 @@
+import logging
 import os
 from pathlib import Path
 from itertools import cycle, count
 from enum import Enum
 from collections import OrderedDict
-from typing import Any, Callable
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from typing import Any
 import weakref
 import base64
+import threading
+import time
 
 import anywidget
 import traitlets
@@ -13,6 +19,28 @@ import numpy
 import pandas
 import narwhals
 
+from .chunks import (
+    MAX_PREVIEW_POINTS,
+    bincount_in_chunks,
+    bounds_in_chunks,
+    chunk_slices,
+    decimation_step,
+    is_out_of_core,
+    read_chunk,
+    unique_in_chunks,
+)
+from .history import DEFAULT_HISTORY_MAX_BYTES, EditHistory
+from .lasso import indices_from_packed_mask, select_point_indices_in_lasso
+from .octree import DEFAULT_POINTS_PER_NODE, Octree
+from .propagation import DEFAULT_NUM_NEIGHBORS, propagate_codes
+from .selection import Selection
+from .spatial import GridIndex
+from .stats import DEFAULT_STATS_WINDOW, StatsCallback, WidgetStats
+from .transfer import ChunkedTransfer
+from .worker import CoalescingWorker
+
+
+logger = logging.getLogger(__name__)
 
 PACKAGE_DIR = Path(__file__).parent
 JAVASCRIPT_DIR = PACKAGE_DIR / "static"
@@ -21,9 +49,27 @@ DEF_DEV_ESM = "http://127.0.0.1:5173/src/index.ts"
 
 FLOAT_TYPE = "<f4"
 FLOAT_TYPE_TS = "float32"
-CATEGORY_CODES_DTYPE = "<u4"  # uint32 little-endian
+# Category codes use the narrowest of these (little-endian) dtypes that can
+# hold the number of labels, code 0 is reserved for missing.
+CATEGORY_CODES_DTYPES = ("<u1", "<u2", "<u4")
+NARWHALS_CODES_DTYPES = {1: narwhals.UInt8, 2: narwhals.UInt16, 4: narwhals.UInt32}
 MISSING_COLOR = (0.6, 0.6, 0.6)
 MISSING_CATEGORY_VALUE = "Unassigned"
+LASSO_SELECTION_PYTHON = "python"
+LASSO_SELECTION_FRONTEND = "frontend"
+# A coded_values_t patch costs a uint32 index and a code per changed point,
+# the full buffer a code per point
+CODED_VALUES_PATCH_INDEX_BYTES = 4
+# Buffers that can be sent in chunks, and the traitlet holding them when
+# they are small enough to be sent at once
+TRANSFER_TRAITS = {"xyz": "xyz_bytes_t", "codes": "coded_values_t"}
+# Points the frontend keeps loaded at once with level of detail enabled
+DEFAULT_LOD_POINT_BUDGET = 2_000_000
+# Encodings of the coordinates sent to the frontend: float32 (12 bytes per
+# point) or uint16 quantized over the bounding box (6 bytes per point).
+XYZ_ENCODING_FLOAT32 = "float32"
+XYZ_ENCODING_UINT16 = "uint16"
+QUANTIZED_XYZ_MAX = 2**16 - 1
 
 DARK_GREY = "#111111"
 WHITE = "#ffffff"
@@ -58,6 +104,14 @@ class LabelListErrorResponse(Enum):
     SET_MISSING = "missing"
 
 
+def _codes_dtype_for_num_labels(num_labels: int) -> numpy.dtype:
+    for dtype in CATEGORY_CODES_DTYPES:
+        dtype = numpy.dtype(dtype)
+        if num_labels <= numpy.iinfo(dtype).max:
+            return dtype
+    raise ValueError(f"Too many labels ({num_labels}) to be coded")
+
+
 def _is_valid_color(color):
     if not isinstance(color, tuple):
         raise ValueError(f"Invalid color, should be tuples with three floats {color}")
@@ -70,32 +124,136 @@ def _is_valid_color(color):
             )
 
 
+class BytesLike(traitlets.TraitType):
+    """
+    A binary trait that also accepts memoryviews, so that numpy buffers can
+    be synced without copying them into a bytes object.
+    """
+
+    default_value = b""
+    info_text = "a bytes-like object (bytes, bytearray or C-contiguous memoryview)"
+
+    def validate(self, obj, value):
+        if isinstance(value, (bytes, bytearray)):
+            return value
+        if isinstance(value, memoryview) and value.c_contiguous:
+            return value
+        self.error(obj, value)
+
+
+CATEGORY_EVENTS = frozenset(["label_list", "palette", "coded_values"])
+# order in which the events of a merged notification reach Category.subscribe
+# callbacks
+_CATEGORY_EVENT_ORDER = ("label_list", "palette", "coded_values")
+
+
+@dataclass
+class CodesChange:
+    """
+    Codes changed in place (see Category.set_coded_values_at): the points at
+    indices went from the previous codes to codes.
+    """
+
+    indices: numpy.ndarray
+    previous: numpy.ndarray
+    codes: numpy.ndarray
+
+
+def _recount_changed_codes(
+    counts: numpy.ndarray, old: numpy.ndarray, new: numpy.ndarray
+) -> numpy.ndarray:
+    """
+    counts per code of old updated to the ones of new, from the values that
+    differ only.
+    """
+    counts = counts.copy()
+    for chunk in chunk_slices(old.shape[0]):
+        old_chunk = old[chunk]
+        new_chunk = new[chunk]
+        changed = old_chunk != new_chunk
+        if not changed.any():
+            continue
+        added = numpy.bincount(new_chunk[changed], minlength=counts.size)
+        if added.size > counts.size:
+            raise ValueError(f"codes should be between 0 and {counts.size - 1}")
+        counts += added
+        counts -= numpy.bincount(old_chunk[changed], minlength=counts.size)
+    return counts
+
+
+def _merge_codes_changes(
+    changes: list[CodesChange], coded_values: numpy.ndarray
+) -> CodesChange:
+    if len(changes) == 1:
+        return changes[0]
+    indices = numpy.concatenate([change.indices for change in changes])
+    previous = numpy.concatenate([change.previous for change in changes])
+    # the codes before the first change of every point
+    indices, first = numpy.unique(indices, return_index=True)
+    return CodesChange(indices, previous[first], coded_values[indices])
+
+
+# Called with each event ("label_list", "palette" or "coded_values"), see
+# Category.subscribe.
 CategoryCallback = Callable[["Category", str], None]
+# Called with the set of events describing what changed, once per change or
+# once per Category.batch(), see Category.subscribe_batched.
+CategoryBatchCallback = Callable[["Category", frozenset[str]], None]
 
 
 class Category:
     def __init__(
         self,
-        values: narwhals.typing.IntoSeriesT,
+        values: narwhals.typing.IntoSeriesT | numpy.ndarray,
         label_list=None,
         color_palette: dict[Any, tuple[float, float, float]] | None = None,
         missing_color: tuple[float, float, float] = MISSING_COLOR,
     ):
         self._cb_id_gen = count(1)
-        self._callbacks: dict[int, weakref.ReferenceType] = {}
-
-        self._native_values_dtype = values.dtype
-        values = narwhals.from_native(values, series_only=True)
-        self._narwhals_values_dtype = values.dtype
-        self._name = values.name
-        self._values_implementation = values.implementation
-
-        label_list = self._initialize_label_list(values, label_list)
+        # callback id -> (weak reference, whether it takes the set of events)
+        self._callbacks: dict[int, tuple[weakref.ReferenceType, bool]] = {}
+        self._batch_depth = 0
+        self._pending_events: set[str] = set()
+        # in place changes of the codes not notified yet, None when all the
+        # codes may have changed
+        self._pending_changes: list[CodesChange] | None = []
+        self._last_change: CodesChange | None = None
+
+        # bumped whenever the coded values or the label coding change,
+        # invalidates the decoded values cache
+        self._version = 0
+        self._decoded_values_cache: tuple[int, Any] | None = None
+        # counts per code (index 0 for the unassigned values), counted on
+        # first use and then updated by every change
+        self._code_counts: numpy.ndarray | None = None
+        # indices of the values sorted by code, see label_indices
+        self._indices_by_code_cache: tuple[int, numpy.ndarray] | None = None
+
+        # only used to restore pandas dtypes (pyarrow arrays have no .dtype)
+        self._native_values_dtype = getattr(values, "dtype", None)
 
         self._label_coding = None
-        self._label_coding = self._create_label_coding(label_list)
-
-        self._encode_values(values)
+        if isinstance(values, numpy.ndarray) or is_out_of_core(values):
+            # 1D NumPy arrays, memmaps included, are encoded chunk by chunk
+            # without being loaded in full
+            self._name = None
+            self._values_implementation = None
+            self._encode_array_in_chunks(values, label_list)
+        else:
+            native_values = values
+            values = narwhals.from_native(values, series_only=True)
+            self._narwhals_values_dtype = values.dtype
+            self._name = values.name
+            self._values_implementation = values.implementation
+
+            factorized = _factorize_native(native_values, values)
+            if factorized is None:
+                unique_labels = self._get_unique_labels_in_values(values)
+                label_list = self._initialize_label_list(unique_labels, label_list)
+                self._label_coding = self._create_label_coding(label_list)
+                self._encode_values(values)
+            else:
+                self._encode_factorized(*factorized, label_list=label_list)
 
         self.create_color_palette(color_palette)
 
@@ -103,34 +261,91 @@ class Category:
         self._missing_color = missing_color
 
     def subscribe(self, cb: CategoryCallback) -> int:
+        """
+        Call cb(category, event) for every event: "label_list", "palette" or
+        "coded_values". Changes merged by batch() notify each event once.
+        """
+        return self._add_callback(cb, batched=False)
+
+    def subscribe_batched(self, cb: CategoryBatchCallback) -> int:
+        """
+        Call cb(category, events) with the frozenset of the events, once per
+        change or once per batch().
+        """
+        return self._add_callback(cb, batched=True)
+
+    def _add_callback(self, cb, batched: bool) -> int:
         cb_id = next(self._cb_id_gen)
         try:
             ref = weakref.WeakMethod(cb)  # bound method
         except TypeError:
             ref = weakref.ref(cb)  # function
-        self._callbacks[cb_id] = ref
+        self._callbacks[cb_id] = (ref, batched)
         return cb_id
 
     def unsubscribe(self, cb_id: int) -> None:
         self._callbacks.pop(cb_id, None)
 
-    def _notify(self, event: str) -> None:
+    @contextmanager
+    def batch(self) -> Iterator["Category"]:
+        """
+        Merge the notifications of all the changes done inside the block into
+        a single one, sent when the outermost batch exits.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._pending_events:
+                events = frozenset(self._pending_events)
+                self._pending_events.clear()
+                self._dispatch(events)
+
+    def _notify(self, *events: str) -> None:
+        if self._batch_depth:
+            self._pending_events.update(events)
+            return
+        self._dispatch(frozenset(events))
+
+    def _dispatch(self, events: frozenset[str]) -> None:
+        changes = self._pending_changes
+        self._pending_changes = []
+        if "coded_values" in events and changes:
+            self._last_change = _merge_codes_changes(changes, self._coded_values)
         dead = []
-        for cb_id, ref in self._callbacks.items():
-            cb = ref()
-            if cb is None:
-                dead.append(cb_id)
-            else:
-                cb(self, event)
+        try:
+            for cb_id, (ref, batched) in list(self._callbacks.items()):
+                cb = ref()
+                if cb is None:
+                    dead.append(cb_id)
+                elif batched:
+                    cb(self, events)
+                else:
+                    for event in _CATEGORY_EVENT_ORDER:
+                        if event in events:
+                            cb(self, event)
+        finally:
+            self._last_change = None
         for cb_id in dead:
             self._callbacks.pop(cb_id, None)
 
+    @property
+    def last_change(self) -> CodesChange | None:
+        """
+        During a "coded_values" notification, the points whose codes changed
+        with their previous and new codes. None when the codes were replaced
+        as a whole (set_coded_values, set_label_list recoding) and outside of
+        notifications.
+        """
+        return self._last_change
+
     @staticmethod
     def _get_unique_labels_in_values(values):
         return values.drop_nulls().unique().to_list()
 
-    def _initialize_label_list(self, values, label_list):
-        unique_labels = self._get_unique_labels_in_values(values)
+    @staticmethod
+    def _initialize_label_list(unique_labels, label_list):
         if label_list is not None:
             labels_not_in_label_list = set(label_list).difference(unique_labels)
             if labels_not_in_label_list:
@@ -149,42 +364,140 @@ class Category:
         return label_coding
 
     def _encode_values(self, values):
+        codes_dtype = _codes_dtype_for_num_labels(len(self._label_coding))
         coded_values = values.replace_strict(
-            self._label_coding, default=0, return_dtype=narwhals.UInt16
+            self._label_coding,
+            default=0,
+            return_dtype=NARWHALS_CODES_DTYPES[codes_dtype.itemsize],
         ).to_numpy()
+        self._coded_values = coded_values.astype(codes_dtype, copy=False)
+        self._version += 1
+
+    def _encode_array_in_chunks(self, values, label_list=None):
+        """
+        Encode a 1D NumPy array or out-of-core array (numpy.memmap...) chunk
+        by chunk, NaNs are missing values.
+        """
+        if len(values.shape) != 1:
+            raise ValueError(f"values should be 1D, got shape {values.shape}")
+
+        dictionary = unique_in_chunks(values)
+        label_list = self._initialize_label_list(dictionary.tolist(), label_list)
+        label_coding = self._create_label_coding(label_list)
+
+        # sorted dictionary position -> code, NaNs land past the end
+        codes_dtype = _codes_dtype_for_num_labels(len(label_coding))
+        lut = numpy.zeros(dictionary.size + 1, dtype=codes_dtype)
+        for idx, label in enumerate(dictionary.tolist()):
+            lut[idx] = label_coding.get(label, 0)
+
+        coded_values = numpy.empty(values.shape[0], dtype=codes_dtype)
+        for chunk in chunk_slices(values.shape[0]):
+            positions = numpy.searchsorted(dictionary, read_chunk(values, chunk))
+            coded_values[chunk] = lut[positions]
+
+        self._label_coding = label_coding
         self._coded_values = coded_values
+        self._version += 1
+
+    def _encode_factorized(
+        self,
+        codes: numpy.ndarray,
+        dictionary: list,
+        label_list=None,
+    ):
+        """
+        Encode from the codes of an already factorized (dictionary encoded)
+        column: codes index into dictionary, -1 or len(dictionary) are missing.
+
+        Like for other columns, the default label list is the sorted values
+        found: declared categories that no value uses are left out and the
+        declared order is not kept.
+        """
+        # a dictionary entry might not be used by any value
+        counts = numpy.bincount(codes[codes >= 0], minlength=len(dictionary))
+        unique_labels = [
+            label for label, n in zip(dictionary, counts[: len(dictionary)]) if n
+        ]
+        label_list = self._initialize_label_list(unique_labels, label_list)
+        label_coding = self._create_label_coding(label_list)
+
+        # dictionary position -> code, the last entry (also reached by -1)
+        # is for the missing values
+        lut = numpy.zeros(
+            len(dictionary) + 1, dtype=_codes_dtype_for_num_labels(len(label_coding))
+        )
+        for idx, label in enumerate(dictionary):
+            lut[idx] = label_coding.get(label, 0)
+
+        self._label_coding = label_coding
+        self._coded_values = lut[codes]
+        self._version += 1
 
     @property
     def values(self):
-        coded_values = self._coded_values
-        label_coding = self._label_coding
-        if label_coding is None:
-            raise RuntimeError("label coding should be set, but it is not")
-        reverse_coding = {code: label for label, code in label_coding.items()}
-
-        if self._values_implementation == narwhals.Implementation.PANDAS:
-            if pandas.api.types.is_extension_array_dtype(self._native_values_dtype):
-                reverse_coding[0] = pandas.NA
-            else:
-                reverse_coding[0] = None
+        """
+        The values decoded back to the original series type and dtype.
 
-            coded_values = pandas.Series(coded_values, name=self.name)
-            values = coded_values.replace(reverse_coding).astype(
-                self._native_values_dtype
+        The decoded series is cached until the coded values or the label list
+        change.
+        """
+        cache = self._decoded_values_cache
+        if cache is None or cache[0] != self._version:
+            cache = (self._version, self._decode_values())
+            self._decoded_values_cache = cache
+        values = cache[1]
+
+        if self._values_implementation in (None, narwhals.Implementation.PANDAS):
+            # pandas series and NumPy arrays are mutable, do not hand out the
+            # cached one
+            return values.copy()
+        return values
+
+    def _decode_values(self):
+        coded_values = self._coded_values
+        label_list = self.label_list
+
+        if self._values_implementation is None:
+            # NumPy arrays have no missing values, code 0 is masked
+            labels = numpy.array(label_list)
+            if self._native_values_dtype.kind in "iuf":
+                labels = labels.astype(self._native_values_dtype)
+            lookup = numpy.zeros(labels.size + 1, dtype=labels.dtype)
+            lookup[1:] = labels
+            return numpy.ma.masked_array(lookup[coded_values], mask=coded_values == 0)
+        elif self._values_implementation == narwhals.Implementation.PANDAS:
+            # code 0 (missing) -> categorical code -1 -> NA
+            categorical = pandas.Categorical.from_codes(
+                coded_values.astype(numpy.int64) - 1, categories=label_list
             )
+            values = pandas.Series(categorical, name=self.name)
+            try:
+                values = values.astype(self._native_values_dtype)
+            except (TypeError, ValueError):
+                # the label list no longer fits the native dtype (e.g. a str
+                # label appended to int values), the values may still do
+                values = values.astype(object)
+                try:
+                    values = values.astype(self._native_values_dtype)
+                except (TypeError, ValueError):
+                    pass
+            if values.dtype == object:
+                # missing values as None, not the NaN of the categorical
+                values = values.where(coded_values != 0, None)
             return values
         else:
-            coded_values = narwhals.new_series(
-                name=self.name, values=coded_values, backend=self._values_implementation
-            )
-            reverse_coding[0] = None
-            values = coded_values.replace_strict(
-                reverse_coding, return_dtype=self._narwhals_values_dtype
+            # take from the label series, position 0 holds the missing value
+            labels = narwhals.new_series(
+                name=self.name,
+                values=[None] + label_list,
+                dtype=self._narwhals_values_dtype,
+                backend=self._values_implementation,
             )
-            return values.to_native()
+            return labels[coded_values].to_native()
 
     @property
-    def name(self) -> str:
+    def name(self) -> str | None:
         return self._name
 
     @property
@@ -242,14 +555,29 @@ class Category:
         new_label_coding = self._create_label_coding(new_labels)
 
         # --- recode values to new codes ---
+        # old code -> new code lookup table, removed labels (and 0) map to 0
         old_values = self._coded_values
-        new_values = numpy.full_like(self._coded_values, fill_value=0)
-        for label, new_code in new_label_coding.items():
-            if label in old_label_coding:
-                old_code = old_label_coding[label]
-                new_values[old_values == old_code] = new_code
-        self._coded_values = new_values
+        # the codes dtype might widen (or narrow) with the new number of labels
+        lut = numpy.zeros(
+            len(old_label_coding) + 1,
+            dtype=_codes_dtype_for_num_labels(len(new_label_coding)),
+        )
+        for label, old_code in old_label_coding.items():
+            lut[old_code] = new_label_coding.get(label, 0)
+        # labels only appended: every code keeps its label, the values (and
+        # what the frontend has of them) stay as they are
+        recoded = lut.dtype != old_values.dtype or numpy.any(
+            lut != numpy.arange(lut.size)
+        )
+        if recoded:
+            self._coded_values = lut[old_values]
+            self._pending_changes = None
         self._label_coding = new_label_coding
+        self._version += 1
+        if self._code_counts is not None:
+            counts = numpy.zeros(len(new_label_coding) + 1, dtype=numpy.int64)
+            numpy.add.at(counts, lut, self._code_counts)
+            self._code_counts = counts
 
         # --- update palette ---
         old_palette = getattr(self, "_color_palette", {}) or {}
@@ -276,8 +604,10 @@ class Category:
 
         self._color_palette = new_palette
 
-        self._notify("label_list")
-        self._notify("palette")
+        if recoded:
+            self._notify("label_list", "palette", "coded_values")
+        else:
+            self._notify("label_list", "palette")
 
     def set_coded_values(
         self,
@@ -304,11 +634,73 @@ class Category:
                 "The dtype of the new coding values does not match the one of the old ones"
             )
 
+        if self._code_counts is not None:
+            if coded_values is old_coded_values or numpy.shares_memory(
+                coded_values, old_coded_values
+            ):
+                # edited in place: the old codes are gone, count them all again
+                num_codes = self._code_counts.size
+                counts = bincount_in_chunks(coded_values, minlength=num_codes)
+                if counts.size > num_codes:
+                    raise ValueError(f"codes should be between 0 and {num_codes - 1}")
+            else:
+                counts = _recount_changed_codes(
+                    self._code_counts, old_coded_values, coded_values
+                )
+
         if not skip_copying_array:
             coded_values = coded_values.copy(order="K")
 
         self._coded_values = coded_values
+        if self._code_counts is not None:
+            self._code_counts = counts
+        self._version += 1
+        self._pending_changes = None
+        self._notify("coded_values")
+
+    def set_coded_values_at(self, indices, codes) -> CodesChange:
+        """
+        Set in place the codes of the points at indices (unique), codes being
+        one code or one per index. Only the points whose code differs are
+        written, in a single pass over the indices.
+
+        Returns the change set, also available to the subscribers as
+        last_change.
+        """
+        indices = numpy.asarray(indices)
+        if indices.ndim != 1 or (indices.size and indices.dtype.kind not in "iu"):
+            raise ValueError("indices should be a 1D array of integers")
+        values = self._coded_values
+        if indices.size and (indices.min() < 0 or indices.max() >= values.shape[0]):
+            raise ValueError(f"indices should be between 0 and {values.shape[0] - 1}")
+        codes = numpy.asarray(codes)
+        if codes.size and (codes.min() < 0 or codes.max() > len(self.label_list)):
+            raise ValueError(f"codes should be between 0 and {len(self.label_list)}")
+        codes = codes.astype(values.dtype, copy=False)
+
+        previous = values[indices]
+        changed = previous != codes
+        if codes.ndim:
+            codes = codes[changed]
+        change = CodesChange(indices[changed], previous[changed], codes)
+        if not change.indices.size:
+            return change
+
+        if not values.flags.writeable:
+            # e.g. given with set_coded_values(skip_copying_array=True)
+            values = self._coded_values = values.copy()
+        values[change.indices] = codes
+        if codes.ndim == 0:
+            change.codes = numpy.full(change.indices.size, codes)
+        counts = self._code_counts
+        if counts is not None:
+            counts -= numpy.bincount(change.previous, minlength=counts.size)
+            counts += numpy.bincount(change.codes, minlength=counts.size)
+        self._version += 1
+        if self._pending_changes is not None:
+            self._pending_changes.append(change)
         self._notify("coded_values")
+        return change
 
     @property
     def coded_values(self):
@@ -365,8 +757,134 @@ class Category:
     @property
     def num_unassigned(self) -> int:
         """Number of values unassigned / missing."""
-        coded = self._coded_values
-        return int(numpy.count_nonzero(coded == 0))
+        return int(self._count_codes()[0])
+
+    def _count_codes(self) -> numpy.ndarray:
+        # counts per code, index 0 for the unassigned values
+        if self._code_counts is None:
+            self._code_counts = bincount_in_chunks(
+                self._coded_values, minlength=len(self.label_list) + 1
+            )
+        return self._code_counts
+
+    @property
+    def code_counts(self) -> numpy.ndarray:
+        """Number of values per code, index 0 for the unassigned values."""
+        return self._count_codes().copy()
+
+    @property
+    def label_counts(self) -> dict[Any, int]:
+        """Number of values per label, in label list order."""
+        counts = self._count_codes()
+        return {label: int(counts[code]) for label, code in self.label_coding}
+
+    @property
+    def label_fractions(self) -> dict[Any, float]:
+        """Fraction of the values in each label, in label list order."""
+        num_values = max(self.num_values, 1)
+        counts = self._count_codes()
+        return {
+            label: float(counts[code]) / num_values for label, code in self.label_coding
+        }
+
+    def label_counts_at(self, indices) -> dict[Any, int]:
+        """
+        Number of the values at indices in each label, in label list order,
+        e.g. the composition of a selection.
+        """
+        counts = numpy.bincount(
+            self._coded_values[indices], minlength=len(self.label_list) + 1
+        )
+        return {label: int(counts[code]) for label, code in self.label_coding}
+
+    def label_indices(self, label) -> numpy.ndarray:
+        """
+        Sorted indices of the values in label, of the unassigned values for
+        None. A read-only view, valid until the next change.
+
+        The first call after a change sorts the values by code, the next ones
+        only slice the result.
+        """
+        if label is None:
+            code = 0
+        else:
+            code = (self._label_coding or {}).get(label)
+            if code is None:
+                raise ValueError(f"Unknown label: {label!r}")
+        cache = self._indices_by_code_cache
+        if cache is None or cache[0] != self._version:
+            # stable: the indices stay sorted within a code
+            order = numpy.argsort(self._coded_values, kind="stable")
+            order.flags.writeable = False
+            cache = (self._version, order)
+            self._indices_by_code_cache = cache
+        counts = self._count_codes()
+        start = int(counts[:code].sum())
+        return cache[1][start : start + int(counts[code])]
+
+
+def _factorize_native(native_values, values):
+    """
+    Codes and dictionary for columns that can be factorized without going
+    through Python objects per element.
+
+    Returns (codes, dictionary) or None if the column has no fast path.
+    codes is an integer array indexing dictionary, with -1 or len(dictionary)
+    for missing values.
+    """
+    implementation = values.implementation
+    dtype = values.dtype
+
+    if implementation == narwhals.Implementation.PANDAS:
+        if isinstance(native_values.dtype, pandas.CategoricalDtype):
+            # codes already exist: int8/16/32, -1 for missing
+            codes = native_values.cat.codes.to_numpy()
+            return codes, native_values.cat.categories.to_list()
+        # single hash pass, sorted so that codes follow the default label order
+        codes, uniques = pandas.factorize(native_values, sort=True)
+        return codes, uniques.tolist()
+
+    if implementation == narwhals.Implementation.POLARS:
+        import polars
+
+        if dtype == narwhals.Enum:
+            categories = native_values.dtype.categories
+        elif dtype in (narwhals.Categorical, narwhals.String):
+            # polars Categorical has no fixed categories, the ones found
+            # become an Enum whose physical codes we can use
+            categories = native_values.drop_nulls().unique().cast(polars.String).sort()
+            native_values = native_values.cast(polars.Enum(categories))
+        else:
+            return None
+        dictionary = categories.to_list()
+        codes = native_values.to_physical().fill_null(len(dictionary)).to_numpy()
+        return codes, dictionary
+
+    if (
+        implementation == narwhals.Implementation.PYARROW
+        and dtype == narwhals.Categorical
+    ):
+        import pyarrow
+        import pyarrow.compute
+
+        # a single dictionary for all the chunks
+        array = native_values
+        if isinstance(array, pyarrow.ChunkedArray):
+            array = array.unify_dictionaries().combine_chunks()
+        dictionary = array.dictionary.to_pylist()
+        codes = pyarrow.compute.fill_null(array.indices, -1).to_numpy()
+        return codes, dictionary
+
+    return None
+
+
+def _coded_values_patch_max_fraction(code_itemsize: int) -> float:
+    """
+    Fraction of changed points above which resending the whole coded_values_t
+    buffer is smaller than a patch, for codes of code_itemsize bytes (1/5 for
+    uint8, 1/3 for uint16, 1/2 for uint32).
+    """
+    return code_itemsize / (CODED_VALUES_PATCH_INDEX_BYTES + code_itemsize)
 
 
 def _esm_source() -> str | Path:
@@ -388,20 +906,59 @@ def _is_missing(value: object) -> bool:
 class Scatter3dWidget(anywidget.AnyWidget):
     _esm = _esm_source()
 
-    # xyz coords for the points
-    # Packed float32 array of shape (N, 3), row-major.
-    # TS interprets as Float32Array with length 3*N.
-    xyz_bytes_t = traitlets.Bytes(
-        default_value=b"",
+    # xyz coords for the points, in the user (x, y, z) order
+    # Packed float32 array of shape (N, 3), row-major, sent as a memoryview of
+    # the widget's own array (no bytes copy).
+    # With a preview (see max_preview_points) only every preview step-th point
+    # is sent, coded_values_t and coded_values_patch_t follow the same subset.
+    # TS interprets as Float32Array with length 3*N and maps user z to "up".
+    # With xyz_encoding_t "uint16" it holds uint16 instead, see below.
+    xyz_bytes_t = BytesLike(
         help="Packed float32 Nx3, row-major.",
     ).tag(sync=True)
 
-    # Packed uint16 array of length N.
+    # Encoding of xyz_bytes_t and of the xyz of lod_node_data_t:
+    #   - "float32": the coordinates
+    #   - "uint16": per axis, round((v - min) / (max - min) * 65535) with min
+    #     and max from xyz_bounds_t; the frontend dequantizes on the GPU.
+    xyz_encoding_t = traitlets.Enum(
+        values=[XYZ_ENCODING_FLOAT32, XYZ_ENCODING_UINT16],
+        default_value=XYZ_ENCODING_FLOAT32,
+        help="Encoding of the packed coordinates: 'float32' or 'uint16'.",
+    ).tag(sync=True)
+    # [[xmin, ymin, zmin], [xmax, ymax, zmax]] of all the points, empty for
+    # "float32"
+    xyz_bounds_t = traitlets.List(
+        traitlets.List(traitlets.Float(), minlen=3, maxlen=3),
+        default_value=[],
+        help="Bounding box the uint16 coordinates are quantized over.",
+    ).tag(sync=True)
+
+    # Packed unsigned int array of length N, dtype given by coded_values_dtype_t.
     # Code 0 means "missing / unassigned".
     # Codes 1..K correspond to labels_t[0..K-1].
-    coded_values_t = traitlets.Bytes(
+    # Sent as a memoryview of the category's codes (or of the preview's copy),
+    # so that in place edits keep it current without repacking.
+    coded_values_t = BytesLike(
         default_value=b"",
-        help="Packed uint16 length N. 0=missing, 1..K correspond to labels_t.",
+        help="Packed codes, length N. 0=missing, 1..K correspond to labels_t.",
+    ).tag(sync=True)
+
+    # Width of the codes in coded_values_t and coded_values_patch_t, the
+    # narrowest that fits the number of labels.
+    coded_values_dtype_t = traitlets.Enum(
+        values=["uint8", "uint16", "uint32"],
+        default_value="uint16",
+        help="Little-endian dtype of the packed category codes.",
+    ).tag(sync=True)
+
+    # Sparse update of coded_values_t sent after small lasso edits:
+    #   {"seq": int, "indices": packed uint32 (M,), "codes": packed codes (M,)}
+    # The frontend writes codes[i] at indices[i] into its coded_values_t buffer
+    # and recolors only those points. seq makes every patch a new value.
+    coded_values_patch_t = traitlets.Dict(
+        default_value={},
+        help="Sparse coded_values_t update: seq, uint32 indices, codes.",
     ).tag(sync=True)
 
     # List[str] of length K, stable ordering.
@@ -429,14 +986,51 @@ class Scatter3dWidget(anywidget.AnyWidget):
         help="RGB color for missing/unassigned (code 0).",
     ).tag(sync=True)
 
+    # Points shown, see the visible property: packed bits (bitorder "big")
+    # over the points sent to the frontend, empty when all are shown. With
+    # level of detail, each node carries its own mask in lod_node_data_t.
+    visible_t = traitlets.Bytes(
+        default_value=b"",
+        help="Packed mask of the points shown, bitorder='big'; empty for all.",
+    ).tag(sync=True)
+
     # --- lasso round-trip channels ---
+    # Where the lasso hit-testing happens:
+    #   - "frontend" (default): TS tests every point and sends the mask in
+    #     lasso_mask_bytes_t (or lasso_mask_t).
+    #   - "python": TS sends the NDC polygon and the camera view-projection
+    #     matrix in lasso_request_t, Python projects and tests all points.
+    #     Forced while level of detail is enabled.
+    lasso_selection_t = traitlets.Enum(
+        values=[LASSO_SELECTION_PYTHON, LASSO_SELECTION_FRONTEND],
+        default_value=LASSO_SELECTION_FRONTEND,
+        help="Where lasso hit-testing is done: 'python' or 'frontend'.",
+    ).tag(sync=True)
     # Dict message TS -> Python describing a committed lasso operation.
     lasso_request_t = traitlets.Dict(default_value={}).tag(sync=True)
-    # Packed bitmask encoded as base64 string (JSON-friendly).
+    # Packed bitmask sent as a binary buffer (no base64 round-trip); comm
+    # buffers arrive as memoryviews.
+    lasso_mask_bytes_t = BytesLike(
+        default_value=b"",
+        help="Packed lasso bitmask, bitorder='big', length ceil(N/8).",
+    ).tag(sync=True)
+    # Packed bitmask encoded as base64 string, fallback for older frontends.
     lasso_mask_t = traitlets.Unicode(default_value="").tag(sync=True)
-    # Dict message Python -> TS acknowledging the last request (ok/error).
+    # Dict message Python -> TS acknowledging the last request (ok/error,
+    # "pending" first when lasso requests are processed asynchronously).
+    # "ok" results include the labels of the selected points before the edit:
+    # "selected_label_counts" {label: count} and "selected_unassigned".
     lasso_result_t = traitlets.Dict(default_value={}).tag(sync=True)
 
+    # --- edit history (see undo and redo) ---
+    # TS -> Python: {"request_id", "action": "undo" | "redo"}
+    history_request_t = traitlets.Dict(default_value={}).tag(sync=True)
+    # Python -> TS: number of edits that can be undone and redone
+    history_t = traitlets.Dict(
+        default_value={"num_undo": 0, "num_redo": 0},
+        help="{'num_undo', 'num_redo'}: edits that can be undone and redone.",
+    ).tag(sync=True)
+
     point_size_t = traitlets.Float(
         default_value=DEFAULT_POINT_SIZE,
         help="Point size for rendering (three.js PointsMaterial.size).",
@@ -446,12 +1040,82 @@ class Scatter3dWidget(anywidget.AnyWidget):
         default_value=DEFAULT_AXIS_LABEL_SIZE,
     ).tag(sync=True)
 
+    # --- level of detail (see enable_lod) ---
+    # Octree nodes, indexed by id, empty when disabled:
+    #   [{"id", "parent", "level", "min": [x, y, z], "max": [x, y, z], "count"}]
+    # The frontend picks the nodes to show from the camera and requests them.
+    lod_nodes_t = traitlets.List(traitlets.Dict(), default_value=[]).tag(sync=True)
+    lod_point_budget_t = traitlets.Int(
+        default_value=DEFAULT_LOD_POINT_BUDGET,
+        help="Maximum number of points the frontend keeps loaded.",
+    ).tag(sync=True)
+    # TS -> Python: {"seq", "nodes": ids to send, "loaded": ids already shown}
+    lod_request_t = traitlets.Dict(default_value={}).tag(sync=True)
+    # Python -> TS, one message per node:
+    #   {"seq", "node", "xyz": packed (M, 3) in xyz_encoding_t, "codes": (M,),
+    #    "visible": packed mask (M,)}
+    # xyz is absent when only the codes of a shown node changed, visible
+    # when all the points are shown.
+    lod_node_data_t = traitlets.Dict(default_value={}).tag(sync=True)
+
+    # --- chunked transfers of xyz_bytes_t and coded_values_t ---
+    # Buffers larger than transfer_chunk_bytes are sent in chunks, their
+    # traitlet is then left empty. Per kind ("xyz", "codes"), the current
+    # transfer: {"transfer", "kind", "total_bytes", "chunk_bytes", "num_chunks"}
+    transfer_t = traitlets.Dict(default_value={}).tag(sync=True)
+    # Python -> TS: {"transfer", "kind", "seq", "offset", "data": bytes}
+    transfer_chunk_t = traitlets.Dict(default_value={}).tag(sync=True)
+    # TS -> Python: {"transfer", "kind", "received": number of chunks} or
+    # {"kind", "restart": true} from a frontend that missed the chunks
+    transfer_ack_t = traitlets.Dict(default_value={}).tag(sync=True)
+
+    # Set by enable_stats(); asks the frontend to report its timings in
+    # lasso_request_t["timings"].
+    collect_stats_t = traitlets.Bool(default_value=False).tag(sync=True)
+
     show_axes_t = traitlets.Bool(
         default_value=True,
         help=("Whether to draw axis lines (X, Y, Z) from the origin (0,0,0)."),
     ).tag(sync=True)
 
-    def __init__(self, xyz: numpy.ndarray, category: Category):
+    # WidgetStats when enabled, set before super().__init__() sends anything
+    _stats: WidgetStats | None = None
+
+    def __init__(
+        self,
+        xyz: numpy.ndarray,
+        category: Category,
+        max_preview_points: int | None = None,
+        transfer_chunk_bytes: int | None = None,
+        xyz_encoding: str = XYZ_ENCODING_FLOAT32,
+        history_max_bytes: int = DEFAULT_HISTORY_MAX_BYTES,
+        lasso_async: bool = False,
+    ):
+        """
+        xyz can be an out-of-core array (numpy.memmap, h5py or zarr array...),
+        it is then read in chunks and never loaded in full.
+
+        Only max_preview_points evenly strided points are sent to the
+        frontend, by default all of them for in-memory coordinates and
+        MAX_PREVIEW_POINTS for out-of-core ones. Lasso edits done in Python
+        (lasso_selection "python") select among all the points, frontend
+        lasso masks only cover the preview.
+
+        With transfer_chunk_bytes (e.g. transfer.DEFAULT_TRANSFER_CHUNK_BYTES)
+        the coordinates and codes larger than that are sent in acknowledged
+        chunks, and are then not part of the saved widget state. None, the
+        default, sends them in a single message.
+
+        xyz_encoding "uint16" sends the coordinates quantized to 16 bits over
+        their bounding box, half the size of "float32". Only the display is
+        affected: xyz, lasso edits and statistics keep the full precision.
+
+        Edits (lasso, edit_points, propagate_labels) can be undone while the
+        history of their changes fits in history_max_bytes, 0 disables it.
+
+        With lasso_async, the lasso requests of the frontend are applied on a
+        worker thread, see the lasso_async property.
+        """
         super().__init__()
         self._category_cb_id: int | None = None
 
@@ -464,26 +1128,133 @@ class Scatter3dWidget(anywidget.AnyWidget):
         # Keep a stable callback object so unsubscribe works.
         self._category_cb = self._on_category_changed
 
+        self._coded_values_patch_seq = count(1)
+        # the codes viewed by coded_values_t when they are not the category's
+        # own (preview, byte order), updated by the patches
+        self._sent_codes: numpy.ndarray | None = None
+
+        # level of detail, see enable_lod
+        self._octree: Octree | None = None
+        self._lod_loaded: set[int] = set()
+        self._lod_seq = count(1)
+        # restored by disable_lod
+        self._lasso_selection_before_lod = LASSO_SELECTION_FRONTEND
+
+        if max_preview_points is not None and max_preview_points <= 0:
+            raise ValueError("max_preview_points should be a positive integer")
+        self._max_preview_points = max_preview_points
+        # every _preview_step-th point is sent to the frontend
+        self._preview_step = 1
+
+        self._transfer_chunk_bytes = transfer_chunk_bytes
+        self._transfers: dict[str, ChunkedTransfer] = {}
+        self._transfer_ids = count(1)
+        # nesting of hold_sync, the chunks are sent when it reaches 0
+        self._hold_sync_depth = 0
+
+        self._check_xyz_encoding(xyz_encoding)
+        self._xyz_encoding = xyz_encoding
+        # per axis (min, max) of the points, computed when quantizing
+        self._xyz_bounds: tuple[numpy.ndarray, numpy.ndarray] | None = None
+        # built on the first spatial query, see spatial_index
+        self._spatial_index: GridIndex | None = None
+        # points shown, None for all of them, see visible
+        self._visible: Selection | None = None
+
+        # edits that can be undone, valid for the category version below
+        self._history = EditHistory(history_max_bytes)
+        self._history_version: int | None = None
+        # set while an edit of the widget updates the category
+        self._committing_edit = False
+
+        # Serializes the edits and the syncs they trigger between the kernel
+        # thread and the lasso worker thread.
+        self._lock = threading.RLock()
+        self._lasso_worker: CoalescingWorker | None = None
+        # lasso_result_t is set from both, never held during an edit
+        self._lasso_result_lock = threading.Lock()
+
         self._xyz = None
         self._category = None
         self.xyz = xyz
         self.category = category
+        self.lasso_async = lasso_async
 
-    def _on_category_changed(self, category: Category, event: str) -> None:
+    def _on_category_changed(self, category: Category, events: frozenset[str]) -> None:
         """
         Called when Category mutates.
         """
         # Sanity: ignore stale callbacks (if category replaced)
         if category is not self._category:
             return
-        self._sync_traitlets_from_category()
+        with self._lock:
+            self._sync_category_change(category, events)
+
+    def _sync_category_change(self, category: Category, events: frozenset[str]) -> None:
+        if not self._committing_edit:
+            self._check_history()
+        codes_transfer = self._transfers.get("codes")
+        change = category.last_change
+        max_patch_fraction = _coded_values_patch_max_fraction(
+            category.coded_values.dtype.itemsize
+        )
+        if (
+            events == {"coded_values"}
+            and change is not None
+            # Small edits are sent to the frontend as a patch, large ones as
+            # a full coded_values_t resync.
+            and change.indices.size <= max_patch_fraction * self.num_points
+            # a patch would be overwritten by the chunks still to come
+            and (codes_transfer is None or codes_transfer.is_complete)
+        ):
+            self._send_coded_values_patch(change.indices)
+        else:
+            self._sync_traitlets_from_category(events)
+
+    def _send_coded_values_patch(self, indices: numpy.ndarray) -> None:
+        """
+        Send only the codes at indices to the frontend through
+        coded_values_patch_t.
+
+        coded_values_t views the codes (see _codes_bytes), so a reconnecting
+        frontend gets the current state without repacking all of them: only
+        a copy made for the preview is updated, at the patched positions.
+        """
+        if self._category is None:
+            raise RuntimeError("The category should be set")
+        coded = self._category.coded_values
+
+        if self._octree is not None:
+            # only the shown octree nodes with changed points
+            self._send_lod_nodes(
+                self._octree.nodes_containing(indices, self._lod_loaded),
+                with_xyz=False,
+            )
+            return
+
+        step = self._preview_step
+        if step != 1:
+            # only the points in the preview, at their position in it
+            indices = indices[indices % step == 0]
+            if not indices.size:
+                return
+        positions = numpy.asarray(indices // step, dtype=numpy.uint32)
+        codes = coded[indices]
+        if self._sent_codes is not None:
+            self._sent_codes[positions] = codes
+        self.coded_values_patch_t = {
+            "seq": next(self._coded_values_patch_seq),
+            "indices": positions.tobytes(order="C"),
+            "codes": self._pack_codes_c(codes),
+        }
 
     @staticmethod
-    def _pack_xyz_float32_c(xyz: numpy.ndarray) -> tuple[numpy.ndarray, bytes]:
+    def _pack_xyz_float32_c(xyz: numpy.ndarray) -> tuple[numpy.ndarray, memoryview]:
         """
         Return (xyz_float32_c, packed_bytes).
-        - xyz_float32_c: float32, C-contiguous, shape (N,3)
-        - packed_bytes: xyz_float32_c.tobytes(order="C")
+        - xyz_float32_c: float32, C-contiguous, shape (N,3), owned by the widget
+          (a copy, the caller's array is never mutated nor shared) and read-only
+        - packed_bytes: flat byte memoryview over xyz_float32_c, no extra copy
         """
         if not isinstance(xyz, numpy.ndarray):
             raise ValueError("xyz should be a numpy array")
@@ -491,77 +1262,290 @@ class Scatter3dWidget(anywidget.AnyWidget):
         if xyz.ndim != 2 or xyz.shape[1] != 3:
             raise ValueError("xyz should have shape (N, 3)")
 
-        # Convert dtype to float32 (TS expects Float32Array)
-        # Ensure row-major contiguous layout for stable tobytes.
-        xyz_f32 = numpy.asarray(xyz, dtype=numpy.float32, order="C")
-        if not xyz_f32.flags["C_CONTIGUOUS"]:
-            xyz_f32 = numpy.ascontiguousarray(xyz_f32)
+        # Convert dtype to float32 (TS expects Float32Array) in a single copy,
+        # row-major so that the bytes are x0,y0,z0,x1,...
+        xyz_f32 = numpy.array(xyz, dtype=numpy.float32, order="C", copy=True)
+        xyz_f32.flags.writeable = False
+
+        return xyz_f32, memoryview(xyz_f32).cast("B")
 
-        # Remap (x,y,z) -> (x,z,y) so that "z" in user data becomes "up" (Y) in Three.js
-        # avoid mutating caller's array if it was already float32 C
-        # xyz_f32 = xyz_f32.copy()
-        xyz_f32[:, [1, 2]] = xyz_f32[:, [2, 1]]
+    @staticmethod
+    def _pack_xyz_uint16_c(
+        xyz, bounds: tuple[numpy.ndarray, numpy.ndarray]
+    ) -> memoryview:
+        """
+        Packed little-endian uint16 (N, 3) coordinates, quantized per axis
+        over bounds (min, max): 0 is min and QUANTIZED_XYZ_MAX is max.
+        """
+        lo, hi = bounds
+        extent = hi - lo
+        # a flat axis is all 0
+        scale = numpy.divide(
+            QUANTIZED_XYZ_MAX, extent, out=numpy.zeros(3), where=extent > 0
+        )
+        packed = numpy.empty((xyz.shape[0], 3), dtype="<u2")
+        for chunk in chunk_slices(xyz.shape[0]):
+            values = (read_chunk(xyz, chunk) - lo) * scale
+            numpy.rint(values, out=values)
+            numpy.clip(values, 0, QUANTIZED_XYZ_MAX, out=values)
+            packed[chunk] = values
+        return memoryview(packed).cast("B")
+
+    def _get_xyz_bounds(self) -> tuple[numpy.ndarray, numpy.ndarray]:
+        if self._xyz_bounds is None:
+            lo, hi = bounds_in_chunks(self._xyz)
+            if not (numpy.all(numpy.isfinite(lo)) and numpy.all(numpy.isfinite(hi))):
+                raise ValueError(
+                    "xyz should only contain finite values to be quantized"
+                )
+            self._xyz_bounds = lo, hi
+        return self._xyz_bounds
 
-        return xyz_f32, xyz_f32.tobytes(order="C")
+    def _pack_xyz_for_frontend(self, xyz) -> memoryview:
+        """Packed coordinates of some of the points, in xyz_encoding."""
+        if self._xyz_encoding == XYZ_ENCODING_UINT16:
+            return self._pack_xyz_uint16_c(xyz, self._get_xyz_bounds())
+        _, xyz_bytes = self._pack_xyz_float32_c(numpy.asarray(xyz))
+        return xyz_bytes
 
     def _get_xyz(self) -> numpy.ndarray:
+        """
+        Read-only view of the float32 coordinates held by the widget, or the
+        out-of-core array given.
+        """
         if self._xyz is None:
             raise RuntimeError("xyz has not been set")
-        out = self._xyz.copy()
-        out[:, [1, 2]] = out[:, [2, 1]]
-        return self._xyz.copy()
+        if isinstance(self._xyz, numpy.ndarray):
+            return self._xyz.view()
+        return self._xyz
 
     def _set_xyz(self, xyz: numpy.ndarray) -> None:
-        xyz_f32, xyz_bytes = self._pack_xyz_float32_c(xyz)
+        max_preview_points = self._max_preview_points
+        out_of_core = is_out_of_core(xyz)
+        if out_of_core:
+            # kept where it is, only the preview is read
+            if len(xyz.shape) != 2 or xyz.shape[1] != 3:
+                raise ValueError("xyz should have shape (N, 3)")
+            if max_preview_points is None:
+                max_preview_points = MAX_PREVIEW_POINTS
+        else:
+            xyz, _ = self._pack_xyz_float32_c(xyz)
+        num_points = xyz.shape[0]
 
         # If category already set, enforce N consistency
-        if self._category is not None and xyz_f32.shape[0] != self.category.num_values:
+        if self._category is not None and num_points != self.category.num_values:
             raise ValueError(
-                f"The number of points ({xyz_f32.shape[0]}) should match "
+                f"The number of points ({num_points}) should match "
                 f"the number of values in the category: {self.category.num_values}"
             )
 
-        self._xyz = xyz_f32
-        self.xyz_bytes_t = xyz_bytes
+        self._xyz = xyz
+        self._xyz_bounds = None
+        self._spatial_index = None
+        if self._visible is not None and self._visible.num_points != num_points:
+            self._visible = None
+        self._preview_step = decimation_step(num_points, max_preview_points)
+        if self._octree is None:
+            with self.hold_sync():
+                self._sync_xyz_encoding()
+                self._set_buffer("xyz", self._xyz_bytes())
+                self.visible_t = self._visible_bytes()
+            self._send_transfer_chunks()
+        else:
+            # the octree is rebuilt for the new points
+            self.enable_lod(self._octree.points_per_node, self.lod_point_budget_t)
 
     xyz = property(_get_xyz, _set_xyz)
 
-    @staticmethod
-    def _pack_u16_c(arr: numpy.ndarray) -> bytes:
-        arr_u16 = numpy.asarray(arr, dtype=numpy.uint16, order="C")
-        if not arr_u16.flags["C_CONTIGUOUS"]:
-            arr_u16 = numpy.ascontiguousarray(arr_u16)
-        return arr_u16.tobytes(order="C")
+    def _check_xyz_encoding(self, value: str) -> None:
+        if value not in (XYZ_ENCODING_FLOAT32, XYZ_ENCODING_UINT16):
+            raise ValueError(
+                f"xyz_encoding should be {XYZ_ENCODING_FLOAT32!r} or {XYZ_ENCODING_UINT16!r}, got {value!r}"
+            )
+
+    def _get_xyz_encoding(self) -> str:
+        return self._xyz_encoding
+
+    def _set_xyz_encoding(self, value: str) -> None:
+        self._check_xyz_encoding(value)
+        if value == self._xyz_encoding:
+            return
+        self._xyz_encoding = value
+        with self.hold_sync():
+            self._sync_xyz_encoding()
+            if self._octree is None:
+                self._set_buffer("xyz", self._xyz_bytes())
+        if self._octree is not None:
+            self._send_lod_nodes(sorted(self._lod_loaded))
+        self._send_transfer_chunks()
+
+    xyz_encoding = property(_get_xyz_encoding, _set_xyz_encoding)
+
+    def _sync_xyz_encoding(self) -> None:
+        self.xyz_encoding_t = self._xyz_encoding
+        if self._xyz_encoding == XYZ_ENCODING_UINT16:
+            self.xyz_bounds_t = [b.tolist() for b in self._get_xyz_bounds()]
+        else:
+            self.xyz_bounds_t = []
+
+    def _xyz_bytes(self):
+        """The packed coordinates of the points sent to the frontend."""
+        xyz = self._xyz
+        step = self._preview_step
+        if (
+            step == 1
+            and self._xyz_encoding == XYZ_ENCODING_FLOAT32
+            and isinstance(xyz, numpy.ndarray)
+            and not is_out_of_core(xyz)
+        ):
+            # the widget's own float32 copy, no extra copy
+            return memoryview(xyz).cast("B")
+        if step == 1:
+            return self._pack_xyz_for_frontend(xyz)
+        return self._pack_xyz_for_frontend(numpy.asarray(xyz[::step]))
+
+    def _codes_bytes(self) -> memoryview:
+        """
+        The packed codes of the points sent to the frontend: a view of the
+        category's codes when all of them are sent as they are, so that in
+        place edits keep it current, otherwise of a copy in _sent_codes.
+        """
+        if self._category is None:
+            raise RuntimeError("The category should be set")
+        coded = self._category.coded_values
+        dtype = coded.dtype.newbyteorder("<")
+        step = self._preview_step
+        if step == 1 and coded.dtype == dtype and coded.flags.c_contiguous:
+            self._sent_codes = None
+            return memoryview(coded.view(numpy.uint8))
+        self._sent_codes = numpy.ascontiguousarray(coded[::step], dtype=dtype)
+        return memoryview(self._sent_codes.view(numpy.uint8))
+
+    def _set_buffer(self, kind: str, data) -> None:
+        """
+        Sync a packed buffer (see TRANSFER_TRAITS) in its traitlet, or start
+        a chunked transfer if it is larger than transfer_chunk_bytes.
 
-    def _sync_traitlets_from_category(self) -> None:
+        The chunks are sent by _send_transfer_chunks().
+        """
+        transfers = dict(self.transfer_t)
+        chunk_bytes = self._transfer_chunk_bytes
+        with self.hold_sync():
+            if chunk_bytes is None or memoryview(data).nbytes <= chunk_bytes:
+                self._transfers.pop(kind, None)
+                transfers.pop(kind, None)
+                if isinstance(data, memoryview):
+                    # a view of a buffer edited in place since it was synced
+                    # compares equal to the trait value and would not be sent
+                    setattr(self, TRANSFER_TRAITS[kind], b"")
+                setattr(self, TRANSFER_TRAITS[kind], data)
+            else:
+                transfer = ChunkedTransfer(
+                    next(self._transfer_ids), kind, data, chunk_bytes
+                )
+                self._transfers[kind] = transfer
+                transfers[kind] = transfer.header()
+                setattr(self, TRANSFER_TRAITS[kind], b"")
+            self.transfer_t = transfers
+
+    @contextmanager
+    def hold_sync(self):
+        """
+        Hold syncing any state until the outermost context manager exits, the
+        transfer chunks are sent after it.
+        """
+        self._hold_sync_depth += 1
+        try:
+            with super().hold_sync():
+                yield
+        finally:
+            self._hold_sync_depth -= 1
+        if self._hold_sync_depth == 0:
+            self._send_transfer_chunks()
+
+    def _send_transfer_chunks(self) -> None:
+        if self._hold_sync_depth:
+            # every chunk needs its own message, hold_sync would only send
+            # the last one: they are sent when it exits
+            return
+        for transfer in list(self._transfers.values()):
+            for chunk in transfer.next_chunks():
+                self.transfer_chunk_t = chunk
+
+    @traitlets.observe("transfer_ack_t")
+    def _on_transfer_ack_t(self, change) -> None:
+        ack = change.get("new", {})
+        kind = ack.get("kind")
+        with self._lock:
+            transfer = self._transfers.get(kind)
+            if transfer is None:
+                return
+            if ack.get("restart"):
+                # resend the current state
+                if kind == "xyz":
+                    self._set_buffer(kind, self._xyz_bytes())
+                else:
+                    self._set_buffer(kind, self._codes_bytes())
+            elif ack.get("transfer") == transfer.transfer_id:
+                transfer.ack(int(ack.get("received", 0)))
+            self._send_transfer_chunks()
+
+    @staticmethod
+    def _pack_codes_c(arr: numpy.ndarray) -> bytes:
+        # keep the width, just make it little-endian and C-contiguous
+        arr_le = numpy.asarray(arr, dtype=arr.dtype.newbyteorder("<"), order="C")
+        if not arr_le.flags["C_CONTIGUOUS"]:
+            arr_le = numpy.ascontiguousarray(arr_le)
+        return arr_le.tobytes(order="C")
+
+    def _sync_traitlets_from_category(
+        self, events: frozenset[str] = CATEGORY_EVENTS
+    ) -> None:
         """
         Push the Category state into synced transport traitlets.
+        Only the traitlets affected by the given Category events are updated,
+        all of them by default.
         Assumes self._xyz and self._category are both set and consistent in length.
         """
         if self._category is None:
             raise RuntimeError("The category should be set")
 
         cat = self._category
+        label_list_changed = "label_list" in events
+
+        # one comm message for all the traitlets
+        with self.hold_sync():
+            if label_list_changed:
+                # labels_t must be JSON-friendly; enforce str
+                labels = [str(lbl) for lbl in cat.label_list]
+                self.labels_t = labels
+
+            # a new label list that recodes the values notifies coded_values
+            if "coded_values" in events:
+                # coded values: uint8/16/32 bytes, length N
+                coded = cat.coded_values
+                if coded.shape[0] != self.num_points:
+                    raise RuntimeError(
+                        f"Category has {coded.shape[0]} values but xyz has {self.num_points} points"
+                    )
+                self.coded_values_dtype_t = coded.dtype.name
+                if self._octree is None:
+                    self._set_buffer("codes", self._codes_bytes())
 
-        # labels_t must be JSON-friendly; enforce str
-        labels = [str(lbl) for lbl in cat.label_list]
-        self.labels_t = labels
+            if label_list_changed or "palette" in events:
+                # colors aligned with labels order
+                # Category stores palette keyed by original labels; we reconstruct in label_list order.
+                palette = cat.color_palette  # label -> (r,g,b)
+                self.colors_t = [
+                    list(map(float, palette[lbl])) for lbl in cat.label_list
+                ]
 
-        # coded values: uint16 bytes, length N
-        coded = cat.coded_values
-        if coded.shape[0] != self.num_points:
-            raise RuntimeError(
-                f"Category has {coded.shape[0]} values but xyz has {self.num_points} points"
-            )
-        self.coded_values_t = self._pack_u16_c(coded)
+                # missing color
+                self.missing_color_t = list(map(float, cat.missing_color))
 
-        # colors aligned with labels order
-        # Category stores palette keyed by original labels; we reconstruct in label_list order.
-        palette = cat.color_palette  # label -> (r,g,b)
-        self.colors_t = [list(map(float, palette[lbl])) for lbl in cat.label_list]
-
-        # missing color
-        self.missing_color_t = list(map(float, cat.missing_color))
+        if self._octree is not None and "coded_values" in events:
+            self._send_lod_nodes(sorted(self._lod_loaded), with_xyz=False)
+        self._send_transfer_chunks()
 
     def _get_category(self):
         return self._category
@@ -576,17 +1560,158 @@ class Scatter3dWidget(anywidget.AnyWidget):
             self._category.unsubscribe(self._category_cb_id)
 
         self._category = category
+        self.clear_history()
         # Subscribe to new category
-        self._category_cb_id = category.subscribe(self._on_category_changed)
+        self._category_cb_id = category.subscribe_batched(self._on_category_changed)
         self._sync_traitlets_from_category()
 
     category = property(_get_category, _set_category)
 
     @property
     def num_points(self):
-        return self.xyz.shape[0]
+        if self._xyz is None:
+            raise RuntimeError("xyz has not been set")
+        return self._xyz.shape[0]
+
+    @property
+    def preview_indices(self) -> numpy.ndarray | None:
+        """
+        Indices of the points sent to the frontend, None if all of them are.
+        """
+        if self._preview_step == 1:
+            return None
+        return numpy.arange(0, self.num_points, self._preview_step)
+
+    def enable_lod(
+        self,
+        points_per_node: int = DEFAULT_POINTS_PER_NODE,
+        point_budget: int = DEFAULT_LOD_POINT_BUDGET,
+    ) -> None:
+        """
+        Stream the points with level of detail instead of sending them all.
+
+        An octree is built over the points. Its root, a coarse subsampling
+        of the whole cloud, is sent right away, finer nodes are sent as the
+        frontend requests them for the current view, keeping at most
+        point_budget points loaded. Lasso hit-testing is done in Python on
+        all the points, until disable_lod.
+        """
+        if self._xyz is None:
+            raise RuntimeError("xyz has not been set")
+        if point_budget <= 0:
+            raise ValueError("point_budget should be a positive integer")
+        octree = Octree(self._xyz, points_per_node=points_per_node)
+
+        if self._octree is None:
+            self._lasso_selection_before_lod = self.lasso_selection_t
+        self._octree = octree
+        self._lod_loaded = set()
+        with self.hold_sync():
+            # the frontend only has the loaded nodes, it cannot hit-test
+            self.lasso_selection_t = LASSO_SELECTION_PYTHON
+            self.lod_point_budget_t = point_budget
+            self.lod_nodes_t = octree.node_info()
+            self._sync_xyz_encoding()
+            self._set_buffer("xyz", b"")
+            self._set_buffer("codes", b"")
+            self.visible_t = b""
+        # coarse level first, for an immediate first frame
+        self._lod_loaded.add(octree.root.node_id)
+        self._send_lod_nodes([octree.root.node_id])
+
+    def disable_lod(self) -> None:
+        """Go back to sending all the points (or the preview) at once."""
+        if self._octree is None:
+            return
+        self._octree = None
+        self._lod_loaded = set()
+        self.lod_nodes_t = []
+        with self.hold_sync():
+            self.lasso_selection_t = self._lasso_selection_before_lod
+            self._set_buffer("xyz", self._xyz_bytes())
+            self.visible_t = self._visible_bytes()
+        self._sync_traitlets_from_category(frozenset(["coded_values"]))
+
+    @property
+    def lod_enabled(self) -> bool:
+        return self._octree is not None
+
+    def _send_lod_nodes(self, node_ids: list[int], with_xyz: bool = True) -> None:
+        """Send the points (or only the codes) of octree nodes."""
+        octree = self._octree
+        if octree is None or self._category is None:
+            return
+        coded = self._category.coded_values
+        for node_id in node_ids:
+            indices = octree.nodes[node_id].indices
+            data: dict[str, Any] = {
+                "seq": next(self._lod_seq),
+                "node": node_id,
+                "codes": self._pack_codes_c(coded[indices]),
+            }
+            if with_xyz:
+                data["xyz"] = self._pack_xyz_for_frontend(
+                    numpy.asarray(self._xyz[indices])
+                )
+            if self._visible is not None:
+                data["visible"] = numpy.packbits(
+                    self._visible.contains(indices), bitorder="big"
+                ).tobytes()
+            self.lod_node_data_t = data
+
+    @traitlets.observe("lod_request_t")
+    def _on_lod_request_t(self, change) -> None:
+        req = change.get("new", {})
+        octree = self._octree
+        if not req or octree is None:
+            return
+        num_nodes = len(octree)
+        node_ids = [int(i) for i in req.get("nodes", []) if 0 <= int(i) < num_nodes]
+        loaded = {int(i) for i in req.get("loaded", []) if 0 <= int(i) < num_nodes}
+        with self._lock:
+            self._lod_loaded = loaded.union(node_ids)
+            self._send_lod_nodes(node_ids)
+
+    def enable_stats(
+        self,
+        window: int = DEFAULT_STATS_WINDOW,
+        callback: StatsCallback | None = None,
+    ) -> None:
+        """
+        Start recording lasso request timings and the bytes sent per trait.
+
+        The last `window` lasso requests are kept, callback (if given) is
+        called with the record of every lasso request.
+        """
+        self._stats = WidgetStats(window=window, callback=callback)
+        self.collect_stats_t = True
+
+    def disable_stats(self) -> None:
+        self._stats = None
+        self.collect_stats_t = False
+
+    @property
+    def stats(self) -> dict[str, Any] | None:
+        """
+        Recorded stats, None unless enable_stats() was called.
+
+        lasso_requests holds one record per request with the Python timings
+        in seconds (mask_s: mask decoding or lasso hit-testing, apply_s: edit
+        of the codes, sync_s: traitlets sync, total_s), the bytes sent and
+        the timings reported by the frontend (frontend_timings, in ms).
+        """
+        if self._stats is None:
+            return None
+        return self._stats.as_dict()
+
+    def _send(self, msg, buffers=None):
+        stats = self._stats
+        if stats is not None and msg.get("method") == "update":
+            stats.record_message(msg, buffers)
+        super()._send(msg, buffers=buffers)
 
     def close(self):
+        self.lasso_async = False
         # detach callback to avoid keeping references around.
         if self._category is not None and self._category_cb_id is not None:
             self._category.unsubscribe(self._category_cb_id)
@@ -597,17 +1722,19 @@ class Scatter3dWidget(anywidget.AnyWidget):
         # labels_t[i] -> code i+1
         return {lbl: i + 1 for i, lbl in enumerate(self.labels_t)}
 
-    def _unpack_mask(self, mask_payload) -> numpy.ndarray:
+    def _unpack_mask_indices(self, mask_payload) -> numpy.ndarray:
         """
-        Returns boolean mask of length N (num_points).
-        Expects packed bits, bitorder='big', length >= ceil(N/8).
+        Returns the sorted indices of the points selected by a packed mask.
+        Expects packed bits, bitorder='big', one bit per point sent to the
+        frontend (the preview points), length >= ceil(N_sent/8).
 
         mask_payload may be:
-          - base64 str (from frontend via JSON), or
-          - bytes/bytearray (if a binary channel is used)
+          - bytes/bytearray/memoryview (binary channel, read without copying), or
+          - base64 str (fallback for frontends that send JSON only)
         """
 
-        n = self.num_points
+        step = self._preview_step
+        n = -(-self.num_points // step)
         needed = (n + 7) // 8
 
         if isinstance(mask_payload, str):
@@ -615,69 +1742,525 @@ class Scatter3dWidget(anywidget.AnyWidget):
             if mask_payload == "":
                 raise ValueError("lasso_mask_t is empty")
             mask_bytes = base64.b64decode(mask_payload)
-        elif isinstance(mask_payload, (bytes, bytearray)):
-            mask_bytes = bytes(mask_payload)
+        elif isinstance(mask_payload, (bytes, bytearray, memoryview)):
+            mask_bytes = mask_payload
         else:
             raise ValueError(
-                f"lasso_mask_t must be base64 str or bytes, got {type(mask_payload)}"
+                f"lasso mask must be bytes or base64 str, got {type(mask_payload)}"
             )
 
         if len(mask_bytes) < needed:
             raise ValueError(
-                f"lasso_mask_t too short: got {len(mask_bytes)} bytes, need {needed} for N={n}"
+                f"lasso mask too short: got {len(mask_bytes)} bytes, need {needed} for N={n}"
             )
 
-        b = numpy.frombuffer(mask_bytes, dtype=numpy.uint8, count=needed)
-        bits = numpy.unpackbits(b, bitorder="big")
-        return bits[:n].astype(bool, copy=False)
+        # positions in the preview
+        positions = indices_from_packed_mask(mask_bytes, n)
+        return positions * step if step != 1 else positions
 
-    def _apply_lasso_mask_edit(self, op: str, code: int, mask: numpy.ndarray) -> int:
+    def _lasso_mask_payload(self, req: dict):
         """
-        Apply add/remove using a boolean mask of length N.
-        Returns number of points actually changed.
+        The packed mask sent by the frontend for a lasso request: from
+        lasso_mask_bytes_t when the request has mask_channel="bytes", from the
+        base64 lasso_mask_t otherwise. None for polygon requests.
+        """
+        if req.get("polygon_ndc") is not None:
+            return None
+        if req.get("mask_channel") == "bytes":
+            return self.lasso_mask_bytes_t
+        return self.lasso_mask_t
+
+    def _lasso_indices_from_request(self, req: dict, mask_payload) -> numpy.ndarray:
+        """
+        Sorted indices of the visible points selected by a lasso request.
+
+        If the request carries the lasso polygon (NDC) and the camera
+        view-projection matrix the points are projected and tested here,
+        otherwise mask_payload, see _lasso_mask_payload, is used.
+        """
+        polygon_ndc = req.get("polygon_ndc")
+        if polygon_ndc is None:
+            indices = self._unpack_mask_indices(mask_payload)
+        else:
+            view_projection = req.get("view_projection")
+            if view_projection is None:
+                raise ValueError(
+                    "Missing field: view_projection (required with polygon_ndc)"
+                )
+            if self._xyz is None:
+                raise RuntimeError("xyz has not been set")
+            indices = select_point_indices_in_lasso(
+                self._xyz, polygon_ndc, view_projection
+            )
+        # hidden points are never selected
+        if self._visible is not None:
+            indices = indices[self._visible.contains(indices)]
+        return indices
+
+    @property
+    def spatial_index(self) -> GridIndex:
+        """
+        Grid index over the coordinates, built on first use and rebuilt
+        after xyz is set.
+        """
+        if self._xyz is None:
+            raise RuntimeError("xyz has not been set")
+        if self._spatial_index is None:
+            self._spatial_index = GridIndex(self._xyz)
+        return self._spatial_index
+
+    def _query_result(self, indices: numpy.ndarray, packed: bool):
+        if not packed:
+            return indices
+        return Selection.from_indices(indices, self.num_points).tobytes()
+
+    def points_in_box(self, box_min, box_max, packed: bool = False):
+        """
+        The points inside the axis-aligned box [box_min, box_max]: their
+        sorted indices, or with packed=True a packed mask over all the points
+        (bitorder "big", like lasso masks).
+        """
+        return self._query_result(
+            self.spatial_index.query_box(box_min, box_max), packed
+        )
+
+    def points_in_sphere(self, center, radius: float, packed: bool = False):
+        """The points within radius of center, see points_in_box."""
+        return self._query_result(
+            self.spatial_index.query_sphere(center, radius), packed
+        )
+
+    def points_near(self, centers, radius: float, packed: bool = False):
+        """
+        The points within radius of any of the (M, 3) centers, see
+        points_in_box.
+        """
+        return self._query_result(
+            self.spatial_index.query_radius(centers, radius), packed
+        )
+
+    def _indices_from_points(self, points) -> numpy.ndarray:
+        """
+        Sorted unique indices from point indices, a boolean mask, a packed
+        mask or a Selection over all the points.
+        """
+        n = self.num_points
+        if isinstance(points, Selection):
+            if points.num_points != n:
+                raise ValueError(
+                    f"The selection is over {points.num_points} points, not {n}"
+                )
+            return points.to_indices()
+        if isinstance(points, (bytes, bytearray, memoryview)):
+            needed = (n + 7) // 8
+            if len(points) < needed:
+                raise ValueError(
+                    f"packed mask too short: got {len(points)} bytes, need {needed} for N={n}"
+                )
+            return indices_from_packed_mask(points, n)
+        points = numpy.asarray(points)
+        if points.dtype == numpy.bool_:
+            if points.shape != (n,):
+                raise ValueError(f"mask should have shape ({n},), got {points.shape}")
+            return numpy.flatnonzero(points)
+        if points.ndim != 1:
+            raise ValueError("points should be integer indices or a mask")
+        if points.size == 0:
+            # e.g. [], which NumPy makes float64
+            return numpy.empty(0, dtype=numpy.intp)
+        if points.dtype.kind not in "iu":
+            raise ValueError("points should be integer indices or a mask")
+        if points.min() < 0 or points.max() >= n:
+            raise ValueError(f"point indices should be between 0 and {n - 1}")
+        if not numpy.all(points[1:] > points[:-1]):
+            points = numpy.unique(points)
+        return points
+
+    def edit_points(self, points, label, op: str = "add") -> int:
+        """
+        Add the points to label (op "add") or remove the ones in label from
+        it (op "remove"), like a lasso edit. points are indices, a boolean
+        mask, a packed mask, e.g. the result of points_in_box, or a Selection.
+
+        Returns the number of points changed.
+        """
+        code = self._label_to_code_map().get(str(label))
+        if code is None:
+            raise ValueError(f"Unknown label: {label!r}")
+        return self._apply_lasso_edit(
+            op=op, code=code, indices=self._indices_from_points(points)
+        )
+
+    def _get_visible(self) -> Selection | None:
+        return self._visible
+
+    def _set_visible(self, points) -> None:
+        if points is None:
+            visible = None
+        else:
+            visible = self._selection_from_points(points)
+            if len(visible) == visible.num_points:
+                visible = None
+        with self._lock:
+            self._visible = visible
+            if self._octree is not None:
+                self._send_lod_nodes(sorted(self._lod_loaded), with_xyz=False)
+            else:
+                self.visible_t = self._visible_bytes()
+
+    visible = property(
+        _get_visible,
+        _set_visible,
+        doc="""
+        The points shown, as a Selection, None when all of them are. Set it
+        to point indices, a boolean mask, a packed mask or a Selection to hide
+        the other points without resending the coordinates, None to show them
+        all. Lasso edits never select hidden points.
+        """,
+    )
+
+    def show_labels(self, labels) -> None:
+        """
+        Show only the points of labels, None standing for the unassigned
+        points: show_labels([None]) shows the points left to label. The
+        points shown are those in labels at the time of the call, later
+        edits do not hide nor show points.
         """
         if self._category is None:
             raise RuntimeError("No category set")
+        codes = self._label_to_code_map()
+        shown = numpy.zeros(len(codes) + 1, dtype=numpy.bool_)
+        for label in labels:
+            if label is None:
+                shown[0] = True
+                continue
+            code = codes.get(str(label))
+            if code is None:
+                raise ValueError(f"Unknown label: {label!r}")
+            shown[code] = True
+        self.visible = shown[self._category.coded_values]
+
+    def show_all(self) -> None:
+        self.visible = None
+
+    def _selection_from_points(self, points) -> Selection:
+        """A Selection over all the points, from what edit_points takes."""
+        n = self.num_points
+        if isinstance(points, Selection) and points.num_points == n:
+            return points
+        if (
+            isinstance(points, numpy.ndarray)
+            and points.dtype == numpy.bool_
+            and points.shape == (n,)
+        ):
+            return Selection.from_mask(points)
+        return Selection.from_indices(self._indices_from_points(points), n)
+
+    def _visible_bytes(self) -> bytes:
+        """The packed visibility mask of the points sent to the frontend."""
+        visible = self._visible
+        if visible is None:
+            return b""
+        if self._preview_step == 1:
+            return visible.tobytes()
+        return Selection.from_mask(visible.to_mask()[:: self._preview_step]).tobytes()
+
+    def _get_lasso_selection(self) -> str:
+        return str(self.lasso_selection_t)
+
+    def _set_lasso_selection(self, value: str) -> None:
+        if value not in (LASSO_SELECTION_PYTHON, LASSO_SELECTION_FRONTEND):
+            raise ValueError(
+                f"lasso_selection should be {LASSO_SELECTION_PYTHON!r} or {LASSO_SELECTION_FRONTEND!r}, got {value!r}"
+            )
+        if value == LASSO_SELECTION_FRONTEND and self._octree is not None:
+            raise ValueError(
+                "lasso_selection cannot be 'frontend' with level of detail enabled"
+            )
+        self.lasso_selection_t = value
+
+    lasso_selection = property(_get_lasso_selection, _set_lasso_selection)
 
+    def _apply_lasso_mask_edit(self, op: str, code: int, mask: numpy.ndarray) -> int:
+        """
+        Apply add/remove using a boolean mask of length N.
+        Returns number of points actually changed.
+        """
         if mask.dtype != numpy.bool_ or mask.shape != (self.num_points,):
             raise ValueError("Internal error: mask must be bool with shape (N,)")
+        return self._apply_lasso_edit(op, code, numpy.flatnonzero(mask))
 
-        if code < 0 or code > 65535:
-            raise ValueError(f"Invalid code {code} (must fit uint16)")
+    def _apply_lasso_edit(self, op: str, code: int, indices: numpy.ndarray) -> int:
+        """
+        Apply add/remove to the points at indices (sorted, unique), in place:
+        only the selected points are read and the changed ones written.
+        Returns number of points actually changed.
+        """
+        if self._category is None:
+            raise RuntimeError("No category set")
+
+        max_code = len(self._category.label_list)
+        if code < 0 or code > max_code:
+            raise ValueError(f"Invalid code {code} (must be between 0 and {max_code})")
         if code == 0 and op == "add":
             raise ValueError("Cannot add code 0 (reserved for missing/unassigned)")
 
-        old = self._category.coded_values
-        new = old.copy()
-
-        if op == "add":
-            changed = int(numpy.sum(new[mask] != numpy.uint16(code)))
-            new[mask] = numpy.uint16(code)
-        elif op == "remove":
-            # Only remove points currently in that label
-            to_zero = mask & (new == numpy.uint16(code))
-            changed = int(numpy.sum(to_zero))
-            new[to_zero] = numpy.uint16(0)
-        else:
-            raise ValueError(f"Unknown op: {op!r}")
+        with self._lock:
+            if op == "add":
+                change = self._commit_codes_at(indices, code)
+            elif op == "remove":
+                # Only remove points currently in that label
+                in_label = self._category.coded_values[indices] == code
+                change = self._commit_codes_at(indices[in_label], 0)
+            else:
+                raise ValueError(f"Unknown op: {op!r}")
+        return int(change.indices.size)
 
+    def _commit_codes_at(self, indices: numpy.ndarray, codes, record: bool = True):
+        """
+        Set the category codes at indices (sorted, unique) in place, in a
+        single category update. The change is recorded in the edit history
+        unless record is False. Returns the CodesChange.
+        """
+        if self._category is None:
+            raise RuntimeError("No category set")
+        self._check_history()
         # Update Category (will notify; widget callback syncs coded_values_t etc.)
-        self._category.set_coded_values(
-            coded_values=new,
-            label_list=self._category.label_list,
-            skip_copying_array=True,
-        )
-        return changed
+        self._committing_edit = True
+        try:
+            change = self._category.set_coded_values_at(indices, codes)
+        finally:
+            self._committing_edit = False
+        self._history_version = self._category._version
+        if record and change.indices.size:
+            self._history.record(change.indices, change.previous, self.num_points)
+        self._sync_history()
+        return change
+
+    def _check_history(self) -> None:
+        # the recorded edits do not apply to codes changed by someone else
+        if (
+            self._category is not None
+            and self._history_version is not None
+            and self._category._version != self._history_version
+        ):
+            self.clear_history()
+
+    def _sync_history(self) -> None:
+        self.history_t = {
+            "num_undo": self._history.num_undo,
+            "num_redo": self._history.num_redo,
+        }
+
+    def clear_history(self) -> None:
+        """Forget the edits, they cannot be undone anymore."""
+        self._history.clear()
+        self._history_version = None
+        self._sync_history()
+
+    def _get_history_max_bytes(self) -> int:
+        return self._history.max_bytes
+
+    def _set_history_max_bytes(self, value: int) -> None:
+        self._history.max_bytes = value
+        self._sync_history()
+
+    history_max_bytes = property(_get_history_max_bytes, _set_history_max_bytes)
+
+    @property
+    def can_undo(self) -> bool:
+        self._check_history()
+        return self._history.num_undo > 0
+
+    @property
+    def can_redo(self) -> bool:
+        self._check_history()
+        return self._history.num_redo > 0
+
+    def undo(self) -> int:
+        """
+        Undo the last edit. Returns the number of points changed, 0 if there
+        is nothing to undo.
+        """
+        return self._cross_edit(self._history.undo)
+
+    def redo(self) -> int:
+        """
+        Redo the last edit undone. Returns the number of points changed, 0 if
+        there is nothing to redo.
+        """
+        return self._cross_edit(self._history.redo)
+
+    def _cross_edit(self, step) -> int:
+        if self._category is None:
+            raise RuntimeError("No category set")
+        with self._lock:
+            self._check_history()
+            diff = step(self._category.coded_values)
+            if diff is None:
+                return 0
+            indices, codes = diff
+            change = self._commit_codes_at(indices, codes, record=False)
+        return int(change.indices.size)
+
+    @traitlets.observe("history_request_t")
+    def _on_history_request_t(self, change) -> None:
+        req = change.get("new", {})
+        action = req.get("action")
+        if action == "undo":
+            self.undo()
+        elif action == "redo":
+            self.redo()
+
+    def propagate_labels(
+        self,
+        k: int = DEFAULT_NUM_NEIGHBORS,
+        max_distance: float | None = None,
+        workers: int | None = None,
+    ) -> int:
+        """
+        Label the unassigned points by majority vote of their k nearest
+        labelled points, ignoring neighbours further than max_distance.
+        The kNN queries run on workers threads, all the cores by default.
+
+        The category is updated once, with all the new labels. Returns the
+        number of points labelled.
+        """
+        if self._category is None:
+            raise RuntimeError("No category set")
+        if self._xyz is None:
+            raise RuntimeError("xyz has not been set")
+        with self._lock:
+            indices, codes = propagate_codes(
+                self._xyz,
+                self._category.coded_values,
+                k=k,
+                max_distance=max_distance,
+                workers=workers,
+            )
+            if not indices.size:
+                return 0
+            change = self._commit_codes_at(indices, codes)
+        return int(change.indices.size)
+
+    def _get_lasso_async(self) -> bool:
+        return self._lasso_worker is not None
+
+    def _set_lasso_async(self, value: bool) -> None:
+        if value and self._lasso_worker is None:
+            self._lasso_worker = CoalescingWorker(
+                self._process_lasso_requests, name="scatter3d-lasso"
+            )
+        elif not value and self._lasso_worker is not None:
+            worker = self._lasso_worker
+            self._lasso_worker = None
+            # the requests already received are still applied
+            worker.close()
+
+    lasso_async = property(
+        _get_lasso_async,
+        _set_lasso_async,
+        doc="""
+        Whether the lasso requests of the frontend are applied on a worker
+        thread, which keeps the kernel responsive during large edits.
+
+        lasso_result_t first reports a request as "pending", then its result
+        once applied, in the order received. The requests received while an
+        edit is applied are applied together, with a single update of the
+        frontend; a request resent with the same request_id replaces the
+        queued one. Use wait_lasso_requests() before changing the category
+        directly.
+        """,
+    )
+
+    def wait_lasso_requests(self, timeout: float | None = None) -> bool:
+        """
+        Wait until the lasso requests received are applied (see lasso_async).
+        Returns False if the timeout (in seconds) expired first.
+        """
+        worker = self._lasso_worker
+        return True if worker is None else worker.wait(timeout)
 
     @traitlets.observe("lasso_request_t")
     def _on_lasso_request_t(self, change) -> None:
         req = change.get("new", {})
         if not req:
             return
+        # the mask traits are overwritten by the next lasso, read them now
+        mask_payload = self._lasso_mask_payload(req)
+        worker = self._lasso_worker
+        if worker is None:
+            self._apply_lasso_requests([(req, mask_payload)], report=True)
+            return
 
+        request_id = req.get("request_id")
+        with self._lasso_result_lock:
+            self.lasso_result_t = {"request_id": request_id, "status": "pending"}
+        # requests without id are never replaced
+        key = request_id if request_id is not None else object()
+        worker.submit(key, (req, mask_payload))
+
+    def _process_lasso_requests(self, requests: list[tuple[dict, Any]]) -> None:
+        # on the lasso worker thread
+        results = self._apply_lasso_requests(requests)
+        with self._lasso_result_lock:
+            for res in results:
+                self.lasso_result_t = res
+
+    def _apply_lasso_requests(
+        self, requests: list[tuple[dict, Any]], report: bool = False
+    ) -> list[dict[str, object]]:
+        """
+        Apply the lasso requests in order, in a single category update, and
+        return their results. The frontend is synced once, when the batch
+        exits: its time and bytes are split evenly between the stats records
+        of the requests.
+
+        With report=True, for a single request, its result is assigned to
+        lasso_result_t and sent in the same message as the edit and the
+        history.
+        """
+        stats = self._stats
+        bytes_sent_before = stats.total_bytes_sent if stats is not None else 0
+        results = []
+        records = []
+        with self._lock:
+            category = self._category
+            # not on the lasso worker: hold_sync is not thread safe, and the
+            # kernel thread reports the pending requests meanwhile
+            with self.hold_sync() if report else nullcontext():
+                with category.batch() if category is not None else nullcontext():
+                    for req, mask_payload in requests:
+                        res, record = self._run_lasso_request(req, mask_payload)
+                        results.append(res)
+                        records.append(record)
+                    sync_start = time.perf_counter()
+                if report:
+                    (self.lasso_result_t,) = results
+            sync_seconds = time.perf_counter() - sync_start
+
+        if stats is not None:
+            bytes_sent = stats.total_bytes_sent - bytes_sent_before
+            for record in records:
+                record["sync_s"] = sync_seconds / len(records)
+                record["total_s"] += record["sync_s"]
+                record["bytes_sent"] = bytes_sent // len(records)
+                stats.record_lasso_request(record)
+        return results
+
+    def _run_lasso_request(
+        self, req: dict, mask_payload
+    ) -> tuple[dict[str, object], dict[str, Any]]:
+        """
+        Decode and apply a lasso request, returns its result and its stats
+        record, without the sync (see _apply_lasso_requests).
+        """
         request_id = req.get("request_id")
         res: dict[str, object] = {"request_id": request_id}
 
+        start = time.perf_counter()
+        mask_seconds = apply_seconds = 0.0
+
         try:
             if req.get("kind") != "lasso_commit":
                 raise ValueError(f"Unsupported kind: {req.get('kind')!r}")
@@ -699,23 +2282,47 @@ class Scatter3dWidget(anywidget.AnyWidget):
                     raise ValueError(f"Unknown label: {label_s!r}")
                 code = m[label_s]
 
-            # unpack mask from bytes traitlet
-            mask = self._unpack_mask(self.lasso_mask_t)
-            num_selected = int(numpy.sum(mask))
+            indices = self._lasso_indices_from_request(req, mask_payload)
+            num_selected = int(indices.size)
+            mask_seconds = time.perf_counter() - start
 
-            changed = self._apply_lasso_mask_edit(op=op, code=code, mask=mask)
+            if self._category is None:
+                raise RuntimeError("No category set")
+            # labels of the selected points before the edit
+            selected_counts = self._category.label_counts_at(indices)
+            changed = self._apply_lasso_edit(op=op, code=code, indices=indices)
+            apply_seconds = time.perf_counter() - start - mask_seconds
 
             res.update(
                 {
                     "status": "ok",
                     "num_selected": num_selected,
                     "num_changed": changed,
+                    "selected_label_counts": {
+                        str(label): n for label, n in selected_counts.items()
+                    },
+                    "selected_unassigned": num_selected - sum(selected_counts.values()),
                 }
             )
+        except (ValueError, TypeError, RuntimeError) as e:
+            # invalid request
+            res.update({"status": "error", "message": str(e)})
         except Exception as e:
+            # still reported, or the frontend would wait for the request
+            logger.exception("Failed to apply lasso request %r", request_id)
             res.update({"status": "error", "message": str(e)})
 
-        self.lasso_result_t = res
+        record = {
+            "request_id": request_id,
+            "status": res["status"],
+            "num_selected": res.get("num_selected"),
+            "num_changed": res.get("num_changed"),
+            "mask_s": mask_seconds,
+            "apply_s": apply_seconds,
+            "total_s": time.perf_counter() - start,
+            "frontend_timings": dict(req.get("timings") or {}),
+        }
+        return res, record
 
     def _get_point_size(self) -> float:
         return float(self.point_size_t)
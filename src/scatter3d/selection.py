@@ -0,0 +1,178 @@
+import numpy
+
+from .lasso import indices_from_packed_mask
+
+
+def _packed_size(num_points: int) -> int:
+    return -(-num_points // 8)
+
+
+class Selection:
+    """
+    A set of points among num_points, kept as a packed bit mask: one bit per
+    point, bitorder "big", like the lasso masks of the frontend (8 times
+    smaller than a boolean mask).
+
+    Supports the set operators |, &, - and ^ (and union, intersection,
+    difference and symmetric_difference), ~ for the complement and len() for
+    the number of points, all computed on the packed bytes.
+    """
+
+    def __init__(self, packed, num_points: int):
+        """
+        packed is a packed mask of at least ceil(num_points / 8) bytes, e.g.
+        the packed=True result of Scatter3dWidget.points_in_box. It is
+        copied.
+        """
+        if num_points < 0:
+            raise ValueError("num_points should be a non negative integer")
+        size = _packed_size(num_points)
+        packed = numpy.frombuffer(packed, dtype=numpy.uint8)
+        if packed.size < size:
+            raise ValueError(
+                f"packed mask too short: got {packed.size} bytes, need {size} "
+                f"for {num_points} points"
+            )
+        self._packed = packed[:size].copy()
+        self._num_points = num_points
+        self._clear_padding()
+
+    @classmethod
+    def _from_packed_array(cls, packed: numpy.ndarray, num_points: int):
+        # takes ownership of packed, padding bits cleared
+        selection = cls.__new__(cls)
+        selection._packed = packed
+        selection._num_points = num_points
+        return selection
+
+    @classmethod
+    def from_indices(cls, indices, num_points: int) -> "Selection":
+        """The points at indices (any order, repeats allowed)."""
+        indices = numpy.asarray(indices)
+        if indices.ndim != 1 or (indices.size and indices.dtype.kind not in "iu"):
+            raise ValueError("indices should be a 1D array of integers")
+        if indices.size and (indices.min() < 0 or indices.max() >= num_points):
+            raise ValueError(f"indices should be between 0 and {num_points - 1}")
+        # [] is float64
+        indices = indices.astype(numpy.intp, copy=False)
+        size = _packed_size(num_points)
+        bits = numpy.right_shift(0x80, indices & 7)
+        if numpy.all(indices[1:] > indices[:-1]):
+            # distinct points: the bits of a byte add up to their OR
+            packed = numpy.bincount(indices >> 3, weights=bits, minlength=size)
+            packed = packed.astype(numpy.uint8)
+        else:
+            packed = numpy.zeros(size, dtype=numpy.uint8)
+            numpy.bitwise_or.at(packed, indices >> 3, bits.astype(numpy.uint8))
+        return cls._from_packed_array(packed, num_points)
+
+    @classmethod
+    def from_mask(cls, mask) -> "Selection":
+        """The points set in a boolean mask."""
+        mask = numpy.asarray(mask)
+        if mask.dtype != numpy.bool_ or mask.ndim != 1:
+            raise ValueError("mask should be a 1D boolean array")
+        packed = numpy.packbits(mask, bitorder="big")
+        return cls._from_packed_array(packed, mask.size)
+
+    @classmethod
+    def empty(cls, num_points: int) -> "Selection":
+        packed = numpy.zeros(_packed_size(num_points), dtype=numpy.uint8)
+        return cls._from_packed_array(packed, num_points)
+
+    @property
+    def num_points(self) -> int:
+        """Number of points the selection is taken from."""
+        return self._num_points
+
+    @property
+    def packed(self) -> numpy.ndarray:
+        """The packed bytes, read-only."""
+        view = self._packed.view()
+        view.flags.writeable = False
+        return view
+
+    def to_indices(self) -> numpy.ndarray:
+        """Sorted indices of the selected points."""
+        return indices_from_packed_mask(self._packed, self._num_points)
+
+    def to_mask(self) -> numpy.ndarray:
+        """Boolean mask of length num_points."""
+        bits = numpy.unpackbits(self._packed, count=self._num_points, bitorder="big")
+        return bits.view(numpy.bool_)
+
+    def tobytes(self) -> bytes:
+        return self._packed.tobytes()
+
+    def __bytes__(self) -> bytes:
+        return self.tobytes()
+
+    def __len__(self) -> int:
+        return int(numpy.bitwise_count(self._packed).sum(dtype=numpy.int64))
+
+    def __contains__(self, index) -> bool:
+        index = int(index)
+        if not 0 <= index < self._num_points:
+            return False
+        return bool(self._packed[index >> 3] & (0x80 >> (index & 7)))
+
+    def contains(self, indices) -> numpy.ndarray:
+        """Boolean array, whether each of indices (in range) is selected."""
+        indices = numpy.asarray(indices)
+        bits = self._packed[indices >> 3] & numpy.right_shift(0x80, indices & 7)
+        return bits.astype(numpy.bool_)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Selection):
+            return NotImplemented
+        return self._num_points == other._num_points and numpy.array_equal(
+            self._packed, other._packed
+        )
+
+    __hash__ = None  # mutable buffer, like set
+
+    def __repr__(self) -> str:
+        return f"Selection({len(self)} of {self._num_points} points)"
+
+    def _check_other(self, other) -> numpy.ndarray:
+        if not isinstance(other, Selection):
+            raise TypeError(f"expected a Selection, got {type(other).__name__}")
+        if other._num_points != self._num_points:
+            raise ValueError(
+                f"the selections are over different numbers of points: "
+                f"{self._num_points} and {other._num_points}"
+            )
+        return other._packed
+
+    def union(self, other: "Selection") -> "Selection":
+        packed = self._packed | self._check_other(other)
+        return Selection._from_packed_array(packed, self._num_points)
+
+    def intersection(self, other: "Selection") -> "Selection":
+        packed = self._packed & self._check_other(other)
+        return Selection._from_packed_array(packed, self._num_points)
+
+    def difference(self, other: "Selection") -> "Selection":
+        packed = self._packed & ~self._check_other(other)
+        return Selection._from_packed_array(packed, self._num_points)
+
+    def symmetric_difference(self, other: "Selection") -> "Selection":
+        packed = self._packed ^ self._check_other(other)
+        return Selection._from_packed_array(packed, self._num_points)
+
+    def complement(self) -> "Selection":
+        selection = Selection._from_packed_array(~self._packed, self._num_points)
+        selection._clear_padding()
+        return selection
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+    __xor__ = symmetric_difference
+    __invert__ = complement
+
+    def _clear_padding(self) -> None:
+        # bits past num_points in the last byte, so that they never count
+        remainder = self._num_points % 8
+        if remainder:
+            self._packed[-1] &= (0xFF << (8 - remainder)) & 0xFF
@@ -0,0 +1,363 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+from .chunks import chunk_slices
+
+# Number of points in the cell of a typical point: queries test the points
+# of the cells they overlap, smaller cells mean more cells to look up.
+DEFAULT_POINTS_PER_CELL = 32
+# keeps the flat cell ids within int64
+MAX_CELLS_PER_AXIS = 1 << 20
+# The cell size is fitted to the density on a random sample of the points
+CELL_SIZE_SAMPLE_SIZE = 100_000
+SAMPLING_SEED = 0
+# Query points x candidate points distances computed at once by query_knn
+KNN_MAX_DISTANCES = 1 << 20
+# query_knn solves the query points by groups of about this many points (in
+# a block of grid cells), enough for the NumPy work to outweigh the overhead
+KNN_GROUP_SIZE = 256
+
+
+def _as_point(value, name: str) -> numpy.ndarray:
+    point = numpy.asarray(value, dtype=numpy.float64)
+    if point.shape != (3,):
+        raise ValueError(f"{name} should have 3 values, got shape {point.shape}")
+    if not numpy.all(numpy.isfinite(point)):
+        raise ValueError(f"{name} should only contain finite numbers")
+    return point
+
+
+def _flat_ids(coords: numpy.ndarray, shape: numpy.ndarray) -> numpy.ndarray:
+    """Row-major ids of (..., 3) cell coordinates in a grid of the shape."""
+    return (coords[..., 0] * shape[1] + coords[..., 1]) * shape[2] + coords[..., 2]
+
+
+def _check_radius(radius) -> float:
+    r = float(radius)
+    if not numpy.isfinite(r) or r < 0:
+        raise ValueError("radius should be a finite non negative number")
+    return r
+
+
+class GridIndex:
+    """
+    Uniform grid over a (N, 3) point cloud for box, radius and nearest
+    neighbour queries.
+
+    The point indices are sorted by cell id, so the points of a cell (and of
+    a run of cells along z) are a contiguous slice, found by binary search:
+    only the cells holding points cost memory, and the cells can be sized
+    for where the points are dense rather than for the bounding box. A query
+    only reads the coordinates of the points in the cells it overlaps, which
+    also suits out-of-core arrays.
+
+    subset (sorted indices) restricts the index to some of the points,
+    queries still return indices into xyz.
+    """
+
+    def __init__(
+        self,
+        xyz,
+        points_per_cell: int = DEFAULT_POINTS_PER_CELL,
+        subset: numpy.ndarray | None = None,
+    ):
+        if points_per_cell <= 0:
+            raise ValueError("points_per_cell should be a positive integer")
+        if len(xyz.shape) != 2 or xyz.shape[1] != 3:
+            raise ValueError("xyz should have shape (N, 3)")
+
+        self._xyz = xyz
+        self._subset = None if subset is None else numpy.asarray(subset)
+        num_points = xyz.shape[0] if subset is None else self._subset.size
+        lo = numpy.full(3, numpy.inf)
+        hi = numpy.full(3, -numpy.inf)
+        for _, points in self._indexed_chunks(num_points):
+            lo = numpy.minimum(lo, points.min(axis=0))
+            hi = numpy.maximum(hi, points.max(axis=0))
+        if not num_points:
+            lo = hi = numpy.zeros(3)
+        if not (numpy.all(numpy.isfinite(lo)) and numpy.all(numpy.isfinite(hi))):
+            raise ValueError("xyz should only contain finite values to be indexed")
+        self.bbox_min = lo
+        self.bbox_max = hi
+
+        self._set_cell_size(self._fit_cell_size(num_points, points_per_cell))
+
+        cell_ids = numpy.empty(num_points, dtype=numpy.int64)
+        for chunk, points in self._indexed_chunks(num_points):
+            cell_ids[chunk] = self._flat_ids(self._cell_coords(points))
+
+        index_dtype = numpy.uint32 if xyz.shape[0] < 2**32 else numpy.int64
+        # stable, so that the points of a cell are in index order
+        order = numpy.argsort(cell_ids, kind="stable")
+        self._sorted_cell_ids = cell_ids[order]
+        if self._subset is not None:
+            order = self._subset[order]
+        self._order = order.astype(index_dtype)
+
+    def _set_cell_size(self, cell_size: float) -> None:
+        """Cubic cells over the axes that are not flat."""
+        extent = self.bbox_max - self.bbox_min
+        spread = extent > 0
+        shape = numpy.ones(3, dtype=numpy.int64)
+        shape[spread] = numpy.ceil(extent[spread] / cell_size)
+        self.shape = numpy.clip(shape, 1, MAX_CELLS_PER_AXIS)
+        self.cell_size = numpy.where(spread, extent / self.shape, 1.0)
+
+    def _fit_cell_size(self, num_points: int, points_per_cell: int) -> float:
+        """
+        Cell size for about points_per_cell points in the cell of a typical
+        point: first from the bounding box volume, then shrunk where the
+        points are denser than average, estimated on a sample.
+        """
+        extent = self.bbox_max - self.bbox_min
+        spread = extent > 0
+        dims = int(spread.sum())
+        if not dims or not num_points:
+            return 1.0
+        num_cells = max(num_points / points_per_cell, 1.0)
+        cell_size = (numpy.prod(extent[spread]) / num_cells) ** (1 / dims)
+
+        sample_size = min(num_points, CELL_SIZE_SAMPLE_SIZE)
+        rng = numpy.random.default_rng(SAMPLING_SEED)
+        sample = numpy.sort(rng.choice(num_points, sample_size, replace=False))
+        if self._subset is not None:
+            sample = self._subset[sample]
+        points = numpy.asarray(self._xyz[sample])
+        fraction = sample_size / num_points
+        for _ in range(2):
+            self._set_cell_size(cell_size)
+            ids = self._flat_ids(self._cell_coords(points))
+            _, counts = numpy.unique(ids, return_counts=True)
+            # points in the cell of a sample point, the other sample points
+            # there scaled up to all the points
+            occupancy = ((counts**2).sum() / counts.sum() - 1) / fraction
+            if occupancy <= 2 * points_per_cell:
+                break
+            cell_size *= (points_per_cell / occupancy) ** (1 / dims)
+        return cell_size
+
+    def __len__(self) -> int:
+        return self._order.size
+
+    def _indexed_chunks(self, num_points: int):
+        for chunk in chunk_slices(num_points):
+            if self._subset is None:
+                yield chunk, numpy.asarray(self._xyz[chunk])
+            else:
+                yield chunk, numpy.asarray(self._xyz[self._subset[chunk]])
+
+    def _cell_coords(self, points: numpy.ndarray) -> numpy.ndarray:
+        coords = numpy.floor((points - self.bbox_min) / self.cell_size)
+        return numpy.clip(coords, 0, self.shape - 1).astype(numpy.int64)
+
+    def _flat_ids(self, coords: numpy.ndarray) -> numpy.ndarray:
+        return _flat_ids(coords, self.shape)
+
+    def _candidates(self, lo: numpy.ndarray, hi: numpy.ndarray) -> numpy.ndarray:
+        """Sorted indices of the points in the cells overlapping a box."""
+        if numpy.any(lo > hi) or numpy.any(hi < self.bbox_min):
+            return numpy.empty(0, dtype=numpy.intp)
+        if numpy.any(lo > self.bbox_max) or not len(self):
+            return numpy.empty(0, dtype=numpy.intp)
+        return self._cells_candidates(self._cell_coords(lo), self._cell_coords(hi))
+
+    def _cells_candidates(
+        self, cmin: numpy.ndarray, cmax: numpy.ndarray
+    ) -> numpy.ndarray:
+        """Sorted indices of the points in the cells cmin..cmax (inclusive)."""
+        num_columns = (cmax[0] - cmin[0] + 1) * (cmax[1] - cmin[1] + 1)
+        if num_columns > len(self):
+            # fewer points than cell lookups: filter all the points
+            coords = numpy.stack(
+                [
+                    (self._sorted_cell_ids // (self.shape[1] * self.shape[2])),
+                    (self._sorted_cell_ids // self.shape[2]) % self.shape[1],
+                    self._sorted_cell_ids % self.shape[2],
+                ],
+                axis=1,
+            )
+            inside = numpy.all((coords >= cmin) & (coords <= cmax), axis=1)
+            return numpy.sort(self._order[inside]).astype(numpy.intp)
+
+        # one run of cells along z per (x, y) column
+        cx, cy = numpy.meshgrid(
+            numpy.arange(cmin[0], cmax[0] + 1),
+            numpy.arange(cmin[1], cmax[1] + 1),
+            indexing="ij",
+        )
+        cx = cx.ravel()
+        cy = cy.ravel()
+        first = self._flat_ids(numpy.stack([cx, cy, numpy.full(cx.size, cmin[2])], 1))
+        last = self._flat_ids(numpy.stack([cx, cy, numpy.full(cx.size, cmax[2])], 1))
+        starts = numpy.searchsorted(self._sorted_cell_ids, first, side="left")
+        ends = numpy.searchsorted(self._sorted_cell_ids, last, side="right")
+        lengths = ends - starts
+        total = int(lengths.sum())
+        # concatenation of the ranges [starts[i], ends[i])
+        positions = numpy.arange(total) + numpy.repeat(
+            starts - (numpy.cumsum(lengths) - lengths), lengths
+        )
+        return numpy.sort(self._order[positions]).astype(numpy.intp)
+
+    def _points(self, indices: numpy.ndarray) -> numpy.ndarray:
+        return numpy.asarray(self._xyz[indices], dtype=numpy.float64)
+
+    def query_box(self, box_min, box_max) -> numpy.ndarray:
+        """Sorted indices of the points inside an axis-aligned box."""
+        lo = _as_point(box_min, "box_min")
+        hi = _as_point(box_max, "box_max")
+        candidates = self._candidates(lo, hi)
+        if not candidates.size:
+            return candidates
+        points = self._points(candidates)
+        inside = numpy.all((points >= lo) & (points <= hi), axis=1)
+        return candidates[inside]
+
+    def query_sphere(self, center, radius) -> numpy.ndarray:
+        """Sorted indices of the points within radius of center."""
+        c = _as_point(center, "center")
+        r = _check_radius(radius)
+        candidates = self._candidates(c - r, c + r)
+        if not candidates.size:
+            return candidates
+        offsets = self._points(candidates) - c
+        inside = numpy.einsum("ij,ij->i", offsets, offsets) <= r * r
+        return candidates[inside]
+
+    def query_radius(self, centers, radius) -> numpy.ndarray:
+        """Sorted indices of the points within radius of any of the centers."""
+        centers = numpy.asarray(centers, dtype=numpy.float64).reshape(-1, 3)
+        found = [self.query_sphere(center, radius) for center in centers]
+        if not found:
+            return numpy.empty(0, dtype=numpy.intp)
+        return numpy.unique(numpy.concatenate(found))
+
+    def query_knn(
+        self, points, k: int, workers: int | None = None
+    ) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        The k nearest indexed points of each of the (M, 3) points: their
+        (M, k) indices and distances, nearest first. Missing neighbours
+        (fewer than k points indexed) have index -1 and distance inf.
+
+        The query points are grouped by blocks of grid cells and every group
+        is solved from the cells around its block, in rings grown until no
+        closer point can be outside them. Groups are spread over workers
+        threads (all the cores by default).
+        """
+        if k <= 0:
+            raise ValueError("k should be a positive integer")
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)
+        indices = numpy.full((points.shape[0], k), -1, dtype=numpy.intp)
+        distances = numpy.full((points.shape[0], k), numpy.inf)
+        if not points.shape[0] or not len(self):
+            return indices, distances
+
+        # blocks of block^3 cells holding about KNN_GROUP_SIZE query points
+        points_per_cell = points.shape[0] / numpy.prod(self.shape)
+        block = max(1, round((KNN_GROUP_SIZE / points_per_cell) ** (1 / 3)))
+        blocks = self._cell_coords(points) // block
+        num_blocks = -(-self.shape // block)
+        block_ids = _flat_ids(blocks, num_blocks)
+        by_block = numpy.argsort(block_ids, kind="stable")
+        bounds = numpy.flatnonzero(numpy.diff(block_ids[by_block])) + 1
+        groups = numpy.split(by_block, bounds)
+
+        def solve(batch: list[numpy.ndarray]) -> None:
+            for group in batch:
+                first_cell = blocks[group[0]] * block
+                last_cell = numpy.minimum(first_cell + block - 1, self.shape - 1)
+                self._knn_group(
+                    points, group, first_cell, last_cell, indices, distances
+                )
+
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(groups) == 1:
+            solve(groups)
+        else:
+            num_batches = min(len(groups), workers * 4)
+            batches = [groups[i::num_batches] for i in range(num_batches)]
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # list() re-raises the errors of the workers
+                list(executor.map(solve, batches))
+        return indices, distances
+
+    def _knn_group(
+        self,
+        points: numpy.ndarray,
+        group: numpy.ndarray,
+        first_cell: numpy.ndarray,
+        last_cell: numpy.ndarray,
+        indices: numpy.ndarray,
+        distances: numpy.ndarray,
+    ) -> None:
+        """
+        query_knn for the query points group, all in the cells first_cell to
+        last_cell.
+        """
+        k = indices.shape[1]
+        grid_last_cell = self.shape - 1
+        pending = group
+        ring = 1
+        while pending.size:
+            cmin = numpy.maximum(first_cell - ring, 0)
+            cmax = numpy.minimum(last_cell + ring, grid_last_cell)
+            candidates = self._cells_candidates(cmin, cmax)
+            covers_all = bool(
+                numpy.all(cmin == 0) and numpy.all(cmax == grid_last_cell)
+            )
+            if not candidates.size and not covers_all:
+                ring *= 2
+                continue
+
+            queries = points[pending]
+            # distance from the queries to the sides of the searched cells
+            # that have points beyond them
+            lower = self.bbox_min + cmin * self.cell_size
+            upper = self.bbox_min + (cmax + 1) * self.cell_size
+            margin = numpy.minimum(
+                numpy.where(cmin > 0, queries - lower, numpy.inf),
+                numpy.where(cmax < grid_last_cell, upper - queries, numpy.inf),
+            ).min(axis=1)
+
+            num_found = min(k, candidates.size)
+            near = numpy.empty((pending.size, num_found), dtype=numpy.intp)
+            near_dist2 = numpy.empty((pending.size, num_found))
+            # relative to the group's cell, so that the expanded squared
+            # distances below do not lose precision far from the origin
+            origin = self.bbox_min + first_cell * self.cell_size
+            candidate_points = self._points(candidates) - origin
+            candidate_norms = numpy.einsum(
+                "ij,ij->i", candidate_points, candidate_points
+            )
+            rows = max(1, KNN_MAX_DISTANCES // max(candidates.size, 1))
+            for chunk in chunk_slices(pending.size, rows):
+                q = queries[chunk] - origin
+                # |q - c|^2 = |q|^2 + |c|^2 - 2 q.c, the product done by BLAS
+                dist2 = candidate_norms - 2 * (q @ candidate_points.T)
+                dist2 += numpy.einsum("ij,ij->i", q, q)[:, None]
+                numpy.maximum(dist2, 0, out=dist2)
+                if num_found < candidates.size:
+                    nearest = numpy.argpartition(dist2, num_found - 1, axis=1)
+                    nearest = nearest[:, :num_found]
+                else:
+                    nearest = numpy.broadcast_to(numpy.arange(num_found), dist2.shape)
+                d2 = numpy.take_along_axis(dist2, nearest, axis=1)
+                ranked = numpy.argsort(d2, axis=1, kind="stable")
+                near[chunk] = candidates[numpy.take_along_axis(nearest, ranked, 1)]
+                near_dist2[chunk] = numpy.take_along_axis(d2, ranked, axis=1)
+
+            if covers_all:
+                done = numpy.ones(pending.size, dtype=bool)
+            elif num_found < k:
+                done = numpy.zeros(pending.size, dtype=bool)
+            else:
+                done = near_dist2[:, k - 1] <= margin**2
+            solved = pending[done]
+            indices[solved, :num_found] = near[done]
+            distances[solved, :num_found] = numpy.sqrt(near_dist2[done])
+            pending = pending[~done]
+            ring *= 2
@@ -0,0 +1,74 @@
+import json
+from collections import deque
+from collections.abc import Callable
+from typing import Any
+
+DEFAULT_STATS_WINDOW = 100
+
+# Per lasso request timings summarized in WidgetStats.as_dict()
+SUMMARIZED_TIMINGS = ("mask_s", "apply_s", "sync_s", "total_s")
+
+StatsCallback = Callable[[dict[str, Any]], None]
+
+
+def message_sizes(msg: dict, buffers) -> dict[str, int]:
+    """
+    Bytes per trait of a widget "update" comm message: JSON size of the
+    state plus the size of the binary buffers extracted from it.
+    """
+    sizes: dict[str, int] = {}
+    for key, value in msg.get("state", {}).items():
+        sizes[key] = len(json.dumps(value, separators=(",", ":")))
+    for path, buffer in zip(msg.get("buffer_paths", []), buffers or []):
+        key = path[0]
+        sizes[key] = sizes.get(key, 0) + memoryview(buffer).nbytes
+    return sizes
+
+
+class WidgetStats:
+    """
+    Rolling window of lasso request records and running totals of the bytes
+    sent per trait.
+    """
+
+    def __init__(
+        self, window: int = DEFAULT_STATS_WINDOW, callback: StatsCallback | None = None
+    ):
+        if window <= 0:
+            raise ValueError("window should be a positive integer")
+        self.callback = callback
+        self.lasso_requests: deque[dict[str, Any]] = deque(maxlen=window)
+        self.bytes_sent: dict[str, int] = {}
+        self.messages_sent = 0
+
+    @property
+    def total_bytes_sent(self) -> int:
+        return sum(self.bytes_sent.values())
+
+    def record_message(self, msg: dict, buffers) -> None:
+        self.messages_sent += 1
+        for key, size in message_sizes(msg, buffers).items():
+            self.bytes_sent[key] = self.bytes_sent.get(key, 0) + size
+
+    def record_lasso_request(self, record: dict[str, Any]) -> None:
+        self.lasso_requests.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def as_dict(self) -> dict[str, Any]:
+        requests = list(self.lasso_requests)
+        summary = {}
+        for name in SUMMARIZED_TIMINGS:
+            values = [req[name] for req in requests if name in req]
+            if values:
+                summary[name] = {
+                    "mean": sum(values) / len(values),
+                    "max": max(values),
+                    "last": values[-1],
+                }
+        return {
+            "lasso_requests": requests,
+            "summary": summary,
+            "bytes_sent": dict(self.bytes_sent),
+            "messages_sent": self.messages_sent,
+        }
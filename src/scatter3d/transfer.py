@@ -0,0 +1,70 @@
+from collections.abc import Iterator
+from typing import Any
+
+# Buffers larger than this are sent in chunks of this size (rounded down to a
+# whole number of points), so that no single comm message blocks IOPub or
+# hits the message size limit of hosted Jupyter servers.
+DEFAULT_TRANSFER_CHUNK_BYTES = 4 * 1024 * 1024
+# Chunks sent ahead of the last one acknowledged by the frontend
+TRANSFER_WINDOW_CHUNKS = 4
+# Chunks hold whole xyz triplets (12 bytes in float32, 6 in uint16) and whole
+# codes (1, 2 or 4 bytes), so that every chunk can be drawn as soon as it
+# arrives.
+TRANSFER_CHUNK_ALIGNMENT = 12
+
+
+class ChunkedTransfer:
+    """
+    A buffer sent to the frontend as a sequence of chunks with backpressure:
+    at most `window` chunks are in flight, more are sent as the frontend
+    acknowledges the ones received.
+    """
+
+    def __init__(self, transfer_id: int, kind: str, data, chunk_bytes: int):
+        if chunk_bytes < TRANSFER_CHUNK_ALIGNMENT:
+            raise ValueError(
+                f"chunk_bytes should be at least {TRANSFER_CHUNK_ALIGNMENT}"
+            )
+        self.transfer_id = transfer_id
+        self.kind = kind
+        self.chunk_bytes = chunk_bytes - chunk_bytes % TRANSFER_CHUNK_ALIGNMENT
+        self._data: memoryview | None = memoryview(data).cast("B")
+        self.total_bytes = self._data.nbytes
+        self.num_chunks = -(-self.total_bytes // self.chunk_bytes)
+        self.num_sent = 0
+        self.num_acked = 0
+
+    @property
+    def is_complete(self) -> bool:
+        return self.num_acked >= self.num_chunks
+
+    def header(self) -> dict[str, Any]:
+        return {
+            "transfer": self.transfer_id,
+            "kind": self.kind,
+            "total_bytes": self.total_bytes,
+            "chunk_bytes": self.chunk_bytes,
+            "num_chunks": self.num_chunks,
+        }
+
+    def ack(self, num_received: int) -> None:
+        self.num_acked = max(self.num_acked, min(num_received, self.num_sent))
+        if self.is_complete:
+            # the frontend has it all, do not keep the buffer alive
+            self._data = None
+
+    def next_chunks(self, window: int = TRANSFER_WINDOW_CHUNKS) -> Iterator[dict]:
+        """The chunk messages that can be sent now, in order."""
+        while (
+            self.num_sent < self.num_chunks and self.num_sent - self.num_acked < window
+        ):
+            seq = self.num_sent
+            offset = seq * self.chunk_bytes
+            self.num_sent += 1
+            yield {
+                "transfer": self.transfer_id,
+                "kind": self.kind,
+                "seq": seq,
+                "offset": offset,
+                "data": self._data[offset : offset + self.chunk_bytes],
+            }
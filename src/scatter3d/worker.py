@@ -0,0 +1,79 @@
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class CoalescingWorker:
+    """
+    Processes submitted items on a background thread.
+
+    Items submitted while the thread is busy are queued by key: an item
+    replaces the queued one with the same key, keeping its place. The thread
+    then takes all the queued items at once and hands them to process as a
+    single batch, in submission order.
+    """
+
+    def __init__(
+        self, process: Callable[[list[Any]], None], name: str = "scatter3d-worker"
+    ):
+        self._process = process
+        self._pending: OrderedDict[Hashable, Any] = OrderedDict()
+        self._cond = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, key: Hashable, item: Any) -> None:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The worker is closed")
+            self._pending[key] = item
+            self._cond.notify_all()
+
+    @property
+    def num_pending(self) -> int:
+        """Items submitted and not processed yet, the batch in progress included."""
+        with self._cond:
+            return len(self._pending) + self._busy
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Wait until every item submitted is processed. Returns False if the
+        timeout (in seconds) expired first.
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending and not self._busy, timeout
+            )
+
+    def close(self, timeout: float | None = None) -> None:
+        """Process the items already submitted, then stop the thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if threading.current_thread() is not self._thread:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                batch = list(self._pending.values())
+                self._pending.clear()
+                self._busy = True
+            try:
+                self._process(batch)
+            except Exception:
+                # the next batches still get processed
+                logger.exception("%s failed to process a batch", self._thread.name)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
@@ -135,3 +135,248 @@ def test_color_palette():
         coded_palette = category.color_palette_for_codes
         for _label, code in category.label_coding:
             assert len(coded_palette[code]) == 3
+
+
+def test_values_cache_is_invalidated_on_changes():
+    for series in get_test_series():
+        category = Category(series["values"])
+        assert category.values.equals(series["values"])
+
+        # codes change, decoded values do not
+        category.set_label_list(category.label_list[::-1])
+        assert category.values.equals(series["values"])
+
+        new_values = numpy.full_like(category.coded_values, 1)
+        category.set_coded_values(new_values, label_list=category.label_list)
+        assert list(category.values) == [category.label_list[0]] * series["num_values"]
+
+
+def test_category_from_native_categoricals():
+    pandas_cat = pandas.Series(
+        pandas.Categorical(["b", "a", None, "b"], categories=["b", "a", "c"]),
+        name="pandas_cat",
+    )
+    polars_enum = polars.Series(
+        "polars_enum", ["b", "a", None, "b"], dtype=polars.Enum(["b", "a", "c"])
+    )
+    for values in (pandas_cat, polars_enum):
+        category = Category(values)
+        # the sorted values found, as for other columns: the declared order
+        # and the unused categories do not change the labels
+        assert category.label_list == ["a", "b"]
+        assert list(category.coded_values) == [2, 1, 0, 2]
+        assert category.values.equals(values)
+
+    polars_cat = polars.Series(
+        "polars_cat", ["b", "a", None, "b"], dtype=polars.Categorical
+    )
+    category = Category(polars_cat)
+    assert category.label_list == ["a", "b"]
+    assert list(category.coded_values) == [2, 1, 0, 2]
+    assert category.values.to_list() == ["b", "a", None, "b"]
+
+    category = Category(pandas_cat, label_list=["a", "b"])
+    assert list(category.coded_values) == [2, 1, 0, 2]
+
+
+def test_category_from_pyarrow_dictionary():
+    pyarrow = pytest.importorskip("pyarrow")
+    values = pyarrow.chunked_array(
+        [
+            pyarrow.array(["b", "a", None]).dictionary_encode(),
+            pyarrow.array(["c", "a"]).dictionary_encode(),
+        ]
+    )
+    category = Category(values)
+    assert category.label_list == ["a", "b", "c"]
+    assert list(category.coded_values) == [2, 1, 0, 3, 1]
+
+
+def test_batch_merges_notifications():
+    category = Category(get_test_series()[1]["values"])
+    received = []
+
+    def callback(category, events):
+        received.append(events)
+
+    category.subscribe_batched(callback)
+
+    category.set_label_list(["species3", "species2", "species1"])
+    assert received == [{"label_list", "palette", "coded_values"}]
+
+    received.clear()
+    with category.batch():
+        category.set_label_list(["species1", "species2", "species3"])
+        category.create_color_palette()
+        category.set_coded_values(
+            numpy.zeros_like(category.coded_values), label_list=category.label_list
+        )
+        assert received == []
+    assert received == [{"label_list", "palette", "coded_values"}]
+
+
+def test_subscribe_notifies_one_event_at_a_time():
+    category = Category(get_test_series()[1]["values"])
+    received = []
+
+    def callback(category, event):
+        received.append(event)
+
+    category.subscribe(callback)
+
+    category.set_label_list(["species3", "species2", "species1"])
+    assert received == ["label_list", "palette", "coded_values"]
+
+    received.clear()
+    with category.batch():
+        category.create_color_palette()
+        category.create_color_palette()
+    assert received == ["palette"]
+
+
+def test_appending_labels_keeps_the_coded_values():
+    category = Category(pandas.Series(["a", "b", None, "a"]))
+    coded_values = category.coded_values
+    received = []
+
+    def callback(category, events):
+        received.append(events)
+
+    category.subscribe_batched(callback)
+
+    category.set_label_list(["a", "b", "c"])
+    assert received == [{"label_list", "palette"}]
+    assert category.coded_values is coded_values
+    assert list(category.code_counts) == [1, 2, 1, 0]
+
+
+def test_set_coded_values_at_writes_in_place_and_notifies_the_change_set():
+    category = Category(pandas.Series(["a", "b", None, "a", "b"]))
+    coded_values = category.coded_values
+    received = []
+
+    def callback(category, events):
+        change = category.last_change
+        received.append((events, change.indices.tolist(), change.previous.tolist()))
+
+    category.subscribe_batched(callback)
+
+    change = category.set_coded_values_at(numpy.array([0, 1, 2]), 2)
+    # b was already b
+    numpy.testing.assert_array_equal(change.indices, [0, 2])
+    numpy.testing.assert_array_equal(change.codes, [2, 2])
+    assert category.coded_values is coded_values
+    numpy.testing.assert_array_equal(coded_values, [2, 2, 2, 1, 2])
+    assert category.values.tolist()[:3] == ["b", "b", "b"]
+    assert received == [({"coded_values"}, [0, 2], [1, 0])]
+    assert category.last_change is None
+
+    # a batch merges the change sets, with the codes before the first change
+    received.clear()
+    with category.batch():
+        category.set_coded_values_at(numpy.array([3, 0]), numpy.array([0, 1]))
+        category.set_coded_values_at(numpy.array([0, 4]), numpy.array([0, 0]))
+    assert received == [({"coded_values"}, [0, 3, 4], [2, 1, 2])]
+
+    with pytest.raises(ValueError):
+        category.set_coded_values_at(numpy.array([5]), 1)
+    with pytest.raises(ValueError):
+        category.set_coded_values_at(numpy.array([0]), 3)
+
+
+def test_counts_are_updated_by_every_change():
+    category = Category(pandas.Series(["a", "b", None, "a", "c", "b"]))
+
+    def check():
+        minlength = len(category.label_list) + 1
+        recount = numpy.bincount(category.coded_values, minlength=minlength)
+        numpy.testing.assert_array_equal(category.code_counts, recount)
+        for code, label in enumerate([None, *category.label_list]):
+            numpy.testing.assert_array_equal(
+                category.label_indices(label),
+                numpy.flatnonzero(category.coded_values == code),
+            )
+
+    check()
+    assert category.label_counts == {"a": 2, "b": 2, "c": 1}
+    assert category.label_fractions == {"a": 2 / 6, "b": 2 / 6, "c": 1 / 6}
+
+    category.set_coded_values_at(numpy.array([0, 2]), numpy.array([3, 3]))
+    check()
+    category.set_coded_values(
+        numpy.array([1, 1, 0, 2, 3, 0], dtype=category.coded_values.dtype),
+        label_list=category.label_list,
+    )
+    check()
+    category.set_label_list(
+        ["c", "a"], on_missing_labels=LabelListErrorResponse.SET_MISSING
+    )
+    assert category.code_counts.tolist() == [3, 1, 2]
+    check()
+    assert category.num_unassigned == 3
+    assert category.label_counts_at([0, 1, 4, 5]) == {"c": 1, "a": 2}
+
+    with pytest.raises(ValueError):
+        category.label_indices("b")
+    with pytest.raises(ValueError):
+        category.set_coded_values(
+            numpy.full(6, 3, dtype=category.coded_values.dtype),
+            label_list=category.label_list,
+        )
+    check()
+
+
+def test_set_coded_values_recounts_codes_edited_in_place():
+    category = Category(pandas.Series(["a", "b", "a", None]))
+    assert category.label_counts == {"a": 2, "b": 1}
+
+    codes = category.coded_values
+    codes[0] = 2
+    category.set_coded_values(codes, category.label_list, skip_copying_array=True)
+    assert category.label_counts == {"a": 1, "b": 2}
+
+    # a view of the current codes is edited in place too
+    codes[3:] = 1
+    category.set_coded_values(codes[:], category.label_list)
+    assert category.label_counts == {"a": 2, "b": 2}
+    assert category.num_unassigned == 0
+
+
+def test_values_decode_after_appending_a_label_of_another_type():
+    category = Category(pandas.Series([1, 2, 3, 1]))
+    category.set_label_list(category.label_list + ["new"])
+    assert category.values.tolist() == [1, 2, 3, 1]
+    assert category.values.dtype == numpy.int64
+
+    # the values no longer fit the int dtype
+    category.set_coded_values(
+        numpy.array([4, 1, 0, 2], dtype=category.coded_values.dtype),
+        category.label_list,
+    )
+    assert category.values.tolist() == ["new", 1, None, 2]
+
+
+def test_missing_values_decode_as_none_in_object_columns():
+    category = Category(pandas.Series([True, False, None]))
+    assert category.values.tolist() == [True, False, None]
+
+    category = Category(pandas.Series(["a", None, "b"], dtype=object))
+    assert category.values.tolist() == ["a", None, "b"]
+
+
+def test_category_from_memmap(tmp_path):
+    path = tmp_path / "values.npy"
+    numpy.save(path, numpy.array([3.0, 1.0, numpy.nan, 3.0, 2.0, 3.0]))
+    values = numpy.load(path, mmap_mode="r")
+
+    cat = Category(values)
+
+    assert cat.label_list == [1.0, 2.0, 3.0]
+    numpy.testing.assert_array_equal(cat.coded_values, [3, 1, 0, 3, 2, 3])
+    assert cat.num_unassigned == 1
+    assert cat.label_counts == {1.0: 1, 2.0: 1, 3.0: 3}
+
+    decoded = cat.values
+    assert isinstance(decoded, numpy.ma.MaskedArray)
+    numpy.testing.assert_array_equal(decoded.mask, [0, 0, 1, 0, 0, 0])
+    numpy.testing.assert_array_equal(decoded.compressed(), [3.0, 1.0, 3.0, 2.0, 3.0])
@@ -0,0 +1,51 @@
+import numpy
+
+from scatter3d.history import Edit, EditHistory
+
+
+def test_edit_swaps_codes_with_sparse_indices_and_packed_mask():
+    codes = numpy.arange(64, dtype=numpy.uint8)
+    for indices in ([3, 10, 40], numpy.arange(0, 64, 2)):
+        indices = numpy.asarray(indices)
+        edit = Edit(indices, codes[indices], num_points=codes.size)
+        new = codes.copy()
+        new[indices] = 0
+
+        undo_indices, undo_codes = edit.swap(new)
+        numpy.testing.assert_array_equal(undo_indices, indices)
+        numpy.testing.assert_array_equal(undo_codes, codes[indices])
+        # the edit now holds the codes to redo it
+        numpy.testing.assert_array_equal(edit.codes, 0)
+
+    # many changed points are kept as one bit per point
+    assert edit.nbytes == 64 // 8 + 32
+
+
+def test_history_undo_redo_and_eviction():
+    codes = numpy.zeros(1000, dtype=numpy.uint16)
+    history = EditHistory(max_bytes=20)
+    # 3 points: 3 * (4 + 2) = 18 bytes each
+    for code in (1, 2):
+        indices = numpy.array([1, 2, 3])
+        history.record(indices, codes[indices], codes.size)
+        codes[indices] = code
+    # the first edit was dropped
+    assert (history.num_undo, history.nbytes) == (1, 18)
+
+    indices, previous = history.undo(codes)
+    codes[indices] = previous
+    numpy.testing.assert_array_equal(codes[:4], [0, 1, 1, 1])
+    assert history.undo(codes) is None
+
+    indices, new = history.redo(codes)
+    codes[indices] = new
+    numpy.testing.assert_array_equal(codes[:4], [0, 2, 2, 2])
+
+    history.undo(codes)
+    # a new edit drops the ones undone
+    history.record(numpy.array([5]), codes[[5]], codes.size)
+    assert (history.num_undo, history.num_redo) == (1, 0)
+
+    # too large for the budget: nothing can be undone across it
+    history.record(numpy.arange(10), codes[:10], codes.size)
+    assert (history.num_undo, history.nbytes) == (0, 0)
@@ -0,0 +1,67 @@
+import numpy
+import pytest
+
+from scatter3d.lasso import (
+    indices_from_packed_mask,
+    points_in_polygon,
+    project_to_ndc,
+    select_point_indices_in_lasso,
+    select_points_in_lasso,
+)
+
+IDENTITY = numpy.eye(4).T.ravel().tolist()
+SQUARE = [[-0.5, -0.5], [0.5, -0.5], [0.5, 0.5], [-0.5, 0.5]]
+
+
+def test_points_in_polygon_square_and_concave():
+    points = numpy.array([[0.0, 0.0], [0.9, 0.9], [-0.4, 0.4], [0.6, 0.0]])
+    inside = points_in_polygon(points, numpy.array(SQUARE))
+    assert inside.tolist() == [True, False, True, False]
+
+    # U shape: the notch between x=-0.2 and x=0.2 above y=0 is outside
+    u_shape = numpy.array(
+        [[-1, -1], [1, -1], [1, 1], [0.2, 1], [0.2, 0], [-0.2, 0], [-0.2, 1], [-1, 1]]
+    )
+    points = numpy.array([[0.0, 0.5], [0.0, -0.5], [-0.6, 0.5], [0.6, 0.5]])
+    inside = points_in_polygon(points, u_shape)
+    assert inside.tolist() == [False, True, True, True]
+
+
+def test_project_to_ndc_perspective_division_and_clipping():
+    matrix = numpy.eye(4)
+    matrix[3] = [0, 0, 0, 2]  # w = 2 for every point
+    xyz = numpy.array([[1.0, 1.0, 1.0], [0.0, 0.0, 4.0]], dtype=numpy.float32)
+    ndc, visible = project_to_ndc(xyz, matrix)
+    numpy.testing.assert_allclose(ndc, [[0.5, 0.5], [0.0, 0.0]])
+    assert visible.tolist() == [True, False]
+
+
+def test_select_points_in_lasso_matches_per_point_loop():
+    rng = numpy.random.default_rng(42)
+    xyz = rng.uniform(-1, 1, size=(1000, 3)).astype(numpy.float32)
+    polygon = [[-0.8, -0.6], [0.7, -0.9], [0.2, 0.1], [0.9, 0.8], [-0.5, 0.6]]
+
+    mask = select_points_in_lasso(xyz, polygon, IDENTITY, chunk_size=128)
+    expected = points_in_polygon(xyz[:, :2].astype(float), numpy.array(polygon))
+    numpy.testing.assert_array_equal(mask, expected)
+    indices = select_point_indices_in_lasso(xyz, polygon, IDENTITY, chunk_size=128)
+    numpy.testing.assert_array_equal(indices, numpy.flatnonzero(expected))
+
+
+def test_select_points_in_lasso_validates_input():
+    xyz = numpy.zeros((3, 3), dtype=numpy.float32)
+    with pytest.raises(ValueError):
+        select_points_in_lasso(xyz, SQUARE[:2], IDENTITY)
+    with pytest.raises(ValueError):
+        select_points_in_lasso(xyz, SQUARE, IDENTITY[:15])
+
+
+@pytest.mark.parametrize("num_bits", [0, 5, 64, 1003])
+def test_indices_from_packed_mask_ignores_padding_bits(num_bits):
+    rng = numpy.random.default_rng(0)
+    mask = rng.random(num_bits) < 0.1
+    packed = numpy.packbits(mask, bitorder="big")
+    if num_bits % 8:
+        packed[-1] |= 0xFF >> (num_bits % 8)
+    indices = indices_from_packed_mask(packed.tobytes(), num_bits)
+    numpy.testing.assert_array_equal(indices, numpy.flatnonzero(mask))
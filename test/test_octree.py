@@ -0,0 +1,63 @@
+import numpy
+import pytest
+
+from scatter3d.octree import Octree
+
+
+def random_xyz(n: int) -> numpy.ndarray:
+    return numpy.random.default_rng(3).standard_normal((n, 3)).astype(numpy.float32)
+
+
+def test_every_point_belongs_to_exactly_one_node():
+    xyz = random_xyz(5_000)
+    octree = Octree(xyz, points_per_node=300)
+
+    assert len(octree) > 1
+    all_indices = numpy.concatenate([node.indices for node in octree.nodes])
+    numpy.testing.assert_array_equal(numpy.sort(all_indices), numpy.arange(5_000))
+    for node in octree.nodes:
+        assert node.indices.size <= 300
+        numpy.testing.assert_array_equal(node.indices, numpy.sort(node.indices))
+
+
+def test_nodes_are_inside_their_parent_cell():
+    xyz = random_xyz(5_000)
+    octree = Octree(xyz, points_per_node=300)
+
+    for node in octree.nodes:
+        points = xyz[node.indices]
+        assert numpy.all(points >= node.bbox_min - 1e-6)
+        assert numpy.all(points <= node.bbox_max + 1e-6)
+        for child_id in node.children:
+            child = octree.nodes[child_id]
+            assert child.parent == node.node_id
+            assert child.level == node.level + 1
+            assert numpy.all(child.bbox_min >= node.bbox_min)
+            assert numpy.all(child.bbox_max <= node.bbox_max)
+
+
+def test_build_is_deterministic_and_bounded_by_max_depth():
+    xyz = numpy.zeros((1_000, 3), dtype=numpy.float32)  # all in one cell
+    octree = Octree(xyz, points_per_node=10, max_depth=3)
+    assert max(node.level for node in octree.nodes) == 3
+
+    xyz = random_xyz(2_000)
+    info1 = Octree(xyz, points_per_node=100).node_info()
+    info2 = Octree(xyz, points_per_node=100).node_info()
+    assert info1 == info2
+    assert info1[0]["parent"] is None
+    assert sum(node["count"] for node in info1) == 2_000
+
+
+def test_nodes_containing():
+    octree = Octree(random_xyz(2_000), points_per_node=100)
+    leaf = octree.nodes[-1]
+    point = leaf.indices[:1]
+
+    assert octree.nodes_containing(point, range(len(octree))) == [leaf.node_id]
+    assert octree.nodes_containing(point, [0]) == []
+
+
+def test_invalid_points_per_node():
+    with pytest.raises(ValueError):
+        Octree(random_xyz(10), points_per_node=0)
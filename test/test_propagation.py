@@ -0,0 +1,40 @@
+import numpy
+import pytest
+
+from scatter3d.propagation import majority_codes, propagate_codes
+
+
+def test_majority_vote_breaks_ties_by_nearest_and_ignores_unassigned():
+    neighbor_codes = numpy.array(
+        [
+            [1, 2, 2, 1, 3],  # tie 1/2: 1 is nearer
+            [0, 3, 0, 0, 0],  # only one voter
+            [0, 0, 0, 0, 0],  # no voter
+            [2, 1, 1, 0, 0],
+        ],
+        dtype=numpy.uint8,
+    )
+    numpy.testing.assert_array_equal(majority_codes(neighbor_codes), [1, 3, 0, 1])
+
+
+def test_propagate_codes_labels_unassigned_points_from_their_neighbours():
+    # two clusters along x, a few labelled points in each
+    xyz = numpy.zeros((10, 3))
+    xyz[:5, 0] = numpy.arange(5)
+    xyz[5:, 0] = 100 + numpy.arange(5)
+    codes = numpy.zeros(10, dtype=numpy.uint16)
+    codes[[0, 1]] = 1
+    codes[[8, 9]] = 2
+
+    indices, new = propagate_codes(xyz, codes, k=2, workers=2)
+    numpy.testing.assert_array_equal(indices, [2, 3, 4, 5, 6, 7])
+    numpy.testing.assert_array_equal(new, [1, 1, 1, 2, 2, 2])
+    assert new.dtype == codes.dtype
+    # the input is left as is
+    assert numpy.count_nonzero(codes) == 4
+
+    indices, new = propagate_codes(xyz, codes, k=2, max_distance=1.5)
+    numpy.testing.assert_array_equal(indices, [2, 7])
+
+    with pytest.raises(ValueError):
+        propagate_codes(xyz, codes[:5])
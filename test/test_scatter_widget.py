@@ -2,8 +2,11 @@ import base64
 
 import numpy
 import pandas
+import pytest
+import traitlets
 
 from scatter3d.scatter3d import Scatter3dWidget, Category
+from scatter3d.selection import Selection
 
 
 def test_xyz_bytes_t_packs_float32_row_major():
@@ -20,7 +23,7 @@ def test_xyz_bytes_t_packs_float32_row_major():
 
     expected = numpy.asarray(xyz, dtype=numpy.float32, order="C").tobytes(order="C")
     assert w.xyz_bytes_t == expected
-    assert isinstance(w.xyz_bytes_t, (bytes, bytearray))
+    assert isinstance(w.xyz_bytes_t, (bytes, bytearray, memoryview))
 
     # Round-trip decode
     decoded = numpy.frombuffer(w.xyz_bytes_t, dtype=numpy.float32).reshape(-1, 3)
@@ -38,8 +41,11 @@ def test_labels_t_and_coded_values_t_are_synced_from_category():
     # labels_t should match label_list (as strings)
     assert w.labels_t == ["Italy", "Spain"]
 
-    # coded_values_t should decode to expected uint16 codes
-    decoded = numpy.frombuffer(w.coded_values_t, dtype=numpy.uint16)
+    # two labels fit in uint8 codes
+    assert w.coded_values_dtype_t == "uint8"
+
+    # coded_values_t should decode to expected codes
+    decoded = numpy.frombuffer(w.coded_values_t, dtype=w.coded_values_dtype_t)
     assert decoded.shape == (4,)
 
     # expected codes: Spain->2, Italy->1, None->0, Spain->2
@@ -58,7 +64,7 @@ def test_coded_values_t_updates_when_category_set_label_list_changes_codes():
     cat.set_label_list(["Spain", "Italy"])
 
     assert w.labels_t == ["Spain", "Italy"]
-    decoded = numpy.frombuffer(w.coded_values_t, dtype=numpy.uint16)
+    decoded = numpy.frombuffer(w.coded_values_t, dtype=w.coded_values_dtype_t)
     expected = numpy.array([1, 2, 0, 1], dtype=numpy.uint16)  # Spain->1, Italy->2
     numpy.testing.assert_array_equal(decoded, expected)
 
@@ -73,8 +79,8 @@ def pack_mask_big(indices: list[int], n: int) -> bytes:
     return packed.tobytes(order="C")
 
 
-def decode_u16(buf: bytes) -> numpy.ndarray:
-    return numpy.frombuffer(buf, dtype=numpy.uint16)
+def decode_codes(w: Scatter3dWidget, buf: bytes) -> numpy.ndarray:
+    return numpy.frombuffer(buf, dtype=w.coded_values_dtype_t)
 
 
 def test_lasso_add_with_packed_bitmask():
@@ -96,7 +102,7 @@ def test_lasso_add_with_packed_bitmask():
     }
 
     assert w.lasso_result_t["status"] == "ok"
-    decoded = decode_u16(w.coded_values_t)
+    decoded = decode_codes(w, w.coded_values_t)
     expected = numpy.array([2, 2, 2, 2], dtype=numpy.uint16)
     numpy.testing.assert_array_equal(decoded, expected)
 
@@ -120,11 +126,64 @@ def test_lasso_remove_with_packed_bitmask_only_removes_target_label():
     }
 
     assert w.lasso_result_t["status"] == "ok"
-    decoded = decode_u16(w.coded_values_t)
+    decoded = decode_codes(w, w.coded_values_t)
     expected = numpy.array([0, 1, 0, 0], dtype=numpy.uint16)
     numpy.testing.assert_array_equal(decoded, expected)
 
 
+def test_lasso_add_with_binary_mask_channel():
+    s = pandas.Series(["Spain", "Italy", None, "Spain"], name="country")
+    cat = Category(values=s, label_list=["Italy", "Spain"])  # Italy=1, Spain=2
+
+    xyz = numpy.zeros((4, 3), dtype=numpy.float32)
+    w = Scatter3dWidget(xyz=xyz, category=cat)
+
+    # stale base64 mask should be ignored when the request uses the bytes channel
+    w.lasso_mask_t = base64.b64encode(pack_mask_big([0, 1, 2, 3], n=4)).decode("ascii")
+    w.lasso_mask_bytes_t = pack_mask_big([0, 2], n=4)
+
+    w.lasso_request_t = {
+        "kind": "lasso_commit",
+        "op": "add",
+        "label": "Italy",
+        "mask_channel": "bytes",
+        "request_id": 6,
+    }
+
+    assert w.lasso_result_t["status"] == "ok"
+    assert w.lasso_result_t["num_selected"] == 2
+    decoded = decode_codes(w, w.coded_values_t)
+    expected = numpy.array([1, 1, 1, 2], dtype=numpy.uint16)
+    numpy.testing.assert_array_equal(decoded, expected)
+
+
+def test_lasso_binary_mask_channel_through_set_state():
+    s = pandas.Series(["Spain", "Italy", None, "Spain"], name="country")
+    cat = Category(values=s, label_list=["Italy", "Spain"])  # Italy=1, Spain=2
+
+    xyz = numpy.zeros((4, 3), dtype=numpy.float32)
+    w = Scatter3dWidget(xyz=xyz, category=cat)
+
+    # the comm hands binary buffers to set_state as memoryviews
+    w.set_state(
+        {
+            "lasso_mask_bytes_t": memoryview(pack_mask_big([2], n=4)),
+            "lasso_request_t": {
+                "kind": "lasso_commit",
+                "op": "add",
+                "label": "Italy",
+                "mask_channel": "bytes",
+                "request_id": 7,
+            },
+        }
+    )
+
+    assert w.lasso_result_t["status"] == "ok"
+    decoded = decode_codes(w, w.coded_values_t)
+    expected = numpy.array([2, 1, 1, 2], dtype=numpy.uint16)
+    numpy.testing.assert_array_equal(decoded, expected)
+
+
 def test_lasso_mask_too_short_errors_and_state_unchanged():
     s = pandas.Series(["Spain", "Italy", None, "Spain"], name="country")
     cat = Category(values=s, label_list=["Italy", "Spain"])
@@ -132,7 +191,7 @@ def test_lasso_mask_too_short_errors_and_state_unchanged():
     xyz = numpy.zeros((4, 3), dtype=numpy.float32)
     w = Scatter3dWidget(xyz=xyz, category=cat)
 
-    before = decode_u16(w.coded_values_t).copy()
+    before = decode_codes(w, w.coded_values_t).copy()
 
     w.lasso_mask_t = b""  # too short for N=4 (needs 1 byte)
     w.lasso_request_t = {
@@ -143,7 +202,7 @@ def test_lasso_mask_too_short_errors_and_state_unchanged():
     }
 
     assert w.lasso_result_t["status"] == "error"
-    after = decode_u16(w.coded_values_t)
+    after = decode_codes(w, w.coded_values_t)
     numpy.testing.assert_array_equal(after, before)
 
 
@@ -154,7 +213,7 @@ def test_lasso_unknown_label_errors_and_state_unchanged():
     xyz = numpy.zeros((4, 3), dtype=numpy.float32)
     w = Scatter3dWidget(xyz=xyz, category=cat)
 
-    before = decode_u16(w.coded_values_t).copy()
+    before = decode_codes(w, w.coded_values_t).copy()
 
     mask_bytes = pack_mask_big([0, 1], n=4)
     w.lasso_mask_t = base64.b64encode(mask_bytes).decode("ascii")
@@ -167,5 +226,742 @@ def test_lasso_unknown_label_errors_and_state_unchanged():
     }
 
     assert w.lasso_result_t["status"] == "error"
-    after = decode_u16(w.coded_values_t)
+    after = decode_codes(w, w.coded_values_t)
     numpy.testing.assert_array_equal(after, before)
+
+
+def test_lasso_add_with_polygon_and_view_projection():
+    s = pandas.Series(["Spain", "Italy", None, "Spain"], name="country")
+    cat = Category(values=s, label_list=["Italy", "Spain"])  # Italy=1, Spain=2
+
+    # user (x, y, z); the frontend shows user z as "up", so with an identity
+    # camera the matrix is just the y <-> z swap: NDC x is user x and NDC y is
+    # user z.
+    xyz = numpy.array(
+        [[0.0, 0.0, 0.0], [0.9, 0.0, 0.9], [0.1, 0.0, -0.2], [-0.9, 0.0, 0.0]],
+        dtype=numpy.float32,
+    )
+    w = Scatter3dWidget(xyz=xyz, category=cat)
+
+    w.lasso_request_t = {
+        "kind": "lasso_commit",
+        "op": "add",
+        "label": "Italy",
+        "request_id": 5,
+        "polygon_ndc": [[-0.5, -0.5], [0.5, -0.5], [0.5, 0.5], [-0.5, 0.5]],
+        "view_projection": numpy.eye(4)[[0, 2, 1, 3]].ravel().tolist(),
+    }
+
+    assert w.lasso_result_t["status"] == "ok"
+    assert w.lasso_result_t["num_selected"] == 2
+    decoded = decode_codes(w, w.coded_values_t)
+    expected = numpy.array([1, 1, 1, 2], dtype=numpy.uint16)
+    numpy.testing.assert_array_equal(decoded, expected)
+
+
+def test_small_lasso_edit_sends_coded_values_patch():
+    n = 100
+    s = pandas.Series(["Italy"] * (n - 1) + ["Spain"], name="country")
+    cat = Category(values=s, label_list=["Italy", "Spain"])  # Italy=1, Spain=2
+
+    xyz = numpy.zeros((n, 3), dtype=numpy.float32)
+    w = Scatter3dWidget(xyz=xyz, category=cat)
+    coded_values = cat.coded_values
+
+    w.lasso_mask_t = base64.b64encode(pack_mask_big([3, 50, 97], n=n)).decode("ascii")
+    w.lasso_request_t = {
+        "kind": "lasso_commit",
+        "op": "add",
+        "label": "Spain",
+        "request_id": 7,
+    }
+
+    assert w.lasso_result_t["status"] == "ok"
+    assert w.lasso_result_t["selected_label_counts"] == {"Italy": 3, "Spain": 0}
+    assert w.lasso_result_t["selected_unassigned"] == 0
+    patch = w.coded_values_patch_t
+    assert patch["seq"] == 1
+    indices = numpy.frombuffer(patch["indices"], dtype=numpy.uint32)
+    numpy.testing.assert_array_equal(indices, [3, 50, 97])
+    numpy.testing.assert_array_equal(decode_codes(w, patch["codes"]), [2, 2, 2])
+    # edited in place
+    assert w.category.coded_values is coded_values
+
+    # the full buffer stays current for reconnecting frontends
+    expected = numpy.ones(n, dtype=numpy.uint16)
+    expected[[3, 50, 97, 99]] = 2
+    numpy.testing.assert_array_equal(decode_codes(w, w.coded_values_t), expected)
+
+
+def test_coded_values_dtype_widens_with_the_number_of_labels():
+    s = pandas.Series([0, 1, 2, 1])
+    cat = Category(values=s)
+    w = Scatter3dWidget(xyz=numpy.zeros((4, 3), dtype=numpy.float32), category=cat)
+    assert cat.coded_values.dtype == numpy.uint8
+    assert w.coded_values_dtype_t == "uint8"
+
+    cat.set_label_list(list(range(300)))
+    assert cat.coded_values.dtype == numpy.uint16
+    assert w.coded_values_dtype_t == "uint16"
+    numpy.testing.assert_array_equal(decode_codes(w, w.coded_values_t), [1, 2, 3, 2])
+
+    cat.set_label_list(list(range(70_000)))
+    assert w.coded_values_dtype_t == "uint32"
+    numpy.testing.assert_array_equal(decode_codes(w, w.coded_values_t), [1, 2, 3, 2])
+
+
+def test_palette_change_only_syncs_colors():
+    s = pandas.Series(["Spain", "Italy", None, "Spain"], name="country")
+    cat = Category(values=s, label_list=["Italy", "Spain"])
+    w = Scatter3dWidget(xyz=numpy.zeros((4, 3), dtype=numpy.float32), category=cat)
+
+    changed = []
+    w.observe(lambda change: changed.append(change["name"]), names=traitlets.All)
+
+    cat.create_color_palette({"Italy": (0.0, 0.0, 1.0), "Spain": (1.0, 0.0, 0.0)})
+    assert changed == ["colors_t"]
+    assert w.colors_t == [[0.0, 0.0, 1.0], [1.0, 0.0, 0.0]]
+
+
+def test_appending_a_label_does_not_resend_the_codes():
+    s = pandas.Series(["Spain", "Italy", None, "Spain"], name="country")
+    cat = Category(values=s, label_list=["Italy", "Spain"])
+    w = Scatter3dWidget(xyz=numpy.zeros((4, 3), dtype=numpy.float32), category=cat)
+
+    changed = []
+    w.observe(lambda change: changed.append(change["name"]), names=traitlets.All)
+
+    cat.set_label_list(["Italy", "Spain", "France"])
+    assert "coded_values_t" not in changed
+    assert w.labels_t == ["Italy", "Spain", "France"]
+    assert len(w.colors_t) == 3
+
+
+def test_stats_record_lasso_requests():
+    s = pandas.Series(["Spain", "Italy", None, "Spain"], name="country")
+    cat = Category(values=s, label_list=["Italy", "Spain"])
+    w = Scatter3dWidget(xyz=numpy.zeros((4, 3), dtype=numpy.float32), category=cat)
+    assert w.stats is None
+
+    records = []
+    w.enable_stats(window=2, callback=records.append)
+    assert w.collect_stats_t
+
+    w.lasso_mask_bytes_t = pack_mask_big([0, 1], n=4)
+    for request_id in range(3):
+        w.lasso_request_t = {
+            "kind": "lasso_commit",
+            "op": "add",
+            "label": "Spain",
+            "mask_channel": "bytes",
+            "request_id": request_id,
+            "timings": {"set_colors_ms": 1.5},
+        }
+
+    assert len(records) == 3
+    stats = w.stats
+    assert [req["request_id"] for req in stats["lasso_requests"]] == [1, 2]
+    last = stats["lasso_requests"][-1]
+    assert last["status"] == "ok"
+    assert last["frontend_timings"] == {"set_colors_ms": 1.5}
+    for name in ("mask_s", "apply_s", "sync_s", "total_s"):
+        assert last[name] >= 0
+        assert name in stats["summary"]
+
+    w.disable_stats()
+    assert w.stats is None
+
+
+def test_stats_count_bytes_sent_per_trait():
+    s = pandas.Series(["Spain", "Italy"], name="country")
+    w = Scatter3dWidget(xyz=numpy.zeros((2, 3)), category=Category(s))
+    w.enable_stats()
+    before = w.stats
+
+    w._send(
+        {
+            "method": "update",
+            "state": {"labels_t": ["Italy", "Spain"]},
+            "buffer_paths": [["coded_values_t"]],
+        },
+        buffers=[b"\x01\x02"],
+    )
+    after = w.stats
+    assert after["bytes_sent"]["labels_t"] == 17
+    assert after["bytes_sent"]["coded_values_t"] == 2
+    assert after["messages_sent"] == before["messages_sent"] + 1
+
+
+def test_xyz_is_a_read_only_copy_and_caller_array_is_untouched():
+    xyz = numpy.arange(12, dtype=numpy.float32).reshape(4, 3)
+    original = xyz.copy()
+    cat = Category(pandas.Series([1, 1, 2, 2]))
+    w = Scatter3dWidget(xyz=xyz, category=cat)
+
+    numpy.testing.assert_array_equal(xyz, original)
+    assert not numpy.shares_memory(w.xyz, xyz)
+    numpy.testing.assert_array_equal(w.xyz, original)
+    assert not w.xyz.flags.writeable
+    # the synced buffer is the widget's array, not a copy
+    assert numpy.shares_memory(numpy.frombuffer(w.xyz_bytes_t, numpy.float32), w.xyz)
+
+
+def test_uint16_xyz_encoding_quantizes_over_the_bounding_box():
+    rng = numpy.random.default_rng(0)
+    xyz = rng.uniform(-5, 5, size=(1_000, 3))
+    xyz[:, 2] = 1.0  # a flat axis
+    cat = Category(pandas.Series(["a"] * 1_000))
+    w = Scatter3dWidget(xyz=xyz, category=cat, xyz_encoding="uint16")
+
+    assert w.xyz_encoding_t == "uint16"
+    assert len(w.xyz_bytes_t) == 1_000 * 3 * 2
+    lo, hi = numpy.array(w.xyz_bounds_t)
+    numpy.testing.assert_allclose(lo, xyz.min(axis=0).astype(numpy.float32))
+    numpy.testing.assert_allclose(hi, xyz.max(axis=0).astype(numpy.float32))
+
+    quantized = numpy.frombuffer(w.xyz_bytes_t, dtype="<u2").reshape(-1, 3)
+    dequantized = lo + quantized * (hi - lo) / 65535
+    step = (hi - lo).max() / 65535
+    numpy.testing.assert_allclose(dequantized, w.xyz, atol=step)
+    assert numpy.all(quantized[:, 2] == 0)
+    # Python keeps the full precision
+    assert w.xyz.dtype == numpy.float32
+
+    w.xyz_encoding = "float32"
+    assert w.xyz_encoding_t == "float32"
+    assert w.xyz_bounds_t == []
+    assert len(w.xyz_bytes_t) == 1_000 * 3 * 4
+
+    with pytest.raises(ValueError):
+        w.xyz_encoding = "float16"
+
+
+def test_spatial_queries_feed_the_edit_path():
+    xyz = numpy.zeros((6, 3), dtype=numpy.float32)
+    xyz[:, 0] = numpy.arange(6)
+    cat = Category(pandas.Series(["a", "a", "a", "b", "b", "b"]))
+    w = Scatter3dWidget(xyz=xyz, category=cat)
+
+    numpy.testing.assert_array_equal(
+        w.points_in_box([0.5, -1, -1], [2.5, 1, 1]), [1, 2]
+    )
+    numpy.testing.assert_array_equal(w.points_in_sphere([4, 0, 0], 1.0), [3, 4, 5])
+    assert w.points_in_sphere([4, 0, 0], 1.0, packed=True) == bytes([0b00011100])
+
+    assert w.edit_points(w.points_in_box([0.5, -1, -1], [2.5, 1, 1]), "b") == 2
+    assert (
+        w.edit_points(w.points_near([[5, 0, 0]], 0.1, packed=True), "b", "remove") == 1
+    )
+    numpy.testing.assert_array_equal(cat.coded_values, [1, 2, 2, 2, 2, 0])
+
+    # selections combine on the packed masks
+    near = Selection(w.points_in_sphere([4, 0, 0], 1.0, packed=True), w.num_points)
+    assert w.edit_points(near - Selection.from_indices([4], 6), "a") == 2
+    numpy.testing.assert_array_equal(cat.coded_values, [1, 2, 2, 1, 2, 1])
+    with pytest.raises(ValueError):
+        w.edit_points(Selection.empty(7), "a")
+    assert w.edit_points([], "a") == 0
+    numpy.testing.assert_array_equal(cat.coded_values, [1, 2, 2, 1, 2, 1])
+
+    # the index follows new coordinates
+    w.xyz = xyz[::-1].copy()
+    numpy.testing.assert_array_equal(w.points_in_sphere([4, 0, 0], 0.1), [1])
+
+    with pytest.raises(ValueError):
+        w.edit_points([1], "c")
+    with pytest.raises(ValueError):
+        w.edit_points([6], "a")
+
+
+def test_propagate_labels_is_a_single_category_update():
+    xyz = numpy.zeros((8, 3), dtype=numpy.float32)
+    xyz[:, 0] = [0, 1, 2, 3, 10, 11, 12, 13]
+    cat = Category(pandas.Series(["a", None, None, None, "b", None, None, None]))
+    w = Scatter3dWidget(xyz=xyz, category=cat)
+    seq = w.coded_values_patch_t.get("seq", 0)
+    notifications = []
+
+    # callbacks are held weakly, keep a reference
+    def on_change(category, events):
+        notifications.append(events)
+
+    cat.subscribe_batched(on_change)
+
+    assert w.propagate_labels(k=1) == 6
+
+    numpy.testing.assert_array_equal(cat.coded_values, [1, 1, 1, 1, 2, 2, 2, 2])
+    assert len(notifications) == 1
+    # most points changed: a full resync rather than a patch
+    assert w.coded_values_patch_t.get("seq", 0) == seq
+    numpy.testing.assert_array_equal(
+        decode_codes(w, w.coded_values_t), [1, 1, 1, 1, 2, 2, 2, 2]
+    )
+    assert w.propagate_labels() == 0
+
+
+def test_patches_keep_coded_values_t_current_without_repacking():
+    cat = Category(pandas.Series(["a"] * 8 + ["b"] * 8))
+    w = Scatter3dWidget(xyz=numpy.zeros((16, 3), dtype=numpy.float32), category=cat)
+    changed = []
+    w.observe(lambda change: changed.append(change["new"]), names="coded_values_t")
+
+    # a patch: coded_values_t views the codes edited in place
+    w.edit_points([0], "b")
+    assert changed == []
+    numpy.testing.assert_array_equal(
+        decode_codes(w, w.coded_values_t), cat.coded_values
+    )
+
+    # a large in place edit is resent in full, although the view compares equal
+    w.edit_points(range(8), "b")
+    assert len(changed) == 2 and bytes(changed[-1]) == bytes(w.coded_values_t)
+    numpy.testing.assert_array_equal(decode_codes(w, w.coded_values_t), [2] * 16)
+
+    # with a preview, the copy sent is patched at the preview positions
+    w = Scatter3dWidget(
+        xyz=numpy.zeros((16, 3), dtype=numpy.float32),
+        category=cat,
+        max_preview_points=8,
+    )
+    sent = w.coded_values_t
+    w.edit_points([2, 3], "a")
+    assert w.coded_values_t is sent
+    numpy.testing.assert_array_equal(
+        decode_codes(w, w.coded_values_t), cat.coded_values[::2]
+    )
+
+
+def test_undo_redo_lasso_edits_as_patches():
+    n = 100
+    cat = Category(pandas.Series(["a"] * (n - 1) + ["b"]))
+    w = Scatter3dWidget(xyz=numpy.zeros((n, 3), dtype=numpy.float32), category=cat)
+    assert w.history_t == {"num_undo": 0, "num_redo": 0}
+    assert not w.can_undo
+
+    w.edit_points([3, 50], "b")
+    w.edit_points([50, 60], "a")
+    assert w.history_t == {"num_undo": 2, "num_redo": 0}
+
+    assert w.undo() == 1
+    numpy.testing.assert_array_equal(
+        numpy.flatnonzero(cat.coded_values == 2), [3, 50, 99]
+    )
+    patch = w.coded_values_patch_t
+    numpy.testing.assert_array_equal(
+        numpy.frombuffer(patch["indices"], dtype=numpy.uint32), [50]
+    )
+    numpy.testing.assert_array_equal(decode_codes(w, patch["codes"]), [2])
+
+    # from the toolbar buttons
+    w.history_request_t = {"request_id": 1, "action": "undo"}
+    numpy.testing.assert_array_equal(numpy.flatnonzero(cat.coded_values == 2), [99])
+    assert w.history_t == {"num_undo": 0, "num_redo": 2}
+    assert w.undo() == 0
+
+    w.history_request_t = {"request_id": 2, "action": "redo"}
+    assert w.redo() == 1
+    numpy.testing.assert_array_equal(numpy.flatnonzero(cat.coded_values == 2), [3, 99])
+    assert w.history_t == {"num_undo": 2, "num_redo": 0}
+
+
+def test_history_is_cleared_by_changes_made_outside_the_widget():
+    cat = Category(pandas.Series(["a", "b", "a"]))
+    w = Scatter3dWidget(xyz=numpy.zeros((3, 3), dtype=numpy.float32), category=cat)
+    w.edit_points([0], "b")
+    assert w.can_undo
+
+    cat.set_label_list(["b", "a", "c"])
+    assert not w.can_undo
+    assert w.history_t == {"num_undo": 0, "num_redo": 0}
+    assert w.undo() == 0
+
+    w.history_max_bytes = 0
+    w.edit_points([0], "c")
+    assert not w.can_undo
+
+
+def test_async_lasso_requests_report_pending_then_results_in_order():
+    n = 16
+    cat = Category(pandas.Series(["a"] * (n - 1) + ["b"]))
+    w = Scatter3dWidget(
+        xyz=numpy.zeros((n, 3), dtype=numpy.float32), category=cat, lasso_async=True
+    )
+    results = []
+    w.observe(lambda change: results.append(change["new"]), "lasso_result_t")
+
+    for request_id, points in enumerate(([0, 1], [1, 2], [3]), start=1):
+        # the next lasso overwrites the mask before the worker reads it
+        w.lasso_mask_bytes_t = pack_mask_big(points, n=n)
+        w.lasso_request_t = {
+            "kind": "lasso_commit",
+            "op": "add",
+            "label": "b",
+            "request_id": request_id,
+            "mask_channel": "bytes",
+        }
+    assert w.wait_lasso_requests(timeout=5)
+
+    pending = [r["request_id"] for r in results if r["status"] == "pending"]
+    done = [(r["request_id"], r["num_changed"]) for r in results if r["status"] == "ok"]
+    assert pending == [1, 2, 3]
+    assert done == [(1, 2), (2, 1), (3, 1)]
+    numpy.testing.assert_array_equal(
+        numpy.flatnonzero(cat.coded_values == 2), [0, 1, 2, 3, 15]
+    )
+    numpy.testing.assert_array_equal(
+        numpy.flatnonzero(decode_codes(w, w.coded_values_t) == 2), [0, 1, 2, 3, 15]
+    )
+
+    w.lasso_async = False
+    w.lasso_request_t = {
+        "kind": "lasso_commit",
+        "op": "add",
+        "label": "c",
+        "request_id": 4,
+    }
+    assert w.lasso_result_t["status"] == "error"
+    w.close()
+
+
+def test_lasso_commit_is_sent_in_a_single_message():
+    n = 16
+    cat = Category(pandas.Series(["a"] * (n - 1) + ["b"]))
+    w = Scatter3dWidget(xyz=numpy.zeros((n, 3), dtype=numpy.float32), category=cat)
+    dummy_comm = w.comm
+    comm = w.comm = RecordingComm()
+
+    w.set_state(
+        {
+            "lasso_mask_bytes_t": memoryview(pack_mask_big([0, 1], n=n)),
+            "lasso_request_t": {
+                "kind": "lasso_commit",
+                "op": "add",
+                "label": "b",
+                "request_id": 1,
+                "mask_channel": "bytes",
+            },
+        }
+    )
+
+    # the frontend is only echoed the request
+    [data] = [data for data, _ in comm.messages if data["method"] == "update"]
+    assert {"coded_values_patch_t", "history_t", "lasso_result_t"} <= set(data["state"])
+    assert data["state"]["lasso_result_t"]["status"] == "ok"
+    w.comm = dummy_comm
+
+
+def test_async_lasso_stats_include_the_batch_sync():
+    n = 16
+    cat = Category(pandas.Series(["a"] * (n - 1) + ["b"]))
+    w = Scatter3dWidget(
+        xyz=numpy.zeros((n, 3), dtype=numpy.float32), category=cat, lasso_async=True
+    )
+    dummy_comm = w.comm
+    w.comm = RecordingComm()
+    records = []
+    w.enable_stats(callback=records.append)
+
+    w.lasso_mask_bytes_t = pack_mask_big([0, 1], n=n)
+    w.lasso_request_t = {
+        "kind": "lasso_commit",
+        "op": "add",
+        "label": "b",
+        "request_id": 1,
+        "mask_channel": "bytes",
+    }
+    assert w.wait_lasso_requests(timeout=5)
+
+    # the patch is sent when the batch of requests exits
+    assert [record["request_id"] for record in records] == [1]
+    assert records[0]["sync_s"] > 0
+    assert records[0]["bytes_sent"] > 0
+    w.comm = dummy_comm
+    w.close()
+
+
+def test_memmap_xyz_sends_a_decimated_preview(tmp_path):
+    n = 10
+    path = tmp_path / "xyz.npy"
+    xyz = numpy.zeros((n, 3), dtype=numpy.float32)
+    xyz[:, 0] = numpy.arange(n)
+    numpy.save(path, xyz)
+    xyz_mm = numpy.load(path, mmap_mode="r")
+    cat = Category(pandas.Series(["a"] * n))
+
+    w = Scatter3dWidget(xyz=xyz_mm, category=cat, max_preview_points=4)
+
+    # the memmap is kept as is, every third point is sent
+    assert isinstance(w.xyz, numpy.memmap)
+    assert numpy.shares_memory(w.xyz, xyz_mm)
+    numpy.testing.assert_array_equal(w.preview_indices, [0, 3, 6, 9])
+    sent = numpy.frombuffer(w.xyz_bytes_t, dtype=numpy.float32).reshape(-1, 3)
+    numpy.testing.assert_array_equal(sent[:, 0], [0, 3, 6, 9])
+    assert len(decode_codes(w, w.coded_values_t)) == 4
+
+    # the frontend mask covers the preview points only
+    w.category.set_label_list(["a", "b"], color_palette=None)
+    w.lasso_mask_bytes_t = pack_mask_big([1, 2], n=4)
+    w.lasso_request_t = {
+        "kind": "lasso_commit",
+        "op": "add",
+        "label": "b",
+        "request_id": 1,
+        "mask_channel": "bytes",
+    }
+    assert w.lasso_result_t["num_changed"] == 2
+    numpy.testing.assert_array_equal(numpy.flatnonzero(cat.coded_values == 2), [3, 6])
+    patch = w.coded_values_patch_t
+    numpy.testing.assert_array_equal(
+        numpy.frombuffer(patch["indices"], dtype=numpy.uint32), [1, 2]
+    )
+
+    # a Python lasso selects among all the points
+    w.lasso_request_t = {
+        "kind": "lasso_commit",
+        "op": "add",
+        "label": "b",
+        "request_id": 2,
+        "polygon_ndc": [[0.5, -1], [4.5, -1], [4.5, 1], [0.5, 1]],
+        "view_projection": numpy.eye(4).ravel().tolist(),
+    }
+    assert w.lasso_result_t["num_selected"] == 4
+    numpy.testing.assert_array_equal(
+        numpy.flatnonzero(cat.coded_values == 2), [1, 2, 3, 4, 6]
+    )
+    # no changed point is in the preview, no patch is sent
+    assert w.coded_values_patch_t["seq"] == 1
+    numpy.testing.assert_array_equal(decode_codes(w, w.coded_values_t), [1, 2, 2, 1])
+
+
+def test_lod_streams_octree_nodes_and_patches_shown_nodes():
+    n = 2_000
+    xyz = numpy.random.default_rng(0).standard_normal((n, 3)).astype(numpy.float32)
+    cat = Category(pandas.Series(["a"] * (n - 1) + ["b"]))
+    w = Scatter3dWidget(xyz=xyz, category=cat)
+
+    assert w.lasso_selection == "frontend"
+
+    sent = []
+    w.observe(lambda change: sent.append(change["new"]), names="lod_node_data_t")
+    w.enable_lod(points_per_node=200)
+
+    # the points are not sent at once, the root node is
+    assert w.lod_enabled
+    assert w.lasso_selection == "python"
+    assert bytes(w.xyz_bytes_t) == b""
+    assert len(w.lod_nodes_t) > 1
+    assert [data["node"] for data in sent] == [0]
+    root_xyz = numpy.frombuffer(sent[0]["xyz"], dtype=numpy.float32).reshape(-1, 3)
+    assert root_xyz.shape == (200, 3)
+    root_indices = w._octree.root.indices
+    numpy.testing.assert_array_equal(root_xyz, xyz[root_indices])
+
+    with pytest.raises(ValueError):
+        w.lasso_selection = "frontend"
+
+    # the frontend requests the nodes for its view
+    child_id = w.lod_nodes_t[0]["id"] + 1
+    w.lod_request_t = {"seq": 1, "nodes": [child_id], "loaded": [0]}
+    assert [data["node"] for data in sent] == [0, child_id]
+
+    # an edit only resends the codes of the shown nodes it touches
+    sent.clear()
+    mask = numpy.zeros(n, dtype=bool)
+    mask[root_indices[:3]] = True
+    w._apply_lasso_mask_edit(op="add", code=2, mask=mask)
+    assert [data["node"] for data in sent] == [0]
+    assert "xyz" not in sent[0]
+    codes = numpy.frombuffer(sent[0]["codes"], dtype=numpy.uint8)
+    numpy.testing.assert_array_equal(codes, cat.coded_values[root_indices])
+
+    w.disable_lod()
+    assert w.lod_nodes_t == []
+    assert w.lasso_selection == "frontend"
+    assert len(w.xyz_bytes_t) == n * 12
+    numpy.testing.assert_array_equal(
+        decode_codes(w, w.coded_values_t), cat.coded_values
+    )
+
+
+def test_large_buffers_are_sent_in_acknowledged_chunks():
+    n = 100
+    xyz = numpy.arange(n * 3, dtype=numpy.float32).reshape(n, 3)
+    cat = Category(pandas.Series(["a"] * (n - 1) + ["b"]))
+    chunks = []
+    w = Scatter3dWidget(xyz=xyz, category=cat, transfer_chunk_bytes=120)
+    w.observe(lambda change: chunks.append(change["new"]), names="transfer_chunk_t")
+
+    # 1200 bytes of xyz in 10 chunks of 10 points; the 100 codes fit at once
+    assert bytes(w.xyz_bytes_t) == b""
+    header = w.transfer_t["xyz"]
+    assert header["num_chunks"] == 10
+    assert "codes" not in w.transfer_t
+    assert len(w.coded_values_t) == n
+
+    # the first window was sent during __init__, more follow the acks
+    transfer = w._transfers["xyz"]
+    assert transfer.num_sent == 4
+    received = 4
+    while received < header["num_chunks"]:
+        w.transfer_ack_t = {
+            "transfer": header["transfer"],
+            "kind": "xyz",
+            "received": received,
+        }
+        received = transfer.num_sent
+    w.transfer_ack_t = {"transfer": header["transfer"], "kind": "xyz", "received": 10}
+    assert transfer.is_complete
+    assert [chunk["seq"] for chunk in chunks] == list(range(4, 10))
+    assert bytes(chunks[-1]["data"]) == xyz[90:].tobytes()
+
+    # a frontend that missed the chunks gets a new transfer
+    w.transfer_ack_t = {"kind": "xyz", "restart": True}
+    assert w.transfer_t["xyz"]["transfer"] != header["transfer"]
+    assert chunks[-1]["seq"] == 3
+
+
+class RecordingComm:
+    """Stands for the widget's comm, keeps the messages sent."""
+
+    kernel = object()
+    comm_id = "recording"
+
+    def __init__(self):
+        self.messages = []
+
+    def send(self, data=None, buffers=None):
+        self.messages.append((data, buffers))
+
+    def on_msg(self, callback):
+        pass
+
+    def close(self, *args, **kwargs):
+        pass
+
+
+def test_large_buffers_are_in_the_widget_state_by_default():
+    n = 400_000  # 4.8 MB of xyz
+    cat = Category(numpy.zeros(n))
+    w = Scatter3dWidget(xyz=numpy.zeros((n, 3), dtype=numpy.float32), category=cat)
+
+    assert w.transfer_t == {}
+    assert len(w.xyz_bytes_t) == n * 12
+    assert len(w.coded_values_t) == n
+
+
+def test_chunks_started_inside_hold_sync_are_all_sent():
+    n = 100
+    xyz = numpy.arange(n * 3, dtype=numpy.float32).reshape(n, 3)
+    cat = Category(pandas.Series(["a"] * n))
+    w = Scatter3dWidget(xyz=xyz, category=cat, transfer_chunk_bytes=120)
+    dummy_comm = w.comm
+    comm = w.comm = RecordingComm()
+
+    with w.hold_sync():
+        w.xyz = xyz[::-1].copy()
+        assert comm.messages == []
+
+    # the new transfer header first, then one message per chunk of the window
+    states = [data["state"] for data, _ in comm.messages]
+    assert "transfer_t" in states[0]
+    chunks = [state["transfer_chunk_t"] for state in states[1:]]
+    assert [chunk["seq"] for chunk in chunks] == [0, 1, 2, 3]
+    assert all(chunk["transfer"] == w.transfer_t["xyz"]["transfer"] for chunk in chunks)
+    w.comm = dummy_comm
+
+
+def test_codes_transfer_in_progress_is_resent_instead_of_patched():
+    n = 100
+    cat = Category(pandas.Series(["a"] * (n - 1) + ["b"]))
+    w = Scatter3dWidget(
+        xyz=numpy.zeros((n, 3), dtype=numpy.float32),
+        category=cat,
+        transfer_chunk_bytes=24,
+    )
+    first = w.transfer_t["codes"]["transfer"]
+
+    mask = numpy.zeros(n, dtype=bool)
+    mask[:2] = True
+    w._apply_lasso_mask_edit(op="add", code=2, mask=mask)
+
+    assert w.coded_values_patch_t == {}
+    assert w.transfer_t["codes"]["transfer"] != first
+
+
+def test_visible_hides_points_and_lasso_never_selects_them():
+    s = pandas.Series(["Spain", "Italy", None, None, "Spain"], name="country")
+    cat = Category(values=s, label_list=["Italy", "Spain"])
+    w = Scatter3dWidget(xyz=numpy.zeros((5, 3), dtype=numpy.float32), category=cat)
+    xyz_bytes = w.xyz_bytes_t
+    assert w.visible is None
+    assert w.visible_t == b""
+
+    changed = []
+    w.observe(lambda change: changed.append(change["name"]), names=traitlets.All)
+    w.show_labels([None, "Italy"])
+    assert changed == ["visible_t"]
+    assert w.xyz_bytes_t is xyz_bytes
+    assert w.visible_t == pack_mask_big([1, 2, 3], n=5)
+    assert w.visible == Selection.from_indices([1, 2, 3], 5)
+
+    # the lasso covers every point, only the shown ones are selected
+    w.lasso_mask_bytes_t = pack_mask_big(range(5), n=5)
+    w.lasso_request_t = {
+        "kind": "lasso_commit",
+        "op": "add",
+        "label": "Spain",
+        "mask_channel": "bytes",
+        "request_id": 1,
+    }
+    assert w.lasso_result_t["num_selected"] == 3
+    numpy.testing.assert_array_equal(cat.coded_values, [2, 2, 2, 2, 2])
+
+    w.visible = numpy.array([True, False, True, True, True])
+    assert w.visible_t == pack_mask_big([0, 2, 3, 4], n=5)
+    w.show_all()
+    assert w.visible is None
+    assert w.visible_t == b""
+
+    # nothing shown, nothing selected
+    w.visible = []
+    assert w.visible == Selection.empty(5)
+    assert w.visible_t == b"\x00"
+    w.lasso_request_t = {
+        "kind": "lasso_commit",
+        "op": "remove",
+        "label": "Spain",
+        "mask_channel": "bytes",
+        "request_id": 2,
+    }
+    assert w.lasso_result_t["num_selected"] == 0
+    numpy.testing.assert_array_equal(cat.coded_values, [2, 2, 2, 2, 2])
+
+    with pytest.raises(ValueError):
+        w.show_labels(["France"])
+
+
+def test_visible_covers_the_preview_and_lod_nodes():
+    n = 2_000
+    xyz = numpy.random.default_rng(0).standard_normal((n, 3)).astype(numpy.float32)
+    cat = Category(pandas.Series(["a", "b"] * (n // 2)))
+    w = Scatter3dWidget(xyz=xyz, category=cat, max_preview_points=n // 4)
+    w.show_labels(["a"])
+    # every 4th point is in the preview, all are "a"
+    assert w.visible_t == pack_mask_big(range(n // 4), n=n // 4)
+
+    sent = []
+    w.observe(lambda change: sent.append(change["new"]), names="lod_node_data_t")
+    w.enable_lod(points_per_node=200)
+    assert w.visible_t == b""
+    root_indices = w._octree.root.indices
+    visible = numpy.unpackbits(
+        numpy.frombuffer(sent[0]["visible"], dtype=numpy.uint8),
+        count=root_indices.size,
+    )
+    numpy.testing.assert_array_equal(visible, cat.coded_values[root_indices] == 1)
+
+    # showing all the points resends the codes of the shown nodes, no mask
+    sent.clear()
+    w.show_all()
+    assert [data["node"] for data in sent] == [0]
+    assert "visible" not in sent[0] and "xyz" not in sent[0]
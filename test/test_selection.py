@@ -0,0 +1,51 @@
+import numpy
+import pytest
+
+from scatter3d.selection import Selection
+
+
+def test_selection_round_trips_and_matches_the_frontend_layout():
+    n = 13
+    selection = Selection.from_indices([12, 0, 9, 9], n)
+    # bitorder "big": point 0 is the high bit of the first byte
+    assert selection.tobytes() == bytes([0b10000000, 0b01001000])
+    numpy.testing.assert_array_equal(selection.to_indices(), [0, 9, 12])
+    assert Selection.from_indices(numpy.array([0, 9, 12]), n) == selection
+    assert Selection.from_mask(selection.to_mask()) == selection
+    assert len(selection) == 3
+    assert 9 in selection and 8 not in selection and 13 not in selection
+    numpy.testing.assert_array_equal(
+        selection.contains([9, 8, 0, 12]), [True, False, True, True]
+    )
+
+    # padding bits past the last point are ignored
+    assert Selection(b"\x80\x4f", n) == selection
+    with pytest.raises(ValueError):
+        Selection(b"\x80", n)
+    with pytest.raises(ValueError):
+        Selection.from_indices([13], n)
+
+    empty = Selection.from_indices([], n)
+    assert len(empty) == 0 and empty == Selection.empty(n)
+
+
+def test_set_algebra_on_the_packed_bytes():
+    n = 1001
+    rng = numpy.random.default_rng(0)
+    a_mask = rng.random(n) < 0.3
+    b_mask = rng.random(n) < 0.3
+    a = Selection.from_mask(a_mask)
+    b = Selection.from_mask(b_mask)
+
+    for result, expected in [
+        (a | b, a_mask | b_mask),
+        (a & b, a_mask & b_mask),
+        (a - b, a_mask & ~b_mask),
+        (a ^ b, a_mask ^ b_mask),
+        (~a, ~a_mask),
+    ]:
+        numpy.testing.assert_array_equal(result.to_mask(), expected)
+        assert len(result) == expected.sum()
+
+    with pytest.raises(ValueError):
+        a | Selection.empty(n + 1)
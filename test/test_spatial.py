@@ -0,0 +1,80 @@
+import numpy
+import pytest
+
+from scatter3d.spatial import GridIndex
+
+
+def random_xyz(n: int) -> numpy.ndarray:
+    return numpy.random.default_rng(5).standard_normal((n, 3)).astype(numpy.float32)
+
+
+def test_box_query_matches_brute_force():
+    xyz = random_xyz(5_000)
+    index = GridIndex(xyz, points_per_cell=16)
+
+    for lo, hi in [
+        ([-0.5, -0.5, -0.5], [0.5, 1.0, 0.2]),
+        ([-10, -10, -10], [10, 10, 10]),
+        ([3, 3, 3], [4, 4, 4]),
+        ([1, 1, 1], [0, 0, 0]),  # empty box
+    ]:
+        expected = numpy.flatnonzero(numpy.all((xyz >= lo) & (xyz <= hi), axis=1))
+        numpy.testing.assert_array_equal(index.query_box(lo, hi), expected)
+
+
+def test_sphere_and_radius_queries_match_brute_force():
+    xyz = random_xyz(5_000)
+    index = GridIndex(xyz)
+    xyz64 = xyz.astype(numpy.float64)
+
+    center = numpy.array([0.2, -0.1, 0.3])
+    expected = numpy.flatnonzero(numpy.linalg.norm(xyz64 - center, axis=1) <= 0.7)
+    numpy.testing.assert_array_equal(index.query_sphere(center, 0.7), expected)
+
+    centers = numpy.array([[1.0, 1.0, 1.0], [-1.0, 0.0, 0.5]])
+    dist = numpy.linalg.norm(xyz64[:, None, :] - centers[None], axis=2)
+    expected = numpy.flatnonzero(numpy.any(dist <= 0.5, axis=1))
+    numpy.testing.assert_array_equal(index.query_radius(centers, 0.5), expected)
+
+    with pytest.raises(ValueError):
+        index.query_sphere(center, -1)
+
+
+def test_flat_and_empty_clouds():
+    xyz = numpy.zeros((100, 3))
+    xyz[:, 0] = numpy.linspace(0, 1, 100)  # points on a line
+    index = GridIndex(xyz)
+    numpy.testing.assert_array_equal(
+        index.query_box([0.5, -1, -1], [1, 1, 1]), numpy.arange(50, 100)
+    )
+
+    index = GridIndex(numpy.empty((0, 3)))
+    assert index.query_sphere([0, 0, 0], 1).size == 0
+
+    with pytest.raises(ValueError):
+        GridIndex(numpy.array([[0.0, numpy.nan, 0.0]]))
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_knn_query_matches_brute_force(workers):
+    xyz = random_xyz(3_000)
+    subset = numpy.flatnonzero(numpy.arange(3_000) % 3 == 0)
+    index = GridIndex(xyz, subset=subset)
+    # queries inside and outside the indexed points' bounding box
+    queries = numpy.random.default_rng(1).uniform(-5, 5, size=(200, 3))
+
+    indices, distances = index.query_knn(queries, 4, workers=workers)
+
+    dist = numpy.linalg.norm(
+        queries[:, None, :] - xyz[subset].astype(numpy.float64)[None], axis=2
+    )
+    expected = subset[numpy.argsort(dist, axis=1, kind="stable")[:, :4]]
+    numpy.testing.assert_array_equal(indices, expected)
+    numpy.testing.assert_allclose(distances, numpy.sort(dist, axis=1)[:, :4])
+
+
+def test_knn_query_with_fewer_points_than_k():
+    index = GridIndex(random_xyz(2))
+    indices, distances = index.query_knn([[0, 0, 0]], 3)
+    assert sorted(indices[0, :2]) == [0, 1]
+    assert indices[0, 2] == -1 and distances[0, 2] == numpy.inf
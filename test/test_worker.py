@@ -0,0 +1,48 @@
+import threading
+
+from scatter3d.worker import CoalescingWorker
+
+
+def test_queued_items_are_coalesced_by_key_in_submission_order():
+    batches = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def process(batch):
+        started.set()
+        release.wait(5)
+        batches.append(batch)
+
+    worker = CoalescingWorker(process)
+    worker.submit(1, "a")
+    # the first batch is held in process, these queue behind it
+    assert started.wait(5)
+    worker.submit(2, "b")
+    worker.submit(3, "c")
+    worker.submit(2, "b2")
+    assert worker.num_pending == 3
+    assert not worker.wait(timeout=0.01)
+
+    release.set()
+    assert worker.wait(timeout=5)
+    assert batches == [["a"], ["b2", "c"]]
+    worker.close()
+
+
+def test_a_failing_batch_does_not_stop_the_worker(caplog):
+    done = []
+
+    def process(batch):
+        if batch == ["bad"]:
+            raise ValueError("bad item")
+        done.extend(batch)
+
+    worker = CoalescingWorker(process)
+    worker.submit(1, "bad")
+    worker.wait(timeout=5)
+    worker.submit(2, "good")
+    worker.close(timeout=5)
+    assert done == ["good"]
+    # logged with its traceback
+    [record] = caplog.records
+    assert record.exc_info[1].args == ("bad item",)